@@ -0,0 +1,69 @@
+import collections
+import random
+
+from ton import tags
+
+# Each corpus function takes a scale and a random.Random, and returns the document along with the
+# keyword arguments TON serializers should use for it. Documents use only types every compared
+# codec supports where possible: plain dicts rather than OrderedDicts, for marshal, and bytes only
+# in the binary blobs corpus, which json skips.
+
+def int_list(scale, rng):
+    return [rng.randint(-2 ** 31, 2 ** 31 - 1) for _ in range(100000 * scale)], {}
+
+def wide_dictionary(scale, rng):
+    return {'key{}'.format(i): rng.randint(0, 1000) for i in range(50000 * scale)}, {}
+
+def deep_nesting(scale, rng):
+    # The serializers recurse per level, so chains are kept well inside the recursion limit
+    chains = []
+
+    for i in range(200 * scale):
+        chain = i
+
+        for _ in range(100):
+            chain = {'child': [chain]}
+
+        chains.append(chain)
+
+    return chains, {}
+
+def _text(length, rng):
+    alphabet = 'abcdefghijklmnopqrstuvwxyz é世界\U0001f600'
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+def _make_strings_corpus(string_tag):
+    def strings(scale, rng):
+        return [_text(10000, rng) for _ in range(20 * scale)], {'preferred_string_tag': string_tag}
+
+    return strings
+
+def binary_blobs(scale, rng):
+    return [bytes(rng.getrandbits(8) for _ in range(50000)) for _ in range(10 * scale)], {}
+
+def records(scale, rng):
+    return [
+        {
+            'id': i,
+            'name': 'user{}'.format(i),
+            'active': rng.random() < 0.5,
+            'score': rng.randint(0, 100),
+            'parent': None,
+            'tags': ['alpha', 'beta'],
+        }
+        for i in range(20000 * scale)
+    ], {}
+
+CORPORA = collections.OrderedDict([
+    ('int_list', int_list),
+    ('wide_dictionary', wide_dictionary),
+    ('deep_nesting', deep_nesting),
+    ('utf8_strings', _make_strings_corpus(tags.UTF8)),
+    ('utf16_strings', _make_strings_corpus(tags.UTF16)),
+    ('utf32_strings', _make_strings_corpus(tags.UTF32)),
+    ('binary_blobs', binary_blobs),
+    ('records', records),
+])
+
+def generate(name, scale, seed = 0):
+    return CORPORA[name](scale, random.Random(seed))
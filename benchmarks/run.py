@@ -0,0 +1,225 @@
+# Benchmarks serialization and deserialization over the corpora in benchmarks/corpora.py, for TON
+# and for the standard library's json, pickle and marshal on the same documents. Run from the
+# repository root:
+#
+#     python -m benchmarks.run --output report.json
+#     python -m benchmarks.run --baseline report.json
+#
+# With --baseline, the run exits with status 1 if any TON timing or peak memory is worse than the
+# baseline's by more than --tolerance, or missing from the run. Timings only compare meaningfully
+# on the same machine.
+
+import argparse
+import collections
+import json
+import marshal
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+
+from ton import binary, string, tags
+
+from benchmarks import corpora
+
+Codec = collections.namedtuple('Codec', ['serialize', 'deserialize'])
+
+CODECS = collections.OrderedDict([
+    ('ton.binary', Codec(lambda o, kwargs: binary.serialize(o, **kwargs), binary.deserialize)),
+    ('ton.key_table', Codec(
+        lambda o, kwargs: binary.serialize(o, key_table = True, **kwargs),
+        binary.deserialize,
+    )),
+    ('ton.compact', Codec(
+        lambda o, kwargs: binary.serialize(o, compact = True, **kwargs),
+        binary.deserialize,
+    )),
+    ('ton.string', Codec(lambda o, kwargs: string.serialize(o, **kwargs), string.deserialize)),
+    ('tags.autotag', Codec(lambda o, kwargs: tags.autotag(o, **kwargs), None)),
+    ('json', Codec(lambda o, kwargs: json.dumps(o), json.loads)),
+    ('pickle', Codec(lambda o, kwargs: pickle.dumps(o, pickle.HIGHEST_PROTOCOL), pickle.loads)),
+    ('marshal', Codec(lambda o, kwargs: marshal.dumps(o), marshal.loads)),
+])
+
+# The corpora each codec has no representation for, which are left out of its results. Any other
+# error is raised, so that a codec which starts failing can't drop out of the report.
+CODECS_TO_UNSUPPORTED_CORPORA = {
+    # json has no representation for bytes
+    'json': ['binary_blobs'],
+}
+
+# Regressions are only checked for the codecs under test, not those they are compared against
+CHECKED_CODECS = ['ton.binary', 'ton.key_table', 'ton.compact', 'ton.string', 'tags.autotag']
+
+# Differences smaller than these are noise however they compare to the tolerance
+CHECKED_METRICS_TO_SLACKS = collections.OrderedDict([
+    ('serialize_seconds', 0.005),
+    ('deserialize_seconds', 0.005),
+    ('serialize_peak_bytes', 64 * 1024),
+    ('deserialize_peak_bytes', 64 * 1024),
+])
+
+def _best_time(function, repeat):
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+def _peak_bytes(function):
+    tracemalloc.start()
+
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _measure(codec, document, kwargs, repeat):
+    serialized = codec.serialize(document, kwargs)
+    result = collections.OrderedDict([
+        ('serialize_seconds', _best_time(lambda: codec.serialize(document, kwargs), repeat)),
+        ('serialize_peak_bytes', _peak_bytes(lambda: codec.serialize(document, kwargs))),
+    ])
+
+    if codec.deserialize is not None:
+        result['size_bytes'] = len(serialized)
+        result['deserialize_seconds'] = _best_time(lambda: codec.deserialize(serialized), repeat)
+        result['deserialize_peak_bytes'] = _peak_bytes(lambda: codec.deserialize(serialized))
+
+    return result
+
+def run(corpus_names, codec_names, scale, repeat):
+    results = collections.OrderedDict()
+
+    for corpus_name in corpus_names:
+        document, kwargs = corpora.generate(corpus_name, scale)
+        results[corpus_name] = collections.OrderedDict()
+
+        for codec_name in codec_names:
+            if corpus_name in CODECS_TO_UNSUPPORTED_CORPORA.get(codec_name, []):
+                results[corpus_name][codec_name] = None
+                continue
+
+            results[corpus_name][codec_name] = _measure(
+                CODECS[codec_name],
+                document,
+                kwargs,
+                repeat,
+            )
+
+    return collections.OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('scale', scale),
+        ('repeat', repeat),
+        ('results', results),
+    ])
+
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+
+    for corpus_name, codec_results in report['results'].items():
+        for codec_name in CHECKED_CODECS:
+            current = codec_results.get(codec_name)
+            previous = baseline['results'].get(corpus_name, {}).get(codec_name)
+
+            if previous is None:
+                continue
+
+            for metric, slack in CHECKED_METRICS_TO_SLACKS.items():
+                if metric not in previous:
+                    continue
+
+                # A result the baseline has but this run doesn't is a regression, since nothing
+                # shows that it isn't
+                if current is None or metric not in current:
+                    regressions.append((corpus_name, codec_name, metric, previous[metric], None))
+                    continue
+
+                limit = max(previous[metric] * (1 + tolerance), previous[metric] + slack)
+
+                if current[metric] > limit:
+                    regressions.append((
+                        corpus_name,
+                        codec_name,
+                        metric,
+                        previous[metric],
+                        current[metric],
+                    ))
+
+    return regressions
+
+def _format_result(result, metric):
+    if result is None or metric not in result:
+        return '-'
+
+    if metric.endswith('_seconds'):
+        return '{:.4f}'.format(result[metric])
+
+    return '{:.1f}M'.format(result[metric] / 2 ** 20)
+
+def print_report(report, fp = sys.stdout):
+    columns = ['serialize_seconds', 'deserialize_seconds', 'size_bytes', 'serialize_peak_bytes']
+    fp.write('{:<16} {:<13}'.format('corpus', 'codec') + ''.join(
+        '{:>22}'.format(column) for column in columns
+    ) + '\n')
+
+    for corpus_name, codec_results in report['results'].items():
+        for codec_name, result in codec_results.items():
+            fp.write('{:<16} {:<13}'.format(corpus_name, codec_name) + ''.join(
+                '{:>22}'.format(_format_result(result, column)) for column in columns
+            ) + '\n')
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark TON against json, pickle and marshal')
+    parser.add_argument('--corpus', action = 'append', choices = list(corpora.CORPORA.keys()))
+    parser.add_argument('--codec', action = 'append', choices = list(CODECS.keys()))
+    parser.add_argument('--scale', type = int, default = 1)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--output', help = 'write the report as JSON to this path')
+    parser.add_argument('--baseline', help = 'fail on regressions against this JSON report')
+    parser.add_argument('--tolerance', type = float, default = 0.25)
+    arguments = parser.parse_args(argv)
+
+    report = run(
+        arguments.corpus or list(corpora.CORPORA.keys()),
+        arguments.codec or list(CODECS.keys()),
+        arguments.scale,
+        arguments.repeat,
+    )
+    print_report(report)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as f:
+            json.dump(report, f, indent = 2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = find_regressions(report, baseline, arguments.tolerance)
+
+        for corpus_name, codec_name, metric, previous, current in regressions:
+            sys.stdout.write('REGRESSION {} {} {}: {} -> {}\n'.format(
+                corpus_name,
+                codec_name,
+                metric,
+                previous,
+                current,
+            ))
+
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -63,6 +63,7 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
         'dev': [],
+        'numpy': ['numpy'],
         'test': [],
     },
 
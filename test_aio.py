@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import unittest
+
+from ton import aio, binary
+
+def _reader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+class _Writer(object):
+    def __init__(self):
+        self.written = b''
+        self.drained = False
+
+    def write(self, b):
+        self.written += b
+
+    async def drain(self):
+        self.drained = True
+
+class TestAio(unittest.TestCase):
+    def run_coroutine(self, coroutine):
+        loop = asyncio.new_event_loop()
+
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def test_reads_object_without_reading_past_it(self):
+        async def read():
+            reader = _reader(binary.serialize('Hello, world') + binary.serialize(42))
+            first = await aio.read_object(reader)
+            second = await aio.read_object(reader)
+            return first, second
+
+        self.assertEqual(self.run_coroutine(read()), ('Hello, world', 42))
+
+    def test_reads_containers(self):
+        document = collections.OrderedDict([('foo', [1, 2, 3]), ('bar', None)])
+
+        async def read():
+            return await aio.read_object(_reader(binary.serialize(document)), lazy = True)
+
+        result = self.run_coroutine(read())
+        self.assertEqual(list(result['foo']), [1, 2, 3])
+        self.assertIsNone(result['bar'])
+
+    def test_reads_documents_with_key_tables_and_compact_documents(self):
+        document = collections.OrderedDict([
+            ('foo', [collections.OrderedDict([('bar', 'baz' * 100)])] * 3),
+            ('qux', None),
+        ])
+        options = [
+            { 'key_table': True },
+            { 'compact': True },
+            { 'compact': True, 'key_table': True },
+        ]
+        serialized = b''.join(binary.serialize(document, **kwargs) for kwargs in options)
+
+        async def read():
+            reader = _reader(serialized + binary.serialize(42))
+            first = await aio.read_object(reader)
+            rest = [o async for o in aio.iter_objects(reader)]
+            return [first] + rest
+
+        self.assertEqual(self.run_coroutine(read()), [document, document, document, 42])
+
+    def test_read_raises_on_truncated_object(self):
+        async def read():
+            return await aio.read_object(_reader(binary.serialize('Hello, world')[:-1]))
+
+        with self.assertRaises(asyncio.IncompleteReadError):
+            self.run_coroutine(read())
+
+    def test_writes_object(self):
+        writer = _Writer()
+        self.run_coroutine(aio.write_object(writer, [1, 2, 3]))
+
+        self.assertEqual(writer.written, binary.serialize([1, 2, 3]))
+        self.assertTrue(writer.drained)
+
+    def test_writes_object_with_serialize_options(self):
+        writer = _Writer()
+        document = collections.OrderedDict([('foo', 'bar')])
+        options = { 'compact': True, 'key_table': True }
+        self.run_coroutine(aio.write_object(writer, document, **options))
+
+        self.assertEqual(writer.written, binary.serialize(document, **options))
+
+    def test_iterates_objects_until_end_of_stream(self):
+        async def read():
+            reader = _reader(b''.join(binary.serialize(o) for o in [None, 'foo', 42]))
+            return [o async for o in aio.iter_objects(reader)]
+
+        self.assertEqual(self.run_coroutine(read()), [None, 'foo', 42])
+
+    def test_iteration_raises_on_truncated_stream(self):
+        async def read():
+            reader = _reader(binary.serialize('foo') + binary.serialize('bar')[:-1])
+            return [o async for o in aio.iter_objects(reader)]
+
+        with self.assertRaises(asyncio.IncompleteReadError):
+            self.run_coroutine(read())
+
+    def test_iteration_raises_on_stream_truncated_after_tag(self):
+        for truncated in [b'\x31', b'\x40', b'\x10']:
+            async def read():
+                reader = _reader(binary.serialize('foo') + truncated)
+                return [o async for o in aio.iter_objects(reader)]
+
+            with self.assertRaises(asyncio.IncompleteReadError) as context:
+                self.run_coroutine(read())
+
+            self.assertEqual(context.exception.partial, truncated)
+
+unittest.main()
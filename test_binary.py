@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
 import collections
+import datetime
+import decimal
+import gzip
+import io
+import os
+import tempfile
 import unittest
 
 from ton import binary, tags
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class TestBinarySerialize(unittest.TestCase):
     def test_serializes_null(self):
         self.assertEqual(binary.serialize(None), b'\x00')
@@ -21,6 +32,12 @@ class TestBinarySerialize(unittest.TestCase):
         self.assertEqual(binary.serialize(1),           b'\x12\x00\x00\x00\x01')
         self.assertEqual(binary.serialize(2147483647),  b'\x12\x7f\xff\xff\xff')
 
+    def test_serializes_int64(self):
+        self.assertEqual(
+            binary.serialize(tags.TaggedObject(tags.INT64, -1)),
+            b'\x13\xff\xff\xff\xff\xff\xff\xff\xff',
+        )
+
     def test_serializes_binary(self):
         self.assertEqual(binary.serialize(b'\xde\xad\xbe\xef'), b'\x30\x00\x00\x00\x04\xde\xad\xbe\xef')
 
@@ -46,6 +63,25 @@ class TestBinarySerialize(unittest.TestCase):
             ('bar','baz'),
         ])), b'A\x00\x00\x00\x1d\x00\x00\x00\x021\x00\x00\x00\x03foo\x12\x00\x00\x00*1\x00\x00\x00\x03bar1\x00\x00\x00\x03baz')
 
+    def test_serializes_with_preferred_tags(self):
+        self.assertEqual(
+            binary.serialize(
+                collections.OrderedDict([('foo', [1, 2]), ('bar', tags.TaggedObject(tags.INT64, 3))]),
+                preferred_integer_tag = tags.INT8,
+                preferred_string_tag = tags.UTF16,
+            ),
+            binary.serialize(tags.autotag(
+                collections.OrderedDict([('foo', [1, 2]), ('bar', tags.TaggedObject(tags.INT64, 3))]),
+                preferred_integer_tag = tags.INT8,
+                preferred_string_tag = tags.UTF16,
+            )),
+        )
+        self.assertEqual(binary.serialize(300, preferred_integer_tag = tags.SMALLEST), b'\x11\x01\x2c')
+
+    def test_serialize_rejects_unexpected_keyword_arguments(self):
+        with self.assertRaises(TypeError):
+            binary.serialize(1, preferred_integer_type = tags.INT8)
+
 class TestBinaryDeserialize(unittest.TestCase):
     def test_deserializes_null(self):
         self.assertEqual(binary.deserialize(b'\x00'), None)
@@ -99,4 +135,935 @@ class TestBinaryDeserialize(unittest.TestCase):
         self.assertEqual(binary.deserialize(b'\x41\x00\x00\x00\x00\x00\x00\x00\x00'), collections.OrderedDict([]))
         self.assertEqual(binary.deserialize(b'\x41\x00\x00\x00\x1b\x00\x00\x00\x02\x00\x00\x00\x03foo\x12\x00\x00\x00\x2a\x00\x00\x00\x03bar\x31\x00\x00\x00\x03baz'), collections.OrderedDict([('foo',42), ('bar','baz')]))
 
+    def test_deserializes_dictionaries_with_tagged_keys(self):
+        self.assertEqual(binary.deserialize(b'A\x00\x00\x00\x1d\x00\x00\x00\x021\x00\x00\x00\x03foo\x12\x00\x00\x00*1\x00\x00\x00\x03bar1\x00\x00\x00\x03baz'), collections.OrderedDict([('foo',42), ('bar','baz')]))
+
+    def test_deserializes_from_bytearray_and_memoryview(self):
+        serialized = binary.serialize(collections.OrderedDict([('foo', b'\xde\xad'), ('bar', 'baz')]))
+        expected = collections.OrderedDict([('foo', b'\xde\xad'), ('bar', 'baz')])
+
+        self.assertEqual(binary.deserialize(bytearray(serialized)), expected)
+        self.assertEqual(binary.deserialize(memoryview(serialized)), expected)
+        self.assertEqual(binary.deserialize(memoryview(b'\xff' + serialized)[1:]), expected)
+
+    def test_deserialize_raises_on_trailing_bytes(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(b'\x00\x00')
+
+class TestBinaryNesting(unittest.TestCase):
+    def nested(self, depth):
+        serialized = binary.serialize(None)
+
+        for _ in range(depth):
+            body = binary._serialize_key('a', tags._default_tagger) + serialized
+            serialized = b'\x41' + binary._DICTIONARY_HEADER.pack(len(body), 1) + body
+
+        return serialized
+
+    def test_deserializes_nesting_deeper_than_the_recursion_limit(self):
+        result = binary.deserialize(self.nested(10000))
+        depth = 0
+
+        while result is not None:
+            result = result['a']
+            depth += 1
+
+        self.assertEqual(depth, 10000)
+
+    def test_deserializes_lists_as_lists(self):
+        self.assertEqual(
+            binary.deserialize(binary.serialize([['foo'], [], [None, None], [True]])),
+            [['foo'], [], [None, None], [True]],
+        )
+
+    def test_raises_on_nesting_deeper_than_max_depth(self):
+        binary.deserialize(self.nested(10), max_depth = 10)
+
+        with self.assertRaises(Exception):
+            binary.deserialize(self.nested(11), max_depth = 10)
+
+    def test_raises_when_items_overrun_their_container(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(b'\x40\x31\x00\x00\x00\x04\x00\x00\x00\x01\x00\x00\x00\x01a')
+
+    def test_raises_on_more_items_than_max_items(self):
+        # Nulls take no bytes, so this list of 2**32 - 1 of them is ten bytes long
+        with self.assertRaises(Exception):
+            binary.deserialize(b'\x40\x00\x00\x00\x00\x00\xff\xff\xff\xff', max_items = 1000)
+
+        # Two entries, three nulls and one more entry
+        serialized = binary.serialize(collections.OrderedDict([
+            ('a', [None, None, None]),
+            ('b', collections.OrderedDict([('c', 1)])),
+        ]))
+
+        self.assertEqual(binary.deserialize(serialized, max_items = 6), {
+            'a': [None, None, None],
+            'b': { 'c': 1 },
+        })
+        self.assertEqual(binary.project(serialized, [('a',), ('b',)], max_items = 4), [
+            [None, None, None],
+            { 'c': 1 },
+        ])
+        self.assertEqual(list(binary.Decoder(max_items = 6).feed(serialized * 2)), [
+            binary.deserialize(serialized),
+        ] * 2)
+
+        with self.assertRaises(Exception):
+            binary.deserialize(serialized, max_items = 5)
+
+        with self.assertRaises(Exception):
+            binary.project(serialized, [('a',), ('b',)], max_items = 3)
+
+        with self.assertRaises(Exception):
+            list(binary.Decoder(max_items = 5).feed(serialized))
+
+class TestBinaryIntegerLists(unittest.TestCase):
+    def test_round_trips_integer_lists_of_every_width(self):
+        for tag, values in [
+            (tags.INT8, [-128, 0, 127]),
+            (tags.INT16, [-32768, 0, 32767]),
+            (tags.INT32, [-2147483648, 0, 2147483647]),
+            (tags.INT64, [-9223372036854775808, 0, 9223372036854775807]),
+        ]:
+            serialized = binary.serialize([tags.TaggedObject(tag, v) for v in values])
+
+            self.assertEqual(serialized[1], tag)
+            self.assertEqual(list(binary.deserialize(serialized)), values)
+            self.assertEqual(list(binary.deserialize(serialized, lazy = True)), values)
+
+    def test_uses_the_narrowest_width_that_fits_every_item(self):
+        for values, kwargs, tag in [
+            ([1, 1000], { 'preferred_integer_tag': tags.SMALLEST }, tags.INT16),
+            ([1000, 1], { 'preferred_integer_tag': tags.SMALLEST }, tags.INT16),
+            ([1, -129], { 'preferred_integer_tag': tags.SMALLEST }, tags.INT16),
+            ([5, 3], { 'preferred_integer_tag': tags.SMALLEST }, tags.INT8),
+            ([1, 2 ** 40], {}, tags.INT64),
+            ([1, 2], { 'preferred_integer_tag': tags.INT16 }, tags.INT16),
+        ]:
+            for compact in [False, True]:
+                serialized = binary.serialize(values, compact = compact, **kwargs)
+
+                self.assertEqual(serialized[1], tag)
+                self.assertEqual(binary.deserialize(serialized), values)
+
+    def test_uses_the_widest_tag_of_tagged_items(self):
+        for values in [
+            tags.autotag([1, 1000], preferred_integer_tag = tags.SMALLEST).value,
+            [1, tags.TaggedObject(tags.INT16, 1000)],
+        ]:
+            serialized = binary.serialize(values, preferred_integer_tag = tags.SMALLEST)
+
+            self.assertEqual(serialized[1], tags.INT16)
+            self.assertEqual(binary.deserialize(serialized), [1, 1000])
+
+    def test_raises_when_byte_length_does_not_match_item_length(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(b'\x40\x12\x00\x00\x00\x04\x00\x00\x00\x02\x00\x00\x00\x01')
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestBinaryNumpyArrays(unittest.TestCase):
+    def test_serializes_arrays_as_typed_lists(self):
+        for dtype, tag in [('int8', tags.INT8), ('<i2', tags.INT16), ('>i4', tags.INT32), ('int64', tags.INT64)]:
+            values = [-3, 0, 5, 100]
+
+            self.assertEqual(
+                binary.serialize(numpy.array(values, dtype = dtype)),
+                binary.serialize([tags.TaggedObject(tag, v) for v in values]),
+            )
+
+    def test_dumps_arrays(self):
+        document = collections.OrderedDict([('samples', numpy.arange(100000, dtype = 'int32'))])
+        fp = io.BytesIO()
+        binary.dump(document, fp)
+
+        self.assertEqual(fp.getvalue(), binary.serialize(document))
+
+    def test_deserializes_integer_lists_as_arrays(self):
+        serialized = binary.serialize(collections.OrderedDict([
+            ('samples', [tags.TaggedObject(tags.INT16, v) for v in [1, -2, 3]]),
+            ('names', ['foo']),
+        ]))
+
+        for lazy in [False, True]:
+            result = binary.deserialize(serialized, arrays = 'numpy', lazy = lazy)
+
+            self.assertIsInstance(result['samples'], numpy.ndarray)
+            self.assertEqual(result['samples'].dtype, numpy.dtype('>i2'))
+            self.assertEqual(result['samples'].tolist(), [1, -2, 3])
+            self.assertEqual(list(result['names']), ['foo'])
+
+class TestBinaryLazyDeserialize(unittest.TestCase):
+    def setUp(self):
+        self.serialized = binary.serialize(collections.OrderedDict([
+            ('numbers', [1, 2, 3]),
+            ('words', ['foo', 'bar', 'baz']),
+            ('nested', collections.OrderedDict([('inner', 'value')])),
+            ('nothing', None),
+        ]))
+
+    def test_returns_read_only_views(self):
+        result = binary.deserialize(self.serialized, lazy = True)
+
+        self.assertIsInstance(result, binary.DictionaryView)
+        self.assertIsInstance(result['numbers'], binary.ListView)
+        self.assertIsInstance(result['nested'], binary.DictionaryView)
+
+    def test_views_index_and_iterate_repeatedly(self):
+        result = binary.deserialize(self.serialized, lazy = True)
+
+        self.assertEqual(list(result), ['numbers', 'words', 'nested', 'nothing'])
+        self.assertEqual(len(result), 4)
+        self.assertEqual(result['numbers'][2], 3)
+        self.assertEqual(result['numbers'][-1], 3)
+        self.assertEqual(result['words'][1], 'bar')
+        self.assertEqual(result['words'][1:], ['bar', 'baz'])
+        self.assertEqual(list(result['words']), ['foo', 'bar', 'baz'])
+        self.assertEqual(list(result['words']), ['foo', 'bar', 'baz'])
+        self.assertEqual(result['nested']['inner'], 'value')
+        self.assertIsNone(result['nothing'])
+        self.assertNotIn('missing', result)
+
+    def test_list_view_raises_index_error(self):
+        result = binary.deserialize(binary.serialize(['foo']), lazy = True)
+
+        with self.assertRaises(IndexError):
+            result[1]
+
+    def test_returns_scalars_directly(self):
+        self.assertEqual(binary.deserialize(binary.serialize('foo'), lazy = True), 'foo')
+
+    def test_raises_on_trailing_bytes(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(self.serialized + b'\x00', lazy = True)
+
+class TestBinaryLoadPath(unittest.TestCase):
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile(delete = False)
+        f.write(binary.serialize(collections.OrderedDict([('foo', [1, 2, 3]), ('bar', 'baz')])))
+        f.close()
+        self.path = f.name
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_loads_path(self):
+        result = binary.load_path(self.path)
+
+        self.assertEqual(list(result['foo']), [1, 2, 3])
+        self.assertEqual(result['bar'], 'baz')
+
+    def test_loads_path_lazily(self):
+        result = binary.load_path(self.path, lazy = True)
+
+        self.assertIsInstance(result, binary.DictionaryView)
+        self.assertEqual(result['foo'][1], 2)
+        self.assertEqual(result['bar'], 'baz')
+
+class _UnseekableStream(io.RawIOBase):
+    def __init__(self):
+        self.written = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.written += b
+        return len(b)
+
+class TestBinaryDump(unittest.TestCase):
+    DOCUMENTS = [
+        None,
+        42,
+        'Hello, world',
+        [],
+        [1, 2, 3],
+        [[1], [2, 3], []],
+        collections.OrderedDict([
+            ('foo', [collections.OrderedDict([('bar', 'baz' * 1000)])] * 3),
+            ('qux', None),
+        ]),
+    ]
+
+    def test_dumps_to_seekable_stream(self):
+        for document in self.DOCUMENTS:
+            fp = io.BytesIO(b'prefix')
+            fp.seek(0, io.SEEK_END)
+            binary.dump(document, fp)
+            self.assertEqual(fp.getvalue(), b'prefix' + binary.serialize(document))
+
+    def test_dumps_to_unseekable_stream(self):
+        for document in self.DOCUMENTS:
+            fp = _UnseekableStream()
+            binary.dump(document, fp)
+            self.assertEqual(bytes(fp.written), binary.serialize(document))
+
+    def test_dumps_to_file_in_append_mode(self):
+        # Large enough to be flushed before its headers are known
+        document = [collections.OrderedDict([('bar', 'baz' * 1000)])] * 100
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'document.ton')
+
+            with open(path, 'wb') as fp:
+                fp.write(b'prefix')
+
+            with open(path, 'ab') as fp:
+                binary.dump(document, fp)
+
+            with open(path, 'rb') as fp:
+                self.assertEqual(fp.read(), b'prefix' + binary.serialize(document))
+
+    def test_dumps_to_gzip_file(self):
+        # GzipFile says it is seekable, but can't seek backwards over what it has flushed
+        document = [collections.OrderedDict([('bar', 'baz' * 1000)])] * 100
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'document.ton.gz')
+
+            with gzip.open(path, 'wb') as fp:
+                binary.dump(document, fp)
+
+            with gzip.open(path, 'rb') as fp:
+                self.assertEqual(fp.read(), binary.serialize(document))
+
+class _Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class TestBinaryEncoders(unittest.TestCase):
+    def setUp(self):
+        self.types_to_taggers = dict(tags._TYPES_TO_TAGGERS)
+        # Each call returns a new dictionary and list, which are freed between passes
+        tags.register_encoder(_Point, lambda p: collections.OrderedDict([
+            ('name', 'y' * p.y),
+            ('coordinates', [p.x, p.y]),
+        ]))
+        self.document = [_Point(i, i % 300) for i in range(200)]
+        self.expected = [
+            collections.OrderedDict([('name', 'y' * (i % 300)), ('coordinates', [i, i % 300])])
+            for i in range(200)
+        ]
+
+    def tearDown(self):
+        tags._TYPES_TO_TAGGERS.clear()
+        tags._TYPES_TO_TAGGERS.update(self.types_to_taggers)
+        tags._TYPE_TAGGER_CACHE.clear()
+        tags._TYPE_TAGGER_CACHE.update(tags._TYPES_TO_TAGGERS)
+
+    def test_dumps_encoded_objects_to_unseekable_stream(self):
+        for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+            fp = _UnseekableStream()
+            binary.dump(self.document, fp, **kwargs)
+
+            self.assertEqual(bytes(fp.written), binary.serialize(self.expected, **kwargs))
+
+    def test_serializes_encoded_objects_in_compact_format(self):
+        serialized = binary.serialize(self.document, compact = True)
+
+        self.assertEqual(serialized, binary.serialize(self.expected, compact = True))
+        self.assertEqual(binary.deserialize(serialized), self.expected)
+
+    def test_serializes_lists_of_objects_encoded_as_integers(self):
+        tags.register_encoder(datetime.date, datetime.date.toordinal)
+        tags.register_encoder(decimal.Decimal, int)
+        dates = [datetime.date(2020, 1, 1), datetime.date(1, 1, 1)]
+        decimals = [decimal.Decimal(300), decimal.Decimal(-1)]
+
+        for document, expected in [
+            (dates, [737425, 1]),
+            (decimals, [300, -1]),
+            (collections.OrderedDict([('dates', dates)]), { 'dates': [737425, 1] }),
+        ]:
+            for kwargs in [{}, { 'compact': True }, { 'preferred_integer_tag': tags.SMALLEST }]:
+                serialized = binary.serialize(document, **kwargs)
+                fp = _UnseekableStream()
+                binary.dump(document, fp, **kwargs)
+
+                self.assertEqual(serialized, binary.serialize(expected, **kwargs))
+                self.assertEqual(bytes(fp.written), serialized)
+                self.assertEqual(binary.deserialize(serialized), expected)
+
+            self.assertEqual(
+                binary.serialize_parallel(document, workers = 2),
+                binary.serialize(expected),
+            )
+
+    def test_sizes_integer_lists_by_every_encoded_item(self):
+        # The encoded items are out of the order of the decimals, so the widest isn't at either end
+        tags.register_encoder(decimal.Decimal, lambda d: int(d) % 1000)
+        document = [decimal.Decimal(0), decimal.Decimal(500), decimal.Decimal(1000)]
+        serialized = binary.serialize(document, preferred_integer_tag = tags.SMALLEST)
+
+        self.assertEqual(serialized, binary.serialize(
+            [0, 500, 0],
+            preferred_integer_tag = tags.SMALLEST,
+        ))
+        self.assertEqual(binary.deserialize(serialized), [0, 500, 0])
+
+class TestBinaryDecoder(unittest.TestCase):
+    DOCUMENTS = [
+        None,
+        42,
+        'Hello, world',
+        [1, 2, 3],
+        collections.OrderedDict([('foo', ['bar', 'baz']), ('qux', None)]),
+    ]
+
+    def test_decodes_concatenated_objects_fed_in_chunks(self):
+        serialized = b''.join(binary.serialize(d) for d in self.DOCUMENTS)
+
+        for chunk_size in [1, 3, 7, len(serialized)]:
+            decoder = binary.Decoder()
+            results = []
+
+            for i in range(0, len(serialized), chunk_size):
+                results.extend(decoder.feed(serialized[i:i + chunk_size]))
+
+            decoder.close()
+
+            self.assertEqual(len(results), len(self.DOCUMENTS))
+            self.assertEqual(results[:3], self.DOCUMENTS[:3])
+            self.assertEqual(list(results[3]), self.DOCUMENTS[3])
+            self.assertEqual(list(results[4]['foo']), ['bar', 'baz'])
+
+    def test_yields_nothing_until_object_is_complete(self):
+        decoder = binary.Decoder()
+        serialized = binary.serialize('Hello, world')
+
+        self.assertEqual(list(decoder.feed(serialized[:-1])), [])
+        self.assertEqual(list(decoder.feed(serialized[-1:])), ['Hello, world'])
+
+    def test_close_raises_on_incomplete_object(self):
+        decoder = binary.Decoder()
+        list(decoder.feed(binary.serialize('Hello, world')[:-1]))
+
+        with self.assertRaises(Exception):
+            decoder.close()
+
+class TestBinaryKeyTable(unittest.TestCase):
+    def setUp(self):
+        self.document = [
+            collections.OrderedDict([('id', i), ('name', 'user'), ('tags', ['alpha'])])
+            for i in range(3)
+        ]
+
+    def test_writes_each_key_once(self):
+        self.assertEqual(
+            binary.serialize([{ 'foo': None }, { 'foo': None }], key_table = True),
+            b'\x50\x01\x00\x00\x00\x08\x00\x00\x00\x01\x31\x00\x00\x00\x03foo'
+                + b'\x40\x41\x00\x00\x00\x16\x00\x00\x00\x02'
+                + b'\x00\x00\x00\x03\x00\x00\x00\x01\x34\x00\x00'
+                + b'\x00\x00\x00\x03\x00\x00\x00\x01\x34\x00\x00',
+        )
+
+    def test_round_trips_and_interns_keys(self):
+        serialized = binary.serialize(self.document, key_table = True)
+        self.assertLess(len(serialized), len(binary.serialize(self.document)))
+
+        for kwargs in [{}, { 'lazy': True }, { 'max_depth': 3 }]:
+            result = binary.deserialize(serialized, **kwargs)
+            self.assertEqual(
+                [(d['id'], d['name'], list(d['tags'])) for d in result],
+                [(d['id'], d['name'], d['tags']) for d in self.document],
+            )
+            self.assertIs(list(result[0].keys())[1], list(result[2].keys())[1])
+
+    def test_references_wider_than_a_byte(self):
+        document = collections.OrderedDict(('key{}'.format(i), i) for i in range(70000))
+        self.assertEqual(binary.deserialize(binary.serialize(document, key_table = True)), document)
+
+    def test_dumps_to_seekable_and_unseekable_streams(self):
+        serialized = binary.serialize(self.document, key_table = True)
+
+        seekable = io.BytesIO()
+        binary.dump(self.document, seekable, key_table = True)
+        self.assertEqual(seekable.getvalue(), serialized)
+
+        unseekable = _UnseekableStream()
+        binary.dump(self.document, unseekable, key_table = True)
+        self.assertEqual(bytes(unseekable.written), serialized)
+
+    def test_decoder_decodes_documents_with_key_tables(self):
+        serialized = binary.serialize(self.document, key_table = True)
+        decoder = binary.Decoder()
+        results = []
+
+        for i in range(len(serialized)):
+            results.extend(decoder.feed(serialized[i:i + 1]))
+
+        results.extend(decoder.feed(serialized))
+        decoder.close()
+        self.assertEqual(results, [self.document, self.document])
+
+    def test_raises_on_unsupported_versions(self):
+        serialized = bytearray(binary.serialize(self.document, key_table = True))
+        serialized[1] = 2
+
+        with self.assertRaises(Exception):
+            binary.deserialize(serialized)
+
+    def test_raises_on_references_outside_the_table(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(
+                b'\x50\x01\x00\x00\x00\x00\x00\x00\x00\x00'
+                    + b'\x41\x00\x00\x00\x03\x00\x00\x00\x01\x34\x00\x00',
+            )
+
+    def test_raises_on_key_tables_inside_documents(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(
+                b'\x41\x00\x00\x00\x13\x00\x00\x00\x01\x31\x00\x00\x00\x01a'
+                    + b'\x50\x01\x00\x00\x00\x00\x00\x00\x00\x00\x00',
+            )
+
+class TestBinaryCompact(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('id', 12345),
+            ('short', 'Hello, world'),
+            ('long', 'x' * 300),
+            ('short strings', ['foo', 'bar']),
+            ('long strings', ['foo', 'x' * 300]),
+            ('integers', list(range(200))),
+            ('nested', [[], [None, None], [collections.OrderedDict([('a', True)])]]),
+            ('empty', collections.OrderedDict()),
+            ('binary', b'\xde\xad'),
+        ])
+
+    def test_serializes_with_varint_headers_and_short_strings(self):
+        self.assertEqual(
+            binary.serialize(collections.OrderedDict([('foo', ['bar'])]), compact = True),
+            b'\x43\x0d\x01\x37\x03foo\x42\x37\x04\x01\x03bar',
+        )
+
+    def test_serializes_long_strings_with_standard_lengths(self):
+        self.assertEqual(
+            binary.serialize('x' * 256, compact = True),
+            b'\x31\x00\x00\x01\x00' + b'x' * 256,
+        )
+
+    def test_round_trips_and_is_smaller(self):
+        for kwargs in [{ 'compact': True }, { 'compact': True, 'key_table': True }]:
+            serialized = binary.serialize(self.document, **kwargs)
+            self.assertLess(len(serialized), len(binary.serialize(self.document)))
+            self.assertEqual(binary.deserialize(serialized), self.document)
+
+    def test_deserializes_lazily(self):
+        result = binary.deserialize(binary.serialize(self.document, compact = True), lazy = True)
+
+        self.assertEqual(list(result['long strings']), ['foo', 'x' * 300])
+        self.assertEqual(result['integers'][150], 150)
+        self.assertEqual(dict(result['nested'][2][0]), { 'a': True })
+
+    def test_dumps_to_seekable_and_unseekable_streams(self):
+        serialized = binary.serialize(self.document, compact = True)
+
+        seekable = io.BytesIO()
+        binary.dump(self.document, seekable, compact = True)
+        self.assertEqual(seekable.getvalue(), serialized)
+
+        unseekable = _UnseekableStream()
+        binary.dump(self.document, unseekable, compact = True)
+        self.assertEqual(bytes(unseekable.written), serialized)
+
+    def test_decoder_decodes_compact_documents_fed_in_chunks(self):
+        serialized = binary.serialize(self.document, compact = True)
+        decoder = binary.Decoder()
+        results = []
+
+        for i in range(len(serialized)):
+            results.extend(decoder.feed(serialized[i:i + 1]))
+
+        decoder.close()
+        self.assertEqual(results, [self.document])
+
+    def test_raises_on_short_strings_overrunning_source(self):
+        with self.assertRaises(Exception):
+            binary.deserialize(b'\x37\x05foo')
+
+class TestBinaryIndexedDictionary(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('zeta', 1),
+            ('alpha', 'x' * 300),
+            ('mu', [collections.OrderedDict([('b', None)])]),
+            ('beta', collections.OrderedDict([('nested', True)])),
+        ])
+        self.indexed = tags.TaggedObject(tags.INDEXED_DICTIONARY, self.document)
+
+    def test_serializes_sorted_entries_after_their_offsets(self):
+        self.assertEqual(
+            binary.serialize(tags.TaggedObject(
+                tags.INDEXED_DICTIONARY,
+                collections.OrderedDict([('b', 1), ('a', 2)]),
+            )),
+            b'\x44\x00\x00\x00\x1e\x00\x00\x00\x02\x00\x00\x00\x00\x00\x00\x00\x0b'
+            + b'\x31\x00\x00\x00\x01a\x12\x00\x00\x00\x02'
+            + b'\x31\x00\x00\x00\x01b\x12\x00\x00\x00\x01',
+        )
+
+    def test_round_trips_in_key_order(self):
+        for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+            result = binary.deserialize(binary.serialize(self.indexed, **kwargs))
+            self.assertEqual(list(result.keys()), ['alpha', 'beta', 'mu', 'zeta'])
+            self.assertEqual(dict(result), dict(self.document))
+
+    def test_dumps_to_seekable_and_unseekable_streams(self):
+        for kwargs in [{}, { 'compact': True }]:
+            serialized = binary.serialize([self.indexed, self.indexed], **kwargs)
+
+            seekable = io.BytesIO()
+            binary.dump([self.indexed, self.indexed], seekable, **kwargs)
+            self.assertEqual(seekable.getvalue(), serialized)
+
+            unseekable = _UnseekableStream()
+            binary.dump([self.indexed, self.indexed], unseekable, **kwargs)
+            self.assertEqual(bytes(unseekable.written), serialized)
+
+    def test_gets_values(self):
+        for document in [self.indexed, self.document]:
+            for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+                serialized = binary.serialize(document, **kwargs)
+
+                for key, value in self.document.items():
+                    self.assertEqual(binary.get(serialized, key), value)
+
+                with self.assertRaises(KeyError):
+                    binary.get(serialized, 'omega')
+
+    def test_get_parses_only_keys_on_the_search_path(self):
+        serialized = bytearray(binary.serialize(tags.TaggedObject(
+            tags.INDEXED_DICTIONARY,
+            collections.OrderedDict([('a', 1), ('b', 2), ('c', 3)]),
+        )))
+        # Corrupt the key of the first entry, which a search for 'c' never visits
+        serialized[21] = 0xff
+
+        self.assertEqual(binary.get(serialized, 'c'), 3)
+
+    def test_get_takes_deserialize_options(self):
+        serialized = binary.serialize(self.indexed)
+
+        self.assertIsInstance(binary.get(serialized, 'beta', lazy = True), binary.DictionaryView)
+
+        with self.assertRaises(Exception):
+            binary.get(serialized, 'mu', max_depth = 2)
+
+        with self.assertRaises(TypeError):
+            binary.get(serialized, 'mu', lazily = True)
+
+    def test_get_raises_on_documents_which_are_not_dictionaries(self):
+        with self.assertRaises(Exception):
+            binary.get(binary.serialize(['alpha']), 'alpha')
+
+    def test_views_look_up_keys_without_indexing_them(self):
+        view = binary.deserialize(binary.serialize(self.indexed), lazy = True)
+
+        self.assertEqual(view['zeta'], 1)
+        self.assertIn('mu', view)
+        self.assertNotIn('omega', view)
+        self.assertIsNone(view._value_offsets)
+        self.assertEqual(list(view), ['alpha', 'beta', 'mu', 'zeta'])
+
+    def test_does_not_find_keys_which_are_not_strings(self):
+        serialized = binary.serialize(self.indexed)
+        view = binary.deserialize(serialized, lazy = True)
+
+        for key in [3, None, b'mu']:
+            self.assertIsNone(view.get(key))
+            self.assertNotIn(key, view)
+
+            with self.assertRaises(KeyError):
+                binary.get(serialized, key)
+
+class TestBinaryExtract(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('users', [
+                collections.OrderedDict([('name', 'user {}'.format(i)), ('email', '{}@x'.format(i))])
+                for i in range(5)
+            ]),
+            ('counts', [10, 20, 30]),
+            ('nested', [[['deep']]]),
+        ])
+
+    def test_extracts_objects_at_paths(self):
+        for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+            serialized = binary.serialize(self.document, **kwargs)
+
+            self.assertEqual(binary.extract(serialized, ('users', 3, 'email')), '3@x')
+            self.assertEqual(binary.extract(serialized, ['users', -1, 'name']), 'user 4')
+            self.assertEqual(binary.extract(serialized, ('counts', 2)), 30)
+            self.assertEqual(binary.extract(serialized, ('users', 0)), self.document['users'][0])
+            self.assertEqual(binary.extract(serialized, ()), self.document)
+
+    def test_extracts_from_indexed_dictionaries(self):
+        serialized = binary.serialize(tags.TaggedObject(tags.INDEXED_DICTIONARY, self.document))
+
+        self.assertEqual(binary.extract(serialized, ('users', 1, 'name')), 'user 1')
+
+    def test_skips_over_everything_off_the_path(self):
+        serialized = bytearray(binary.serialize(self.document))
+        # Corrupt the first user's name, which is skipped over by its length header
+        serialized[serialized.index(b'user 0')] = 0xff
+
+        self.assertEqual(binary.extract(serialized, ('users', 1, 'name')), 'user 1')
+
+        with self.assertRaises(UnicodeDecodeError):
+            binary.extract(serialized, ('users', 0, 'name'))
+
+    def test_raises_like_lookups_in_the_deserialized_document(self):
+        serialized = binary.serialize(self.document)
+
+        with self.assertRaises(KeyError):
+            binary.extract(serialized, ('groups',))
+
+        with self.assertRaises(IndexError):
+            binary.extract(serialized, ('users', 5))
+
+        with self.assertRaises(TypeError):
+            binary.extract(serialized, ('users', 'name'))
+
+        with self.assertRaises(Exception):
+            binary.extract(serialized, ('counts', 0, 0))
+
+    def test_takes_deserialize_options(self):
+        serialized = binary.serialize(self.document)
+
+        self.assertIsInstance(binary.extract(serialized, ('users',), lazy = True), binary.ListView)
+        self.assertEqual(binary.extract(serialized, ('nested', 0), max_depth = 4), [['deep']])
+
+        with self.assertRaises(Exception):
+            binary.extract(serialized, ('nested', 0), max_depth = 3)
+
+        with self.assertRaises(TypeError):
+            binary.extract(serialized, ('nested',), lazily = True)
+
+    def test_projects_paths_in_order(self):
+        serialized = binary.serialize(self.document, compact = True)
+
+        self.assertEqual(
+            binary.project(serialized, [
+                ('users', 4, 'email'),
+                ('counts',),
+                ('users', 0, 'name'),
+                ('users', 4, 'name'),
+            ]),
+            ['4@x', [10, 20, 30], 'user 0', 'user 4'],
+        )
+        self.assertEqual(binary.project(serialized, []), [])
+
+class TestBinaryValidate(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('id', 12345),
+            ('name', 'Zoë'),
+            ('blob', b'\xff\xfe'),
+            ('integers', [1, 2, 3]),
+            ('strings', ['foo', 'x' * 300]),
+            ('nested', [[], [None, True], [collections.OrderedDict([('a', False)])]]),
+            ('utf16', tags.TaggedObject(tags.UTF16, 'wide')),
+        ])
+
+    def assertInvalidAt(self, serialized, offset):
+        with self.assertRaises(binary.ValidationError) as context:
+            binary.validate(serialized)
+
+        self.assertEqual(context.exception.offset, offset)
+
+    def test_accepts_every_form_of_documents(self):
+        indexed = tags.TaggedObject(tags.INDEXED_DICTIONARY, self.document)
+
+        for document in [self.document, indexed, [indexed, indexed], 'scalar', None]:
+            for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+                serialized = binary.serialize(document, **kwargs)
+                self.assertIsNone(binary.validate(serialized))
+                self.assertIsNone(binary.validate(memoryview(serialized)))
+
+    def test_reports_unknown_tags(self):
+        self.assertInvalidAt(b'\x40\x20\x00\x00\x00\x00\x00\x00\x00\x00', 1)
+        self.assertInvalidAt(b'\x41\x00\x00\x00\x04\x00\x00\x00\x01\x37\x01a\x20', 12)
+
+    def test_reports_overruns_and_trailing_bytes(self):
+        serialized = binary.serialize(self.document)
+
+        self.assertInvalidAt(serialized[:-1], 1)
+        self.assertInvalidAt(serialized + b'\x00', len(serialized))
+        self.assertInvalidAt(b'', 0)
+        self.assertInvalidAt(b'\x31\x00\x00\x00\x02a', 1)
+
+    def test_reports_item_lengths_which_do_not_match(self):
+        # Two items in a list which says it has three, and three integers in four bytes
+        self.assertInvalidAt(
+            b'\x40\x37\x00\x00\x00\x04\x00\x00\x00\x03\x01a\x01b',
+            14,
+        )
+        self.assertInvalidAt(
+            b'\x40\x10\x00\x00\x00\x04\x00\x00\x00\x03\x01\x02\x03\x04',
+            1,
+        )
+
+    def test_reports_invalid_text_at_the_offending_byte(self):
+        self.assertInvalidAt(b'\x31\x00\x00\x00\x03ab\xff', 7)
+        self.assertInvalidAt(b'\x40\x37\x00\x00\x00\x04\x00\x00\x00\x02\x01a\x01\xc3', 13)
+
+    def test_reports_key_references_outside_the_key_table(self):
+        serialized = bytearray(binary.serialize({ 'a': 1 }, key_table = True))
+        reference = serialized.index(tags.KEY_REFERENCE8, 15)
+        serialized[reference + 1] = 1
+
+        self.assertInvalidAt(serialized, reference)
+
+    def test_reports_index_entries_which_do_not_match(self):
+        serialized = bytearray(binary.serialize(tags.TaggedObject(
+            tags.INDEXED_DICTIONARY,
+            collections.OrderedDict([('a', 1), ('b', 2)]),
+        )))
+        # Point the second entry at the first
+        serialized[16] = 0
+
+        self.assertEqual(binary.deserialize(serialized), { 'a': 1, 'b': 2 })
+        self.assertInvalidAt(serialized, 13)
+
+    def test_limits_nesting_to_max_depth(self):
+        serialized = binary.serialize([[[]]])
+
+        binary.validate(serialized, max_depth = 3)
+
+        with self.assertRaises(binary.ValidationError):
+            binary.validate(serialized, max_depth = 2)
+
+        with self.assertRaises(TypeError):
+            binary.validate(serialized, max_depths = 2)
+
+    def test_limits_items_to_max_items(self):
+        # A flipped byte in the header of an empty list of nulls makes it claim 2**32 - 1 of them
+        self.assertIsNone(binary.validate(b'\x40\x00\x00\x00\x00\x00\x00\x00\x00\x00'))
+
+        with self.assertRaises(binary.ValidationError) as context:
+            binary.validate(b'\x40\x00\x00\x00\x00\x00\xff\xff\xff\xff', max_items = 1000)
+
+        self.assertEqual(context.exception.offset, 1)
+
+        serialized = binary.serialize(collections.OrderedDict([
+            ('a', [None, None, None]),
+            ('b', collections.OrderedDict([('c', 1)])),
+        ]))
+        binary.validate(serialized, max_items = 6)
+
+        with self.assertRaises(binary.ValidationError):
+            binary.validate(serialized, max_items = 5)
+
+    def test_validates_buffers_and_mappings_in_place(self):
+        for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+            serialized = binary.serialize(self.document, **kwargs)
+            f = tempfile.NamedTemporaryFile(delete = False)
+            f.write(serialized)
+            f.close()
+
+            try:
+                mapping = binary._map_path(f.name)
+                self.assertIsNone(binary.validate(mapping))
+                mapping.close()
+            finally:
+                os.remove(f.name)
+
+            self.assertIsNone(binary.validate(bytearray(serialized)))
+            self.assertIsNone(binary.validate(memoryview(bytearray(serialized))))
+
+        # 'ë' and half of another
+        invalid = b'\x40\x37\x00\x00\x00\x05\x00\x00\x00\x02\x02\xc3\xab\x01\xc3'
+
+        for source in [bytearray(invalid), memoryview(bytearray(invalid))]:
+            self.assertInvalidAt(source, 14)
+
+class TestBinarySerializeParallel(unittest.TestCase):
+    def test_matches_serialize(self):
+        for o, kwargs in [
+            ([collections.OrderedDict([('id', i), ('name', 'user')]) for i in range(10)], {}),
+            (collections.OrderedDict(('key{}'.format(i), [i, 1000]) for i in range(10)), {
+                'preferred_integer_tag': tags.SMALLEST,
+            }),
+            (['foo', 'bar', 'baz'], { 'preferred_string_tag': tags.UTF16 }),
+            ([[1, 2], [], [3]], {}),
+            (list(range(10)), {}),
+            ([None], {}),
+            ('Hello, world', {}),
+        ]:
+            self.assertEqual(
+                binary.serialize_parallel(o, workers = 2, **kwargs),
+                binary.serialize(o, **kwargs),
+            )
+
+    def test_raises_on_unexpected_keyword_arguments(self):
+        with self.assertRaises(TypeError):
+            binary.serialize_parallel([], workers = 2, compact = True)
+
+class TestBinaryDeserializeParallel(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            collections.OrderedDict([('id', i), ('name', 'user{}'.format(i)), ('tags', ['a'])])
+            for i in range(20)
+        ]
+        self.dictionary = collections.OrderedDict(
+            ('key{}'.format(i), [collections.OrderedDict([('i', i)])]) for i in range(20)
+        )
+
+    def test_matches_deserialize(self):
+        for o in [self.records, self.dictionary, ['foo', 'bar'], [[1, 2], [3]], list(range(10)), 42]:
+            for kwargs in [{}, { 'compact': True }, { 'key_table': True }]:
+                serialized = binary.serialize(o, **kwargs)
+
+                self.assertEqual(
+                    binary.deserialize_parallel(serialized, workers = 2),
+                    binary.deserialize(serialized),
+                )
+
+    def test_loads_path(self):
+        f = tempfile.NamedTemporaryFile(delete = False)
+        f.write(binary.serialize(self.records))
+        f.close()
+
+        try:
+            self.assertEqual(binary.load_path_parallel(f.name, workers = 2), self.records)
+        finally:
+            os.remove(f.name)
+
+    def test_limits_nesting_to_max_depth(self):
+        serialized = binary.serialize([[[1]], [[2]]])
+
+        self.assertEqual(binary.deserialize_parallel(serialized, workers = 2, max_depth = 3), [
+            [[1]],
+            [[2]],
+        ])
+
+        with self.assertRaises(Exception):
+            binary.deserialize_parallel(serialized, workers = 2, max_depth = 2)
+
+    def test_limits_items_to_max_items(self):
+        # Two entries, each a list of a dictionary of one entry
+        serialized = binary.serialize(collections.OrderedDict([
+            ('a', [collections.OrderedDict([('i', 1)])]),
+            ('b', [collections.OrderedDict([('i', 2)])]),
+        ]))
+
+        self.assertEqual(
+            binary.deserialize_parallel(serialized, workers = 2, max_items = 6),
+            binary.deserialize(serialized),
+        )
+
+        for max_items in [1, 5]:
+            with self.assertRaises(Exception):
+                binary.deserialize_parallel(serialized, workers = 2, max_items = max_items)
+
+    def test_raises_when_items_do_not_match_their_container(self):
+        serialized = bytearray(binary.serialize(['foo', 'bar']))
+        # Shorten the first string, so that it ends inside the second
+        serialized[13] = 2
+
+        with self.assertRaises(Exception):
+            binary.deserialize_parallel(serialized, workers = 2)
+
 unittest.main()
@@ -0,0 +1,136 @@
+import collections
+import io
+import os
+import tempfile
+import unittest
+
+from ton import binary, instrument, string, tags
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('integers', [1, 2, 3]),
+            ('records', [collections.OrderedDict([('id', None)])]),
+            ('blob', b'\xde\xad'),
+        ])
+
+    def test_records_counts_and_sizes_per_tag_for_binary(self):
+        with instrument.Recorder() as recorder:
+            serialized = binary.serialize(self.document, preferred_string_tag = tags.UTF16)
+            binary.deserialize(serialized)
+
+        self.assertEqual(
+            list(recorder.functions_to_stats.keys()),
+            ['binary.serialize', 'binary.deserialize'],
+        )
+
+        for stats in recorder.functions_to_stats.values():
+            self.assertEqual(stats.calls, 1)
+            self.assertGreater(stats.seconds, 0)
+            self.assertEqual(stats.max_depth, 3)
+            self.assertEqual(stats.tags_to_counts, collections.Counter({
+                tags.DICTIONARY: 2,
+                tags.LIST: 2,
+                tags.INT32: 3,
+                tags.VOID: 1,
+                tags.BINARY: 1,
+            }))
+            self.assertEqual(stats.tags_to_sizes[tags.INT32], 12)
+            self.assertEqual(stats.key_tags_to_counts, collections.Counter({ tags.UTF16: 4 }))
+            self.assertEqual(
+                sum(stats.tags_to_sizes.values()) + sum(stats.key_tags_to_sizes.values()),
+                len(serialized),
+            )
+
+    def test_counts_key_tables_and_key_references(self):
+        with instrument.Recorder() as recorder:
+            serialized = binary.serialize(self.document, key_table = True)
+
+        stats = recorder.functions_to_stats['binary.serialize']
+        self.assertEqual(stats.tags_to_counts[tags.KEY_TABLE], 1)
+        self.assertEqual(stats.key_tags_to_counts, collections.Counter({ tags.KEY_REFERENCE8: 4 }))
+        self.assertEqual(
+            sum(stats.tags_to_sizes.values()) + sum(stats.key_tags_to_sizes.values()),
+            len(serialized),
+        )
+
+    def test_records_counts_and_sizes_per_tag_for_string(self):
+        with instrument.Recorder() as recorder:
+            string.deserialize(string.serialize(self.document))
+
+        for stats in recorder.functions_to_stats.values():
+            self.assertEqual(stats.max_depth, 3)
+            self.assertEqual(stats.tags_to_counts[tags.INT32], 3)
+            self.assertEqual(stats.tags_to_sizes[tags.INT32], len('1i32') * 3)
+            self.assertEqual(stats.key_tags_to_counts, collections.Counter({ tags.UTF8: 4 }))
+
+    def test_records_every_entry_point(self):
+        serialized = binary.serialize(self.document)
+        decoder = binary.Decoder()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'document.ton')
+
+            with open(path, 'wb') as fp:
+                fp.write(serialized)
+
+            with instrument.Recorder() as recorder:
+                binary.dump(self.document, io.BytesIO())
+                binary.load_path(path)
+                binary.load_path_parallel(path, workers = 1)
+                binary.serialize_parallel(self.document, workers = 1)
+                binary.deserialize_parallel(serialized, workers = 1)
+                list(decoder.feed(serialized + serialized))
+                binary.extract(serialized, ('integers', 1))
+                binary.project(serialized, [('blob',)])
+                binary.get(serialized, 'blob')
+                string.dump(self.document, io.StringIO())
+                ''.join(string.iterserialize(self.document))
+
+        self.assertEqual(list(recorder.functions_to_stats.keys()), [
+            'binary.dump',
+            'binary.load_path',
+            'binary.load_path_parallel',
+            'binary.serialize_parallel',
+            'binary.deserialize_parallel',
+            'binary.Decoder.feed',
+            'binary.extract',
+            'binary.project',
+            'binary.get',
+            'string.dump',
+            'string.iterserialize',
+        ])
+        self.assertEqual(recorder.functions_to_stats['binary.Decoder.feed'].calls, 2)
+
+        for function_name in ['binary.load_path', 'binary.serialize_parallel']:
+            stats = recorder.functions_to_stats[function_name]
+            self.assertEqual(stats.calls, 1)
+            self.assertEqual(stats.tags_to_counts[tags.INT32], 3)
+
+        for function_name in ['binary.dump', 'binary.extract', 'string.iterserialize']:
+            stats = recorder.functions_to_stats[function_name]
+            self.assertEqual(stats.calls, 1)
+            self.assertGreater(stats.seconds, 0)
+            self.assertEqual(stats.tags_to_counts, collections.Counter())
+
+    def test_takes_no_census_of_lazy_decodes(self):
+        with instrument.Recorder() as recorder:
+            binary.deserialize(binary.serialize(self.document), lazy = True)
+
+        stats = recorder.functions_to_stats['binary.deserialize']
+        self.assertEqual(stats.calls, 1)
+        self.assertEqual(stats.tags_to_counts, collections.Counter())
+
+    def test_calls_observers_until_they_are_removed(self):
+        calls = []
+        observer = lambda function_name, stats: calls.append((function_name, stats.calls))
+
+        instrument.add_observer(observer)
+        string.serialize(None)
+        instrument.remove_observer(observer)
+        string.serialize(None)
+
+        self.assertEqual(calls, [('string.serialize', 1)])
+        self.assertEqual(instrument._observers, [])
+
+unittest.main()
@@ -0,0 +1,104 @@
+import collections
+import unittest
+
+import ton
+from ton import binary, tags
+
+class TestCompileSchema(unittest.TestCase):
+    def setUp(self):
+        self.fixed = ton.compile_schema(collections.OrderedDict([
+            ('id', tags.INT32),
+            ('active', tags.BOOL),
+            ('parent', tags.VOID),
+            ('delta', tags.INT8),
+            ('timestamp', tags.INT64),
+        ]))
+        self.fixed_record = collections.OrderedDict([
+            ('id', 42),
+            ('active', False),
+            ('parent', None),
+            ('delta', -3),
+            ('timestamp', 1 << 40),
+        ])
+        self.mixed = ton.compile_schema(collections.OrderedDict([
+            ('id', tags.INT32),
+            ('name', tags.UTF8),
+            ('active', tags.BOOL),
+            ('aliases', tags.LIST),
+        ]))
+        self.mixed_record = collections.OrderedDict([
+            ('id', 42),
+            ('name', 'foo'),
+            ('active', True),
+            ('aliases', ['bar', 'baz']),
+        ])
+
+    def test_serializes_like_generic_codec(self):
+        self.assertEqual(
+            self.fixed.serialize(self.fixed_record),
+            binary.serialize(collections.OrderedDict([
+                ('id', 42),
+                ('active', False),
+                ('parent', None),
+                ('delta', tags.TaggedObject(tags.INT8, -3)),
+                ('timestamp', tags.TaggedObject(tags.INT64, 1 << 40)),
+            ])),
+        )
+        self.assertEqual(
+            self.mixed.serialize(self.mixed_record),
+            binary.serialize(self.mixed_record),
+        )
+
+    def test_deserializes_fixed_width_records(self):
+        serialized = self.fixed.serialize(self.fixed_record)
+
+        self.assertEqual(self.fixed.deserialize(serialized), self.fixed_record)
+        self.assertEqual(binary.deserialize(serialized), self.fixed_record)
+
+    def test_deserializes_mixed_records(self):
+        result = self.mixed.deserialize(self.mixed.serialize(self.mixed_record))
+
+        self.assertEqual(list(result.keys()), ['id', 'name', 'active', 'aliases'])
+        self.assertEqual(result['name'], 'foo')
+        self.assertEqual(result['active'], True)
+        self.assertEqual(list(result['aliases']), ['bar', 'baz'])
+
+    def test_falls_back_to_generic_codec_for_other_shapes(self):
+        other = collections.OrderedDict([('foo', 'bar')])
+
+        self.assertEqual(self.fixed.serialize(other), binary.serialize(other))
+        self.assertEqual(self.fixed.deserialize(binary.serialize(other)), other)
+        self.assertEqual(self.mixed.deserialize(binary.serialize(other)), other)
+
+    def test_falls_back_to_generic_codec_for_records_which_do_not_fit(self):
+        replacements = [
+            ('parent', 5),
+            ('active', 1),
+            ('id', True),
+            ('id', '42'),
+            ('id', 1 << 40),
+            ('delta', 128),
+        ]
+
+        for key, value in replacements:
+            record = collections.OrderedDict(self.fixed_record)
+            record[key] = value
+            serialized = self.fixed.serialize(record)
+
+            self.assertEqual(serialized, binary.serialize(record))
+            self.assertEqual(self.fixed.deserialize(serialized), record)
+
+        renamed = collections.OrderedDict(self.fixed_record)
+        renamed['other'] = renamed.pop('delta')
+        self.assertEqual(self.fixed.serialize(renamed), binary.serialize(renamed))
+
+        for key, value in [('name', 42), ('aliases', 'bar'), ('active', None)]:
+            record = collections.OrderedDict(self.mixed_record)
+            record[key] = value
+            self.assertEqual(self.mixed.serialize(record), binary.serialize(record))
+
+    def test_rejects_unsupported_tags(self):
+        with self.assertRaises(Exception):
+            ton.compile_schema({ 'foo': 0xff })
+
+unittest.main()
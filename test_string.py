@@ -1,4 +1,7 @@
 import collections
+import datetime
+import decimal
+import io
 import unittest
 
 from ton import string, tags
@@ -57,6 +60,105 @@ class TestStringSerialize(unittest.TestCase):
             '{ "foo"utf8: 1i32, "bar"utf8: "baz"utf8 }'
         )
 
+    def test_serializes_indexed_dictionary_in_key_order(self):
+        indexed = tags.TaggedObject(tags.INDEXED_DICTIONARY, collections.OrderedDict([
+            ('foo', 1),
+            ('bar', 'baz'),
+        ]))
+
+        self.assertEqual(string.serialize(indexed), '{ "bar"utf8: "baz"utf8, "foo"utf8: 1i32 }')
+        self.assertEqual(
+            string.serialize(indexed, width = 10),
+            '{\n  "bar"utf8: "baz"utf8,\n  "foo"utf8: 1i32\n}',
+        )
+
+    def test_serializes_with_preferred_tags(self):
+        self.assertEqual(
+            string.serialize(
+                collections.OrderedDict([('foo', [1, 300]), ('bar', tags.TaggedObject(tags.INT64, 3))]),
+                preferred_integer_tag = tags.SMALLEST,
+                preferred_string_tag = tags.UTF16,
+            ),
+            '{ "foo"utf16: [1i16, 300i16], "bar"utf16: 3i64 }',
+        )
+
+    def test_serializes_integer_lists_with_one_width(self):
+        items = [tags.TaggedObject(tags.INT8, 1), tags.TaggedObject(tags.INT16, 1000)]
+
+        self.assertEqual(string.serialize(items), '[1i16, 1000i16]')
+        self.assertEqual(string.serialize([1, 1000], width = 4), '[\n  1i32,\n  1000i32\n]')
+
+class TestStringDump(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('foo', 1),
+            ('bar', 'baz'),
+            ('qux', [1, -1]),
+            ('quux', [collections.OrderedDict([('corge', 'grault' * 10)]), []]),
+        ])
+
+    def test_iterserialize_yields_the_serialized_form_in_pieces(self):
+        chunks = list(string.iterserialize(self.document, preferred_integer_tag = tags.INT8))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(
+            ''.join(chunks),
+            string.serialize(self.document, preferred_integer_tag = tags.INT8),
+        )
+
+    def test_dumps_pretty_printed_to_width(self):
+        fp = io.StringIO()
+        string.dump(self.document, fp)
+
+        self.assertEqual(fp.getvalue(), '\n'.join([
+            '{',
+            '  "foo"utf8: 1i32,',
+            '  "bar"utf8: "baz"utf8,',
+            '  "qux"utf8: [1i32, -1i32],',
+            '  "quux"utf8: [',
+            '    {',
+            '      "corge"utf8: "{}"utf8'.format('grault' * 10),
+            '    },',
+            '    []',
+            '  ]',
+            '}',
+        ]))
+        self.assertEqual(string.deserialize(fp.getvalue()), self.document)
+
+    def test_dumps_with_indent_and_compactly(self):
+        fp = io.StringIO()
+        string.dump([[1, 2]], fp, width = 8, indent = 4)
+        self.assertEqual(fp.getvalue(), '[\n    [\n        1i32,\n        2i32\n    ]\n]')
+
+        fp = io.StringIO()
+        string.dump(self.document, fp, width = None)
+        self.assertEqual(fp.getvalue(), string.serialize(self.document))
+
+class TestStringEncoders(unittest.TestCase):
+    def setUp(self):
+        self.types_to_taggers = dict(tags._TYPES_TO_TAGGERS)
+        tags.register_encoder(datetime.date, datetime.date.toordinal)
+        tags.register_encoder(decimal.Decimal, lambda d: int(d) % 1000)
+
+    def tearDown(self):
+        tags._TYPES_TO_TAGGERS.clear()
+        tags._TYPES_TO_TAGGERS.update(self.types_to_taggers)
+        tags._TYPE_TAGGER_CACHE.clear()
+        tags._TYPE_TAGGER_CACHE.update(tags._TYPES_TO_TAGGERS)
+
+    def test_serializes_lists_of_objects_encoded_as_integers(self):
+        self.assertEqual(
+            string.serialize([datetime.date(2020, 1, 1), datetime.date(1, 1, 1)]),
+            string.serialize([737425, 1]),
+        )
+        self.assertEqual(
+            string.serialize(
+                [decimal.Decimal(0), decimal.Decimal(500), decimal.Decimal(1000)],
+                preferred_integer_tag = tags.SMALLEST,
+            ),
+            '[0i16, 500i16, 0i16]',
+        )
+
 class TestStringDeserialize(unittest.TestCase):
     def test_deserializes_null(self):
         self.assertEqual(
@@ -204,4 +306,43 @@ class TestStringDeserialize(unittest.TestCase):
             string.deserialize(' \t\n{ \t\n"foo"utf8 \t\n: \t\n1i32 \t\n, \t\n"bar"utf8 \t\n: \t\n"baz"utf8 \t\n}'),
         )
 
+    def test_deserializes_strings_of_different_encodings_in_one_list(self):
+        self.assertEqual(
+            ['foo', 'bar', 'baz'],
+            string.deserialize('["foo"utf16, "bar"utf8, "baz"utf32]'),
+        )
+
+    def test_deserializes_nested_containers(self):
+        self.assertEqual(
+            collections.OrderedDict([
+                ('foo', [[], [1, 2]]),
+                ('bar', collections.OrderedDict()),
+            ]),
+            string.deserialize('{ "foo"utf8: [[], [1i8, 2i8]], "bar"utf8: {  } }'),
+        )
+
+    def test_deserializes_nesting_deeper_than_the_recursion_limit(self):
+        result = string.deserialize('[' * 10000 + ']' * 10000)
+        depth = 0
+
+        while result:
+            result = result[0]
+            depth += 1
+
+        self.assertEqual(depth, 9999)
+
+    def test_raises_on_nesting_deeper_than_max_depth(self):
+        string.deserialize('{ "a"utf8: [[]] }', max_depth = 3)
+
+        with self.assertRaises(Exception):
+            string.deserialize('{ "a"utf8: [[[]]] }', max_depth = 3)
+
+    def test_raises_on_trailing_comma(self):
+        with self.assertRaises(Exception):
+            string.deserialize('[1i8, 2i8, ]')
+
+    def test_raises_on_trailing_characters(self):
+        with self.assertRaises(Exception):
+            string.deserialize('[1i8, 2i8] 3i8')
+
 unittest.main()
@@ -1,4 +1,6 @@
 import collections
+import enum
+import pickle
 import unittest
 
 from ton import tags
@@ -150,6 +152,9 @@ class AutoTagTests(unittest.TestCase):
         with self.assertRaises(tags.TooWideError):
             tags.autotag(-9223372036854775809, preferred_integer_tag=tags.SMALLEST)
 
+    def test_smallest_keeps_its_identity_when_pickled(self):
+        self.assertIs(pickle.loads(pickle.dumps(tags.SMALLEST)), tags.SMALLEST)
+
     def test_tags_integer_to_preferred_integer_tag(self):
         self.assertEqual(
             tags.autotag(42, preferred_integer_tag = tags.INT8),
@@ -233,4 +238,76 @@ class AutoTagTests(unittest.TestCase):
             ),
         )
 
+    def test_tags_subclasses_of_supported_types(self):
+        class Color(enum.IntEnum):
+            RED = 1
+
+        class Name(str):
+            pass
+
+        self.assertEqual(
+            tags.autotag(Color.RED),
+            tags.TaggedObject(tag = tags.INT32, value = Color.RED),
+        )
+        self.assertEqual(
+            tags.autotag(Name('foo')),
+            tags.TaggedObject(tag = tags.UTF8, value = 'foo'),
+        )
+
+    def test_raises_on_unsupported_type(self):
+        with self.assertRaises(Exception):
+            tags.autotag(object())
+
+class RegisterEncoderTests(unittest.TestCase):
+    def setUp(self):
+        self.types_to_taggers = dict(tags._TYPES_TO_TAGGERS)
+
+    def tearDown(self):
+        tags._TYPES_TO_TAGGERS.clear()
+        tags._TYPES_TO_TAGGERS.update(self.types_to_taggers)
+        tags._TYPE_TAGGER_CACHE.clear()
+        tags._TYPE_TAGGER_CACHE.update(tags._TYPES_TO_TAGGERS)
+
+    def test_tags_registered_types_and_their_subclasses_with_encoder(self):
+        class Point(object):
+            def __init__(self, x, y):
+                self.x = x
+                self.y = y
+
+        class NamedPoint(Point):
+            pass
+
+        tags.register_encoder(Point, lambda p: collections.OrderedDict([('x', p.x), ('y', p.y)]))
+
+        expected = tags.TaggedObject(
+            tag = tags.DICTIONARY,
+            value = collections.OrderedDict([
+                (
+                    tags.TaggedObject(tag = tags.UTF8, value = 'x'),
+                    tags.TaggedObject(tag = tags.INT32, value = 1),
+                ),
+                (
+                    tags.TaggedObject(tag = tags.UTF8, value = 'y'),
+                    tags.TaggedObject(tag = tags.INT32, value = 2),
+                ),
+            ]),
+        )
+
+        self.assertEqual(tags.autotag(Point(1, 2)), expected)
+        self.assertEqual(tags.autotag(NamedPoint(1, 2)), expected)
+
+    def test_encoders_may_return_tagged_objects(self):
+        class Small(object):
+            pass
+
+        tags.register_encoder(Small, lambda s: tags.TaggedObject(tag = tags.INT8, value = 0))
+
+        self.assertEqual(
+            tags.autotag([Small()]),
+            tags.TaggedObject(
+                tag = tags.LIST,
+                value = [tags.TaggedObject(tag = tags.INT8, value = 0)],
+            ),
+        )
+
 unittest.main()
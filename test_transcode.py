@@ -0,0 +1,128 @@
+import collections
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+import ton
+from ton import binary, string, tags, transcode
+
+class TestTranscode(unittest.TestCase):
+    def setUp(self):
+        self.document = collections.OrderedDict([
+            ('integers', [1, -2, 3]),
+            ('records', [collections.OrderedDict([('id', None), ('ok', True)])]),
+            ('binary', b'\xde\xad'),
+            ('text', 'Hello, world'),
+            ('empty list', []),
+            ('empty dictionary', collections.OrderedDict()),
+            ('nested', [[], ['foo'], [False, False]]),
+        ])
+
+    def test_transcodes_binary_to_string_preserving_tags(self):
+        for integer_tag in [tags.INT8, tags.INT16, tags.INT32, tags.INT64]:
+            for string_tag in [tags.UTF8, tags.UTF16, tags.UTF32]:
+                self.assertEqual(
+                    transcode.binary_to_string(binary.serialize(
+                        self.document,
+                        preferred_integer_tag = integer_tag,
+                        preferred_string_tag = string_tag,
+                    )),
+                    string.serialize(
+                        self.document,
+                        preferred_integer_tag = integer_tag,
+                        preferred_string_tag = string_tag,
+                    ),
+                )
+
+    def test_transcodes_string_to_binary_preserving_tags(self):
+        for integer_tag in [tags.INT8, tags.INT16, tags.INT32, tags.INT64]:
+            for string_tag in [tags.UTF8, tags.UTF16, tags.UTF32]:
+                self.assertEqual(
+                    transcode.string_to_binary(string.serialize(
+                        self.document,
+                        preferred_integer_tag = integer_tag,
+                        preferred_string_tag = string_tag,
+                    )),
+                    binary.serialize(
+                        self.document,
+                        preferred_integer_tag = integer_tag,
+                        preferred_string_tag = string_tag,
+                    ),
+                )
+
+    def test_package_functions_round_trip_integer_widths(self):
+        self.assertEqual(ton.binary_to_string(ton.string_to_binary('[1i8, -2i8]')), '[1i8, -2i8]')
+
+    def test_transcodes_legacy_untagged_keys(self):
+        self.assertEqual(
+            transcode.binary_to_string(b'\x41\x00\x00\x00\x09\x00\x00\x00\x01\x00\x00\x00\x03foo\x10\x08'),
+            '{ "foo"utf8: 8i8 }',
+        )
+
+    def test_transcodes_binary_with_a_key_table_to_string(self):
+        self.assertEqual(
+            transcode.binary_to_string(binary.serialize(
+                self.document,
+                preferred_string_tag = tags.UTF16,
+                key_table = True,
+            )),
+            string.serialize(self.document, preferred_string_tag = tags.UTF16),
+        )
+
+    def test_transcodes_compact_binary_to_string(self):
+        self.assertEqual(
+            transcode.binary_to_string(binary.serialize(self.document, compact = True)),
+            string.serialize(self.document),
+        )
+
+    def test_raises_on_indexed_dictionaries_rather_than_drop_their_tag(self):
+        indexed = tags.TaggedObject(tags.INDEXED_DICTIONARY, self.document)
+
+        for document in [indexed, [indexed], collections.OrderedDict([('foo', indexed)])]:
+            for kwargs in [{}, { 'compact': True }]:
+                with self.assertRaises(Exception):
+                    transcode.binary_to_string(binary.serialize(document, **kwargs))
+
+    def test_dumps_binary_as_string(self):
+        fp = io.StringIO()
+        transcode.dump_binary_as_string(binary.serialize(self.document), fp)
+        self.assertEqual(fp.getvalue(), string.serialize(self.document))
+
+    def test_dumps_string_as_binary_to_streams(self):
+        fp = io.BytesIO()
+        fp.write(b'\xff')
+        transcode.dump_string_as_binary(string.serialize(self.document), fp)
+        self.assertEqual(fp.getvalue(), b'\xff' + binary.serialize(self.document))
+
+        # Large enough to be flushed before its headers are known. The file opened for writing is
+        # backpatched, while the one in append mode and the gzip file, which says it is seekable
+        # but can only seek forwards, take the sizing pass.
+        document = [collections.OrderedDict([('bar', 'baz' * 1000)])] * 100
+
+        with tempfile.TemporaryDirectory() as directory:
+            for opener, mode in [(open, 'wb'), (open, 'ab'), (gzip.open, 'wb')]:
+                path = os.path.join(directory, 'document.ton')
+
+                with opener(path, mode) as fp:
+                    fp.write(b'prefix')
+                    transcode.dump_string_as_binary(string.serialize(document), fp)
+
+                with opener(path, 'rb') as fp:
+                    self.assertEqual(fp.read(), b'prefix' + binary.serialize(document))
+
+                os.remove(path)
+
+    def test_raises_on_lists_with_mixed_item_tags(self):
+        with self.assertRaises(Exception):
+            transcode.string_to_binary('[1i8, 2i16]')
+
+    def test_raises_on_trailing_input(self):
+        with self.assertRaises(Exception):
+            transcode.binary_to_string(b'\x00\x00')
+
+        with self.assertRaises(Exception):
+            transcode.string_to_binary('null null')
+
+unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+
+from ton import binary
+
+async def _read_frame(reader):
+    # Reads exactly one serialized object, asking for as many bytes as its headers so far say it has
+    # at least until they give its whole length, so nothing past the end of the object is consumed.
+    frame = b''
+
+    while True:
+        length = binary._frame_length(frame, 0, len(frame))
+
+        if length <= len(frame):
+            return frame
+
+        try:
+            frame += await reader.readexactly(length - len(frame))
+
+        except asyncio.IncompleteReadError as e:
+            # The partial bytes are all those of the object, so that a stream which ends just after
+            # its tag isn't taken to end between objects
+            raise asyncio.IncompleteReadError(frame + e.partial, length)
+
+async def read_object(reader, **kwargs):
+    return binary.deserialize(await _read_frame(reader), **kwargs)
+
+async def write_object(writer, o, **kwargs):
+    # kwargs are the options of binary.serialize()
+    writer.write(binary.serialize(o, **kwargs))
+    await writer.drain()
+
+class _ObjectIterator(object):
+    def __init__(self, reader, kwargs):
+        self._reader = reader
+        self._kwargs = kwargs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            frame = await _read_frame(self._reader)
+
+        except asyncio.IncompleteReadError as e:
+            # Only the end of the stream between objects is a clean end of iteration
+            if e.partial == b'' and self._reader.at_eof():
+                raise StopAsyncIteration
+
+            raise
+
+        return binary.deserialize(frame, **self._kwargs)
+
+def iter_objects(reader, **kwargs):
+    return _ObjectIterator(reader, kwargs)
@@ -1,7 +1,22 @@
+import array
 import collections
+import collections.abc
+import concurrent.futures
+import functools
+import io
+import mmap
+import os
 import struct
+import sys
+from multiprocessing import shared_memory
 
-from ton import tags, _shared
+from ton import instrument, tags
+
+_LENGTH = struct.Struct('!I')
+_LIST_HEADER = struct.Struct('!BII')
+_DICTIONARY_HEADER = struct.Struct('!II')
+_KEY_TABLE_HEADER = struct.Struct('!BII')
+_KEY_TABLE_VERSION = 1
 
 def _binary_serialize_tag_only_type(o):
     return b''
@@ -17,39 +32,22 @@ def _encoder_to_binary_serializer(e):
         return struct.pack('!I', len(encoded)) + encoded
     return serializer
 
-def _binary_serialize_list(items):
-    # TODO Enforce that items are all the same type
-    items = [tags._tag(i) for i in items]
-
-    if len(items) == 0:
-        item_tag = tags.VOID
-    else:
-        item_tag = items[0].tag
-
-    item_serializer = _BINARY_SERIALIZERS[item_tag]
-    items = [item_serializer(i.value) for i in items]
-    item_length = len(items)
-    items = b''.join(items)
-    byte_length = len(items)
-    return struct.pack('!BII', item_tag, byte_length, item_length) + items
-
-def _serialize_key(o):
-    o = tags.autotag(o)
-    assert o.tag in tags.STRING_TAGS
-    return struct.pack('!B', o.tag) + _BINARY_SERIALIZERS[o.tag](o.value)
-
-def _binary_serialize_dict(d):
-    item_length = 0
-    serialized = b''
+_INTEGER_FORMAT_CODES = {
+    tags.INT8: 'b',
+    tags.INT16: 'h',
+    tags.INT32: 'i',
+    tags.INT64: 'q',
+}
 
-    key_serializer = _BINARY_SERIALIZERS[tags.UTF8]
+def _integer_list_format(item_tag, item_length):
+    return '!{}{}'.format(item_length, _INTEGER_FORMAT_CODES[item_tag])
 
-    for key, value in d.items():
-        item_length += 1
-        serialized += _serialize_key(key) + serialize(value)
+def _pack_integers(item_tag, values):
+    # Packs a whole run of integers in one call rather than one struct.pack() per item
+    return struct.pack(_integer_list_format(item_tag, len(values)), *values)
 
-    byte_length = len(serialized)
-    return struct.pack('!II', byte_length, item_length) + serialized
+def _numpy_array_bytes(a):
+    return a.astype(a.dtype.newbyteorder('>'), copy = False).tobytes()
 
 _BINARY_SERIALIZERS = {
     tags.VOID: _binary_serialize_tag_only_type,
@@ -58,17 +56,709 @@ _BINARY_SERIALIZERS = {
     tags.INT8: _pack_format_string_to_binary_serializer('!b'),
     tags.INT16: _pack_format_string_to_binary_serializer('!h'),
     tags.INT32: _pack_format_string_to_binary_serializer('!i'),
+    tags.INT64: _pack_format_string_to_binary_serializer('!q'),
     tags.BINARY: _encoder_to_binary_serializer(lambda b: b),
     tags.UTF8: _encoder_to_binary_serializer(lambda s: s.encode('utf-8')),
     tags.UTF16: _encoder_to_binary_serializer(lambda s: s.encode('utf-16')),
     tags.UTF32: _encoder_to_binary_serializer(lambda s: s.encode('utf-32')),
-    tags.LIST: _binary_serialize_list,
-    tags.DICTIONARY: _binary_serialize_dict,
 }
 
-def serialize(o):
-    o = tags.autotag(o)
-    return struct.pack('!B', o.tag) + _BINARY_SERIALIZERS[o.tag](o.value)
+_TAG_BYTES = [struct.pack('!B', tag) for tag in range(256)]
+
+# Serialization tags each object as it is written, using a tagger from tags._pop_tagger(), rather
+# than building a tagged copy of the whole document first.
+
+def _serialize_key(key, tagger):
+    key = tagger(key)
+    assert key.tag in tags.STRING_TAGS
+    return _TAG_BYTES[key.tag] + _BINARY_SERIALIZERS[key.tag](key.value)
+
+# The compact format, selected with compact=True, writes the same objects with fewer header bytes:
+#
+#     SHORT_UTF8 length:!B bytes                           for UTF-8 strings shorter than 256 bytes
+#     COMPACT_LIST item_tag:!B byte_length:varint item_length:varint items...
+#     COMPACT_DICTIONARY byte_length:varint item_length:varint keys and values...
+#
+# Varints are unsigned LEB128: seven bits per byte, least significant first, with the high bit set
+# on every byte but the last. Other objects are written as in the standard format, which decoders
+# accept anywhere, so compact documents need no marker.
+
+def _pack_varint(n):
+    b = bytearray()
+
+    while n >= 0x80:
+        b.append(n & 0x7f | 0x80)
+        n >>= 7
+
+    b.append(n)
+    return bytes(b)
+
+def _varint_size(n):
+    return max(1, (n.bit_length() + 6) // 7)
+
+_SHORT_LENGTHS = [struct.pack('!B', length) for length in range(256)]
+
+def _serialize_compact_utf8(s):
+    # Returns the tag and bytes of the string s as it is written in the compact format
+    encoded = s.encode('utf-8')
+
+    if len(encoded) < 256:
+        return _TAG_BYTES[tags.SHORT_UTF8] + _SHORT_LENGTHS[len(encoded)] + encoded
+
+    return _TAG_BYTES[tags.UTF8] + _LENGTH.pack(len(encoded)) + encoded
+
+def _serialize_compact_key(key, tagger):
+    key = tagger(key)
+    assert key.tag in tags.STRING_TAGS
+
+    if key.tag == tags.UTF8:
+        return _serialize_compact_utf8(key.value)
+
+    return _TAG_BYTES[key.tag] + _BINARY_SERIALIZERS[key.tag](key.value)
+
+def _list_item_tag(items, tagger):
+    numpy_item_tag = tags._numpy_array_item_tag(items)
+
+    if numpy_item_tag is not None:
+        return numpy_item_tag
+
+    if len(items) == 0:
+        return tags.VOID
+
+    # TODO Enforce that items are all the same type
+    item_tag = tagger(items[0]).tag
+
+    if item_tag in _INTEGER_FORMAT_CODES:
+        return tags._integer_list_item_tag(items, tagger)
+
+    return item_tag
+
+_KEY_REFERENCE_FORMATS = collections.OrderedDict([
+    (tags.KEY_REFERENCE8, struct.Struct('!B')),
+    (tags.KEY_REFERENCE16, struct.Struct('!H')),
+    (tags.KEY_REFERENCE32, struct.Struct('!I')),
+])
+
+def _serialize_key_reference(index):
+    for tag, reference_format in _KEY_REFERENCE_FORMATS.items():
+        if index < 1 << 8 * reference_format.size:
+            return _TAG_BYTES[tag] + reference_format.pack(index)
+
+    raise Exception('More than {} distinct keys'.format(index))
+
+class _KeyTable(object):
+    # With key_table=True, a document starts with a table of its distinct dictionary keys, in the
+    # order they are first written, and keys are written as references to their index in it:
+    #
+    #     KEY_TABLE version:!B byte_length:!I key_length:!I tagged keys... tagged object
+    #
+    # The version is checked before anything else is read, so readers reject versions they don't
+    # know, and readers from before key tables reject the KEY_TABLE tag like any unknown tag.
+    def __init__(self, serialize_key):
+        self._serialize_key = serialize_key
+        self._keys_to_references = {}
+        self._serialized_keys = []
+
+    def reference(self, key, tagger):
+        reference = self._keys_to_references.get(key)
+
+        if reference is None:
+            reference = _serialize_key_reference(len(self._serialized_keys))
+            self._serialized_keys.append(self._serialize_key(key, tagger))
+            self._keys_to_references[key] = reference
+
+        return reference
+
+    def serialize(self):
+        table = b''.join(self._serialized_keys)
+
+        return _TAG_BYTES[tags.KEY_TABLE] + _KEY_TABLE_HEADER.pack(
+            _KEY_TABLE_VERSION,
+            len(table),
+            len(self._serialized_keys),
+        ) + table
+
+class _Writer(object):
+    # Accumulates serialized bytes in a bytearray. If there is an fp, the buffer is flushed to it
+    # between container items once it reaches _DUMP_BUFFER_SIZE. Positions are relative to the
+    # start of the output, which is at origin in fp. Headers are patched in the buffer if they
+    # are still there, and otherwise by seeking fp, so patching flushed output requires an origin.
+    def __init__(self, fp = None, origin = None):
+        self.buffer = bytearray()
+        self.write = self.buffer.extend
+        self._fp = fp
+        self._origin = origin
+        self._flushed = 0
+
+    @property
+    def position(self):
+        return self._flushed + len(self.buffer)
+
+    def flush_if_full(self):
+        if self._fp is not None and len(self.buffer) >= _DUMP_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._fp.write(bytes(self.buffer))
+            self._flushed += len(self.buffer)
+            del self.buffer[:]
+
+    def patch(self, position, b):
+        if position >= self._flushed:
+            start = position - self._flushed
+            self.buffer[start:start + len(b)] = b
+            return
+
+        self.flush()
+        self._fp.seek(self._origin + position)
+        self._fp.write(b)
+        self._fp.seek(self._origin + self._flushed)
+
+# Streams which can seek back over what has been written to them. Others may report that they are
+# seekable but not be, such as gzip.GzipFile, which can only seek forwards while writing, so only
+# these are backpatched and every other stream takes the sizing pass.
+_BACKPATCHABLE_TYPES = (io.BytesIO, io.FileIO, io.BufferedWriter, io.BufferedRandom)
+
+def _can_backpatch(fp):
+    # Files opened in append mode report that they are seekable, but every write goes to their end
+    if not isinstance(fp, _BACKPATCHABLE_TYPES) or not fp.seekable():
+        return False
+
+    mode = getattr(fp, 'mode', '')
+    return not (isinstance(mode, str) and 'a' in mode)
+
+def _write_value(tag, value, writer, sizes, tagger, serialize_key):
+    if tag == tags.LIST:
+        _write_list(value, writer, sizes, tagger, serialize_key)
+
+    elif tag == tags.DICTIONARY:
+        _write_dictionary(value, writer, sizes, tagger, serialize_key)
+
+    elif tag == tags.INDEXED_DICTIONARY:
+        _write_indexed_dictionary(value, writer, sizes, tagger, serialize_key, _write_object)
+
+    else:
+        writer.write(_BINARY_SERIALIZERS[tag](value))
+
+def _write_object(o, writer, sizes, tagger, serialize_key):
+    o = tagger(o)
+    writer.write(_TAG_BYTES[o.tag])
+    _write_value(o.tag, o.value, writer, sizes, tagger, serialize_key)
+
+# Container headers are written from sizes (see _size_value()) if there are sizes, and otherwise
+# written as placeholders and patched once the contents have been written. sizes is an iterator
+# over the sizes of the containers in the order they are written, so they are matched to containers
+# by position rather than by id(), since encoders registered with tags.register_encoder() may
+# return a new container on every call. Keys are written with serialize_key, which is
+# _serialize_key(), or the reference method of a _KeyTable.
+
+def _write_integer_items(items, item_tag, writer, tagger):
+    if tags._numpy_array_item_tag(items) is not None:
+        for start in range(0, len(items), _INTEGER_CHUNK_LENGTH):
+            writer.write(_numpy_array_bytes(items[start:start + _INTEGER_CHUNK_LENGTH]))
+            writer.flush_if_full()
+
+    else:
+        for start in range(0, len(items), _INTEGER_CHUNK_LENGTH):
+            writer.write(_pack_integers(item_tag, [
+                i if type(i) is int else tagger(i).value
+                for i in items[start:start + _INTEGER_CHUNK_LENGTH]
+            ]))
+            writer.flush_if_full()
+
+def _write_list(items, writer, sizes, tagger, serialize_key):
+    item_tag = _list_item_tag(items, tagger)
+    header_position = writer.position
+
+    if sizes is None:
+        writer.write(bytes(_LIST_HEADER.size))
+    else:
+        writer.write(_LIST_HEADER.pack(item_tag, next(sizes), len(items)))
+
+    if item_tag in _INTEGER_FORMAT_CODES:
+        _write_integer_items(items, item_tag, writer, tagger)
+
+    else:
+        for item in items:
+            _write_value(item_tag, tagger(item).value, writer, sizes, tagger, serialize_key)
+            writer.flush_if_full()
+
+    if sizes is None:
+        byte_length = writer.position - header_position - _LIST_HEADER.size
+        writer.patch(header_position, _LIST_HEADER.pack(item_tag, byte_length, len(items)))
+
+def _write_dictionary(d, writer, sizes, tagger, serialize_key):
+    header_position = writer.position
+
+    if sizes is None:
+        writer.write(bytes(_DICTIONARY_HEADER.size))
+    else:
+        writer.write(_DICTIONARY_HEADER.pack(next(sizes), len(d)))
+
+    for key, value in d.items():
+        writer.write(serialize_key(key, tagger))
+        _write_object(value, writer, sizes, tagger, serialize_key)
+        writer.flush_if_full()
+
+    if sizes is None:
+        byte_length = writer.position - header_position - _DICTIONARY_HEADER.size
+        writer.patch(header_position, _DICTIONARY_HEADER.pack(byte_length, len(d)))
+
+# An indexed dictionary has the header of a dictionary, but its byte_length includes a table of the
+# offsets of its entries, which follows the header:
+#
+#     INDEXED_DICTIONARY byte_length:!I item_length:!I offsets:!I... keys and values...
+#
+# Entries are in order of their keys (see tags._indexed_items()), and their offsets are relative to
+# the first entry, so a key can be found by a binary search which decodes only the keys it visits.
+# Values are written with write_object, which is _write_object() or _write_compact_object().
+
+def _pack_offsets(offsets):
+    return struct.pack('!{}I'.format(len(offsets)), *offsets)
+
+def _write_indexed_dictionary(d, writer, sizes, tagger, serialize_key, write_object):
+    items = tags._indexed_items(d, tagger)
+    table_size = _LENGTH.size * len(items)
+    header_position = writer.position
+
+    if sizes is None:
+        writer.write(bytes(_DICTIONARY_HEADER.size + table_size))
+        offsets = []
+    else:
+        byte_length, offsets = next(sizes)
+        writer.write(_DICTIONARY_HEADER.pack(byte_length, len(items)) + _pack_offsets(offsets))
+
+    start = writer.position
+
+    for key, value in items:
+        if sizes is None:
+            offsets.append(writer.position - start)
+
+        writer.write(serialize_key(key, tagger))
+        write_object(value, writer, sizes, tagger, serialize_key)
+        writer.flush_if_full()
+
+    if sizes is None:
+        byte_length = writer.position - start + table_size
+        writer.patch(
+            header_position,
+            _DICTIONARY_HEADER.pack(byte_length, len(items)) + _pack_offsets(offsets),
+        )
+
+def _size_indexed_dictionary(d, sizes, tagger, serialize_key, size_object):
+    # Like _size_value(), but records the offsets of the entries along with the byte_length.
+    # size_object returns the length of an object including its tag.
+    index = len(sizes)
+    sizes.append(None)
+    offsets = []
+    entries_length = 0
+
+    for key, item in tags._indexed_items(d, tagger):
+        item = tagger(item)
+        offsets.append(entries_length)
+        entries_length += len(serialize_key(key, tagger)) + size_object(
+            item.tag,
+            item.value,
+            sizes,
+            tagger,
+            serialize_key,
+        )
+
+    byte_length = _LENGTH.size * len(offsets) + entries_length
+    sizes[index] = (byte_length, offsets)
+    return _DICTIONARY_HEADER.size + byte_length
+
+def _size_object(tag, value, sizes, tagger, serialize_key):
+    return 1 + _size_value(tag, value, sizes, tagger, serialize_key)
+
+def _size_value(tag, value, sizes, tagger, serialize_key):
+    # Returns the serialized length of value without its tag, and appends the byte_length of each
+    # container to the list sizes, in the order they are written, so that headers can be written
+    # before their contents. A container's slot is reserved before its contents are sized.
+    if tag == tags.LIST:
+        index = len(sizes)
+        sizes.append(None)
+        item_tag = _list_item_tag(value, tagger)
+
+        if item_tag in _FIXED_WIDTHS:
+            byte_length = _FIXED_WIDTHS[item_tag] * len(value)
+        else:
+            byte_length = sum(
+                _size_value(item_tag, tagger(i).value, sizes, tagger, serialize_key) for i in value
+            )
+
+        sizes[index] = byte_length
+        return _LIST_HEADER.size + byte_length
+
+    if tag == tags.DICTIONARY:
+        index = len(sizes)
+        sizes.append(None)
+        byte_length = 0
+
+        for key, item in value.items():
+            item = tagger(item)
+            byte_length += len(serialize_key(key, tagger)) + 1 + _size_value(
+                item.tag,
+                item.value,
+                sizes,
+                tagger,
+                serialize_key,
+            )
+
+        sizes[index] = byte_length
+        return _DICTIONARY_HEADER.size + byte_length
+
+    if tag == tags.INDEXED_DICTIONARY:
+        return _size_indexed_dictionary(value, sizes, tagger, serialize_key, _size_object)
+
+    if tag in _FIXED_WIDTHS:
+        return _FIXED_WIDTHS[tag]
+
+    return len(_BINARY_SERIALIZERS[tag](value))
+
+# The compact format always takes a sizing pass, since its headers vary in length. For lists, sizes
+# records the item tag as written along with the byte_length, since the items of lists of strings
+# shorter than 256 bytes are written as SHORT_UTF8, and those of lists of containers as compact
+# containers.
+
+_TAGS_TO_COMPACT_TAGS = {
+    tags.LIST: tags.COMPACT_LIST,
+    tags.DICTIONARY: tags.COMPACT_DICTIONARY,
+}
+
+def _size_compact_object(tag, value, sizes, tagger, serialize_key):
+    # Returns the length of value as written in the compact format, including its tag
+    if tag == tags.LIST:
+        index = len(sizes)
+        sizes.append(None)
+        item_tag = _list_item_tag(value, tagger)
+
+        if item_tag in _FIXED_WIDTHS:
+            byte_length = _FIXED_WIDTHS[item_tag] * len(value)
+
+        elif item_tag in _TAGS_TO_COMPACT_TAGS or item_tag == tags.INDEXED_DICTIONARY:
+            # List items are written without their tags
+            byte_length = sum(
+                _size_compact_object(item_tag, tagger(i).value, sizes, tagger, serialize_key) - 1
+                for i in value
+            )
+            item_tag = _TAGS_TO_COMPACT_TAGS.get(item_tag, item_tag)
+
+        elif item_tag == tags.UTF8:
+            lengths = [len(tagger(i).value.encode('utf-8')) for i in value]
+
+            if max(lengths) < 256:
+                item_tag = tags.SHORT_UTF8
+                byte_length = sum(lengths) + len(lengths)
+            else:
+                byte_length = sum(lengths) + _LENGTH.size * len(lengths)
+
+        else:
+            byte_length = sum(len(_BINARY_SERIALIZERS[item_tag](tagger(i).value)) for i in value)
+
+        sizes[index] = (item_tag, byte_length)
+        return 2 + _varint_size(byte_length) + _varint_size(len(value)) + byte_length
+
+    if tag == tags.DICTIONARY:
+        index = len(sizes)
+        sizes.append(None)
+        byte_length = 0
+
+        for key, item in value.items():
+            item = tagger(item)
+            byte_length += len(serialize_key(key, tagger)) + _size_compact_object(
+                item.tag,
+                item.value,
+                sizes,
+                tagger,
+                serialize_key,
+            )
+
+        sizes[index] = byte_length
+        return 1 + _varint_size(byte_length) + _varint_size(len(value)) + byte_length
+
+    if tag == tags.INDEXED_DICTIONARY:
+        return 1 + _size_indexed_dictionary(
+            value,
+            sizes,
+            tagger,
+            serialize_key,
+            _size_compact_object,
+        )
+
+    if tag == tags.UTF8:
+        length = len(value.encode('utf-8'))
+        return 1 + (1 if length < 256 else _LENGTH.size) + length
+
+    if tag in _FIXED_WIDTHS:
+        return 1 + _FIXED_WIDTHS[tag]
+
+    return 1 + len(_BINARY_SERIALIZERS[tag](value))
+
+def _write_compact_object(o, writer, sizes, tagger, serialize_key):
+    o = tagger(o)
+
+    if o.tag == tags.LIST:
+        writer.write(_TAG_BYTES[tags.COMPACT_LIST])
+        _write_compact_list(o.value, writer, sizes, tagger, serialize_key)
+
+    elif o.tag == tags.DICTIONARY:
+        writer.write(_TAG_BYTES[tags.COMPACT_DICTIONARY])
+        _write_compact_dictionary(o.value, writer, sizes, tagger, serialize_key)
+
+    elif o.tag == tags.INDEXED_DICTIONARY:
+        writer.write(_TAG_BYTES[tags.INDEXED_DICTIONARY])
+        _write_indexed_dictionary(
+            o.value,
+            writer,
+            sizes,
+            tagger,
+            serialize_key,
+            _write_compact_object,
+        )
+
+    elif o.tag == tags.UTF8:
+        writer.write(_serialize_compact_utf8(o.value))
+
+    else:
+        writer.write(_TAG_BYTES[o.tag] + _BINARY_SERIALIZERS[o.tag](o.value))
+
+def _write_compact_list(items, writer, sizes, tagger, serialize_key):
+    item_tag, byte_length = next(sizes)
+    writer.write(_TAG_BYTES[item_tag] + _pack_varint(byte_length) + _pack_varint(len(items)))
+
+    if item_tag in _INTEGER_FORMAT_CODES:
+        _write_integer_items(items, item_tag, writer, tagger)
+
+    elif item_tag == tags.COMPACT_LIST:
+        for item in items:
+            _write_compact_list(tagger(item).value, writer, sizes, tagger, serialize_key)
+            writer.flush_if_full()
+
+    elif item_tag == tags.COMPACT_DICTIONARY:
+        for item in items:
+            _write_compact_dictionary(tagger(item).value, writer, sizes, tagger, serialize_key)
+            writer.flush_if_full()
+
+    elif item_tag == tags.INDEXED_DICTIONARY:
+        for item in items:
+            _write_indexed_dictionary(
+                tagger(item).value,
+                writer,
+                sizes,
+                tagger,
+                serialize_key,
+                _write_compact_object,
+            )
+
+    elif item_tag == tags.SHORT_UTF8:
+        for item in items:
+            encoded = tagger(item).value.encode('utf-8')
+            writer.write(_SHORT_LENGTHS[len(encoded)] + encoded)
+
+    else:
+        serializer = _BINARY_SERIALIZERS[item_tag]
+
+        for item in items:
+            writer.write(serializer(tagger(item).value))
+            writer.flush_if_full()
+
+def _write_compact_dictionary(d, writer, sizes, tagger, serialize_key):
+    writer.write(_pack_varint(next(sizes)) + _pack_varint(len(d)))
+
+    for key, value in d.items():
+        writer.write(serialize_key(key, tagger))
+        _write_compact_object(value, writer, sizes, tagger, serialize_key)
+        writer.flush_if_full()
+
+def _write_compact_document(o, writer, tagger, keys):
+    # Writes o in the compact format, after its key table if keys is a _KeyTable. The sizing pass
+    # fills in the key table, so it can be written first.
+    serialize_key = _serialize_compact_key if keys is None else keys.reference
+    sizes = []
+    tagged = tagger(o)
+    _size_compact_object(tagged.tag, tagged.value, sizes, tagger, serialize_key)
+
+    if keys is not None:
+        writer.write(keys.serialize())
+
+    _write_compact_object(o, writer, iter(sizes), tagger, serialize_key)
+
+_DUMP_BUFFER_SIZE = 64 * 1024
+_INTEGER_CHUNK_LENGTH = 16 * 1024
+
+def _pop_serialize_options(kwargs, function_name):
+    # Pops the serialize() and dump() options out of kwargs, and returns the tagger, a _KeyTable
+    # if key_table=True and otherwise None, and whether to write the compact format
+    compact = bool(kwargs.pop('compact', False))
+    keys = None
+
+    if kwargs.pop('key_table', False):
+        keys = _KeyTable(_serialize_compact_key if compact else _serialize_key)
+
+    return tags._pop_tagger(kwargs, function_name), keys, compact
+
+def serialize(o, **kwargs):
+    tagger, keys, compact = _pop_serialize_options(kwargs, 'serialize()')
+
+    if instrument._observers:
+        return instrument._observe(
+            'binary.serialize',
+            _census,
+            None,
+            _serialize,
+            o,
+            tagger,
+            keys,
+            compact,
+        )
+
+    if keys is not None or compact:
+        return _serialize(o, tagger, keys, compact)
+
+    writer = _Writer()
+    _write_object(o, writer, None, tagger, _serialize_key)
+    return bytes(writer.buffer)
+
+def _serialize(o, tagger, keys, compact):
+    writer = _Writer()
+
+    if compact:
+        _write_compact_document(o, writer, tagger, keys)
+        return bytes(writer.buffer)
+
+    _write_object(o, writer, None, tagger, _serialize_key if keys is None else keys.reference)
+
+    if keys is None:
+        return bytes(writer.buffer)
+
+    # The table is complete once the document has been written
+    return keys.serialize() + writer.buffer
+
+def dump(o, fp, **kwargs):
+    # Headers are backpatched on seekable files and BytesIO, unless they are in append mode.
+    # Otherwise a sizing pass computes them first. A key table has to be written before the document, so it
+    # always takes a sizing pass, which fills in the table as it goes, as does the compact format,
+    # whose headers vary in length.
+    tagger, keys, compact = _pop_serialize_options(kwargs, 'dump()')
+
+    if instrument._observers:
+        instrument._observe('binary.dump', None, None, _dump, o, fp, tagger, keys, compact)
+        return
+
+    _dump(o, fp, tagger, keys, compact)
+
+def _dump(o, fp, tagger, keys, compact):
+    if compact:
+        writer = _Writer(fp)
+        _write_compact_document(o, writer, tagger, keys)
+        writer.flush()
+        return
+
+    serialize_key = _serialize_key if keys is None else keys.reference
+
+    if keys is None and _can_backpatch(fp):
+        origin = fp.tell()
+        sizes = None
+    else:
+        origin = None
+        sizes = []
+        tagged = tagger(o)
+        _size_value(tagged.tag, tagged.value, sizes, tagger, serialize_key)
+        sizes = iter(sizes)
+
+    writer = _Writer(fp, origin)
+
+    if keys is not None:
+        writer.write(keys.serialize())
+
+    _write_object(o, writer, sizes, tagger, serialize_key)
+    writer.flush()
+
+# serialize_parallel() splits the items of a top-level list, or the entries of a top-level
+# dictionary, into chunks which worker processes write as the serial encoder would, so the parent
+# only writes the header and joins the chunks. Workers rebuild the tagger from the options, so
+# encoders registered with tags.register_encoder() must also be registered in the workers, which
+# they are if the workers are forked or the registration happens when a module is imported.
+
+_PARALLEL_CHUNKS_PER_WORKER = 4
+
+def _serialize_items(item_tag, tagger_options, items):
+    tagger = tags._pop_tagger(dict(tagger_options), 'serialize_parallel()')
+    writer = _Writer()
+
+    for item in items:
+        _write_value(item_tag, tagger(item).value, writer, None, tagger, _serialize_key)
+
+    return bytes(writer.buffer)
+
+def _serialize_entries(tagger_options, entries):
+    tagger = tags._pop_tagger(dict(tagger_options), 'serialize_parallel()')
+    writer = _Writer()
+
+    for key, value in entries:
+        writer.write(_serialize_key(key, tagger))
+        _write_object(value, writer, None, tagger, _serialize_key)
+
+    return bytes(writer.buffer)
+
+def serialize_parallel(o, workers = None, **kwargs):
+    # Returns the same bytes as serialize(o, **kwargs), which only takes the tagger options here.
+    # workers defaults to the number of CPUs. Anything else than a list or dictionary of at least
+    # two items, or a list of fixed-width items, which is packed in bulk anyway, is serialized in
+    # this process.
+    tagger_options = dict(kwargs)
+    tagger = tags._pop_tagger(kwargs, 'serialize_parallel()')
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if instrument._observers:
+        return instrument._observe(
+            'binary.serialize_parallel',
+            _census,
+            None,
+            _serialize_parallel,
+            o,
+            workers,
+            tagger,
+            tagger_options,
+        )
+
+    return _serialize_parallel(o, workers, tagger, tagger_options)
+
+def _serialize_parallel(o, workers, tagger, tagger_options):
+    tagged = tagger(o)
+
+    if workers < 2 or tagged.tag not in (tags.LIST, tags.DICTIONARY) or len(tagged.value) < 2:
+        return _serialize(o, tagger, None, False)
+
+    if tagged.tag == tags.LIST:
+        items = tagged.value
+        item_tag = _list_item_tag(items, tagger)
+
+        if item_tag in _FIXED_WIDTHS:
+            return _serialize(o, tagger, None, False)
+
+        serialize_chunk = functools.partial(_serialize_items, item_tag, tagger_options)
+
+    else:
+        items = list(tagged.value.items())
+        serialize_chunk = functools.partial(_serialize_entries, tagger_options)
+
+    chunk_length = -(-len(items) // (workers * _PARALLEL_CHUNKS_PER_WORKER))
+    chunks = (items[start:start + chunk_length] for start in range(0, len(items), chunk_length))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        body = b''.join(executor.map(serialize_chunk, chunks))
+
+    if tagged.tag == tags.LIST:
+        header = _LIST_HEADER.pack(item_tag, len(body), len(items))
+    else:
+        header = _DICTIONARY_HEADER.pack(len(body), len(items))
+
+    return _TAG_BYTES[tagged.tag] + header + body
 
 _BYTE_SIZES_TO_UNPACK_FORMATS = {
     1: '!b',
@@ -77,122 +767,1774 @@ _BYTE_SIZES_TO_UNPACK_FORMATS = {
     8: '!q',
 }
 
-def make_integer_parser(size_in_bytes):
-    unpack_format = _BYTE_SIZES_TO_UNPACK_FORMATS[size_in_bytes]
+# Parsers take the whole source (a byte memoryview) and the offset at which to start, and return a
+# (value, offset) tuple where offset points just past the parsed value. Nothing is sliced except to
+# materialize leaf values, so parsing is linear in the size of the source.
 
-    def integer_parser(source):
-        value = struct.unpack(unpack_format, source[:size_in_bytes])[0]
-        remaining = source[size_in_bytes:]
+def make_integer_parser(size_in_bytes):
+    unpack_from = struct.Struct(_BYTE_SIZES_TO_UNPACK_FORMATS[size_in_bytes]).unpack_from
 
-        return _shared.ParseResult(success = True, value = value, remaining = remaining)
+    def integer_parser(source, offset):
+        return unpack_from(source, offset)[0], offset + size_in_bytes
 
     return integer_parser
 
-def binary64_parser(source):
-    return _shared.ParseResult(
-        success = True,
-        value = struct.unpack('!d', source[:8])[0],
-        remaining = source[8:],
-    )
+_BINARY64 = struct.Struct('!d')
+
+def binary64_parser(source, offset):
+    return _BINARY64.unpack_from(source, offset)[0], offset + 8
 
 def make_string_parser(decoder):
-    def string_parser(source):
-        length = struct.unpack('!I', source[:4])[0]
-        source = source[4:]
-        return _shared.ParseResult(
-            success = True,
-            value = decoder(source[:length]),
-            remaining = source[length:],
-        )
+    def string_parser(source, offset):
+        length = _LENGTH.unpack_from(source, offset)[0]
+        start = offset + 4
+        end = start + length
+
+        if end > len(source):
+            raise Exception('String of length {} at offset {} overruns source'.format(length, offset))
+
+        return decoder(source[start:end]), end
 
     return string_parser
 
-def _list_parser(source):
-    tag = source[0]
-    parser = _TAGS_TO_PARSERS[tag]
+def _short_utf8_parser(source, offset):
+    start = offset + 1
+    end = start + source[offset]
 
-    source = source[1:]
-    byte_length, items_length = struct.unpack('!II', source[:8])
-    source = source[8:]
+    if end > len(source):
+        raise Exception('String of length {} at offset {} overruns source'.format(
+            source[offset],
+            offset,
+        ))
 
-    remaining = source[byte_length:]
-    source = source[:byte_length]
+    return str(source[start:end], 'utf-8'), end
 
-    def item_iterator(source):
-        count = 0
+def _unpack_varint(source, offset):
+    # Returns the varint at offset (see _pack_varint()) and the offset just past it
+    byte = source[offset]
 
-        while len(source) > 0:
-            parse_result = parser(source)
+    if byte < 0x80:
+        return byte, offset + 1
 
-            if parse_result.success:
-                count += 1
-                yield parse_result.value
-                source = parse_result.remaining
+    value = 0
+    shift = 0
 
-        assert count == items_length
-    
-    return _shared.ParseResult(
-        success = True,
-        value = item_iterator(source),
-        remaining = remaining,
-    )
+    while byte >= 0x80:
+        if shift > 63:
+            raise Exception('Varint at offset {} is too long'.format(offset))
 
-def dictionary_parser(source):
-    key_parser = _TAGS_TO_PARSERS[tags.UTF8]
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        offset += 1
+        byte = source[offset]
 
-    byte_length, item_length = struct.unpack('!II', source[:8])
-    source = source[8:]
+    return value | byte << shift, offset + 1
 
-    remaining = source[byte_length:]
-    source = source[:byte_length]
+def _unpack_container_header(source, offset, tag):
+    # Takes the offset just past a container's tag, and returns its item tag, which is None for
+    # dictionaries, its byte_length and item_length, and the offset of its first item
+    if tag == tags.LIST:
+        item_tag, byte_length, item_length = _LIST_HEADER.unpack_from(source, offset)
+        return item_tag, byte_length, item_length, offset + _LIST_HEADER.size
 
-    def kvp_iterator(source):
-        count = 0
+    if tag == tags.DICTIONARY:
+        byte_length, item_length = _DICTIONARY_HEADER.unpack_from(source, offset)
+        return None, byte_length, item_length, offset + _DICTIONARY_HEADER.size
+
+    if tag == tags.INDEXED_DICTIONARY:
+        # The offset table is part of the header here
+        byte_length, item_length = _DICTIONARY_HEADER.unpack_from(source, offset)
+        table_size = _LENGTH.size * item_length
+        start = offset + _DICTIONARY_HEADER.size + table_size
+        return None, byte_length - table_size, item_length, start
+
+    item_tag = None
+
+    if tag == tags.COMPACT_LIST:
+        item_tag = source[offset]
+        offset += 1
 
-        while len(source) > 0:
-            count += 1
-            key_parse_result = key_parser(source)
-            key, source = key_parse_result.value, key_parse_result.remaining
-            value_parse_result = _object_parser(source)
-            value, source = value_parse_result.value, value_parse_result.remaining
+    byte_length, offset = _unpack_varint(source, offset)
+    item_length, offset = _unpack_varint(source, offset)
+    return item_tag, byte_length, item_length, offset
 
-            yield key, value
+def _check_integer_list_length(offset, item_tag, byte_length, item_length):
+    if _FIXED_WIDTHS[item_tag] * item_length != byte_length:
+        raise Exception('List of {} integers at offset {} has byte length {}'.format(
+            item_length,
+            offset,
+            byte_length,
+        ))
 
-        assert count == item_length
+def _unpack_integers(source, offset, item_tag, byte_length, item_length):
+    _check_integer_list_length(offset, item_tag, byte_length, item_length)
+    return struct.unpack_from(_integer_list_format(item_tag, item_length), source, offset)
 
-    return _shared.ParseResult(
-        success = True,
-        value = collections.OrderedDict(kvp_iterator(source)),
-        remaining = remaining,
+def _numpy_integers(source, offset, item_tag, byte_length, item_length):
+    import numpy
+
+    _check_integer_list_length(offset, item_tag, byte_length, item_length)
+    return numpy.frombuffer(
+        source,
+        dtype = _TAGS_TO_NUMPY_DTYPES[item_tag],
+        count = item_length,
+        offset = offset,
     )
 
+_KEY_STRING_TAGS = frozenset(tags.STRING_TAGS | set([tags.SHORT_UTF8]))
+
+def _key_parser(source, offset):
+    tag = source[offset]
+
+    if tag in _KEY_STRING_TAGS:
+        return _TAGS_TO_LEAF_PARSERS[tag](source, offset + 1)
+
+    # Keys written before dictionary keys carried their string encoding tag are bare UTF-8. A bare
+    # key's first byte is the high byte of its length, so this is only ambiguous for keys longer
+    # than 0x31000000 bytes.
+    return _TAGS_TO_LEAF_PARSERS[tags.UTF8](source, offset)
+
+def _make_key_parser(keys):
+    # Returns a key parser which resolves references into the list of keys from a key table
+    key_reference8 = tags.KEY_REFERENCE8
+    key_reference_formats = _KEY_REFERENCE_FORMATS
+
+    def key_parser(source, offset):
+        tag = source[offset]
+
+        try:
+            if tag == key_reference8:
+                return keys[source[offset + 1]], offset + 2
+
+            if tag in key_reference_formats:
+                reference_format = key_reference_formats[tag]
+                index = reference_format.unpack_from(source, offset + 1)[0]
+                return keys[index], offset + 1 + reference_format.size
 
-_TAGS_TO_PARSERS = {
-    tags.VOID: lambda r: _shared.ParseResult(True, None, r),
-    tags.TRUE: lambda r: _shared.ParseResult(True, True, r),
-    tags.FALSE: lambda r: _shared.ParseResult(True, False, r),
+        except IndexError:
+            raise Exception('Key reference at offset {} is outside the key table'.format(offset))
+
+        return _key_parser(source, offset)
+
+    return key_parser
+
+def _parse_key_table(source, offset):
+    # Takes the offset just past a KEY_TABLE tag, and returns the list of (tag, key) in the table
+    # and the offset of the document after it
+    if source[offset] != _KEY_TABLE_VERSION:
+        raise Exception('Unsupported key table version {} at offset {}'.format(
+            source[offset],
+            offset,
+        ))
+
+    _, byte_length, key_length = _KEY_TABLE_HEADER.unpack_from(source, offset)
+    offset += _KEY_TABLE_HEADER.size
+    end = offset + byte_length
+    tagged_keys = []
+
+    while offset < end:
+        tag = source[offset]
+
+        if tag not in _KEY_STRING_TAGS:
+            raise Exception('Key table entry at offset {} is not a tagged string'.format(offset))
+
+        key, offset = _TAGS_TO_LEAF_PARSERS[tag](source, offset + 1)
+        tagged_keys.append((tag, key))
+
+    if offset != end or len(tagged_keys) != key_length:
+        raise Exception('Key table ending at offset {} does not match its header'.format(end))
+
+    return tagged_keys, offset
+
+_TAGS_TO_LEAF_PARSERS = {
+    tags.VOID: lambda source, offset: (None, offset),
+    tags.TRUE: lambda source, offset: (True, offset),
+    tags.FALSE: lambda source, offset: (False, offset),
     tags.INT8: make_integer_parser(1),
     tags.INT16: make_integer_parser(2),
     tags.INT32: make_integer_parser(4),
     tags.INT64: make_integer_parser(8),
-    tags.BINARY: make_string_parser(lambda b : b),
-    tags.UTF8: make_string_parser(lambda b : b.decode('utf-8')),
-    tags.UTF16: make_string_parser(lambda b : b.decode('utf-16')),
-    tags.UTF32: make_string_parser(lambda b : b.decode('utf-32')),
-    tags.LIST: _list_parser,
-    tags.DICTIONARY: dictionary_parser,
+    tags.BINARY: make_string_parser(bytes),
+    tags.UTF8: make_string_parser(lambda b : str(b, 'utf-8')),
+    tags.UTF16: make_string_parser(lambda b : str(b, 'utf-16')),
+    tags.UTF32: make_string_parser(lambda b : str(b, 'utf-32')),
+    tags.SHORT_UTF8: _short_utf8_parser,
 }
 
-def _object_parser(source):
-    return _TAGS_TO_PARSERS[source[0]](source[1:])
+_TAGS_TO_NUMPY_DTYPES = {
+    tags.INT8: '>i1',
+    tags.INT16: '>i2',
+    tags.INT32: '>i4',
+    tags.INT64: '>i8',
+}
 
-def _parse(parser, source):
-    result = parser(source)
+_CONTAINER_TAGS = frozenset([
+    tags.LIST,
+    tags.DICTIONARY,
+    tags.COMPACT_LIST,
+    tags.COMPACT_DICTIONARY,
+    tags.INDEXED_DICTIONARY,
+])
+
+def _make_parsers(lazy, arrays, keys = None):
+    # Returns a table of parsers for a combination of deserialize() options, an object parser
+    # using it, and a document parser which also accepts a key table before the object.
+    # Containers parse their contents with the same table, so options apply at every depth. Each
+    # document with a key table is parsed with parsers made for its keys.
+    tags_to_parsers = dict(_TAGS_TO_LEAF_PARSERS)
+    key_parser = _key_parser if keys is None else _make_key_parser(keys)
+
+    def integer_list_parser(source, offset, item_tag, byte_length, item_length):
+        if arrays == 'numpy':
+            return _numpy_integers(source, offset, item_tag, byte_length, item_length)
+
+        return list(_unpack_integers(source, offset, item_tag, byte_length, item_length))
+
+    def make_lazy_list_parser(tag):
+        def lazy_list_parser(source, offset):
+            item_tag, byte_length, item_length, start = _unpack_container_header(
+                source,
+                offset,
+                tag,
+            )
+            end = start + byte_length
+
+            if item_tag in _INTEGER_FORMAT_CODES and arrays == 'numpy':
+                return integer_list_parser(source, start, item_tag, byte_length, item_length), end
+
+            return ListView(source, offset, tags_to_parsers, tag), end
+
+        return lazy_list_parser
+
+    def make_lazy_dictionary_parser(tag):
+        def lazy_dictionary_parser(source, offset):
+            view = DictionaryView(source, offset, object_parser, key_parser, tag)
+            return view, view._end
+
+        return lazy_dictionary_parser
+
+    # Looked up once here rather than for every container
+    dictionary_tag = tags.DICTIONARY
+    list_tag = tags.LIST
+    ordered_dictionary = collections.OrderedDict
+    unpack_dictionary_header = _DICTIONARY_HEADER.unpack_from
+    dictionary_header_size = _DICTIONARY_HEADER.size
+    unpack_list_header = _LIST_HEADER.unpack_from
+    list_header_size = _LIST_HEADER.size
+
+    def container_parser(source, offset, tag, max_depth = None, items = None):
+        # Parses a container and everything in it using an explicit stack rather than recursion,
+        # so nesting is limited only by max_depth. The innermost open container is held in local
+        # variables, and its parents on the stack. item_tag is None for dictionaries, which count
+        # their items as they go because distinctly tagged keys may decode to the same key. items
+        # is an _ItemCount, if any, which each container's item count is added to as it opens.
+        stack = []
+
+        while True:
+            # Open the container tagged tag at offset
+            if max_depth is not None and len(stack) >= max_depth:
+                raise Exception('Nesting deeper than {} at offset {}'.format(max_depth, offset))
+
+            header_offset = offset
+
+            if tag == dictionary_tag:
+                byte_length, item_length = unpack_dictionary_header(source, offset)
+                offset += dictionary_header_size
+                item_tag = None
+
+            elif tag == list_tag:
+                item_tag, byte_length, item_length = unpack_list_header(source, offset)
+                offset += list_header_size
+
+            else:
+                item_tag, byte_length, item_length, offset = _unpack_container_header(
+                    source,
+                    offset,
+                    tag,
+                )
+
+            end = offset + byte_length
+
+            if items is not None:
+                items.add(item_length, header_offset)
+
+            if item_tag is None:
+                container = ordered_dictionary()
+
+            elif item_tag in _INTEGER_FORMAT_CODES:
+                container = integer_list_parser(source, offset, item_tag, byte_length, item_length)
+                offset = end
+
+            else:
+                container = []
+
+            count = 0
+            key = None
+
+            while True:
+                # Parse items until the container ends or a nested container starts
+                tag = None
+
+                if item_tag is None:
+                    while offset < end:
+                        key, offset = key_parser(source, offset)
+                        tag = source[offset]
+                        offset += 1
+
+                        if tag in _CONTAINER_TAGS:
+                            break
+
+                        container[key], offset = tags_to_parsers[tag](source, offset)
+                        count += 1
+                        tag = None
+
+                # Lists are walked by item count, since items of some tags take no bytes at all
+                elif item_tag in _CONTAINER_TAGS:
+                    if len(container) < item_length:
+                        tag = item_tag
+
+                elif item_tag not in _INTEGER_FORMAT_CODES:
+                    item_parser = tags_to_parsers[item_tag]
+                    append = container.append
+
+                    for _ in range(item_length):
+                        value, offset = item_parser(source, offset)
+                        append(value)
+
+                if tag is not None:
+                    stack.append((container, end, item_tag, item_length, count, key))
+                    break
+
+                if offset != end or (count if item_tag is None else len(container)) != item_length:
+                    raise Exception('Container ending at offset {} does not match its header'.format(
+                        end,
+                    ))
+
+                if not stack:
+                    return container, offset
+
+                value = container
+                container, end, item_tag, item_length, count, key = stack.pop()
+
+                if item_tag is None:
+                    container[key] = value
+                    count += 1
+                else:
+                    container.append(value)
+
+    def object_parser(source, offset, max_depth = None, items = None):
+        tag = source[offset]
+
+        if not lazy and tag in _CONTAINER_TAGS:
+            return container_parser(source, offset + 1, tag, max_depth, items)
+
+        return tags_to_parsers[tag](source, offset + 1)
+
+    def document_parser(source, offset, max_depth = None, items = None):
+        if source[offset] != tags.KEY_TABLE:
+            return object_parser(source, offset, max_depth, items)
+
+        tagged_keys, offset = _parse_key_table(source, offset + 1)
+        document_keys = [sys.intern(key) for _, key in tagged_keys]
+        return _make_parsers(lazy, arrays, document_keys)[1](source, offset, max_depth, items)
+
+    def make_container_parser(tag):
+        return lambda source, offset, max_depth = None, items = None: container_parser(
+            source,
+            offset,
+            tag,
+            max_depth,
+            items,
+        )
+
+    for tag in _CONTAINER_TAGS:
+        if not lazy:
+            tags_to_parsers[tag] = make_container_parser(tag)
+        elif tag in (tags.LIST, tags.COMPACT_LIST):
+            tags_to_parsers[tag] = make_lazy_list_parser(tag)
+        else:
+            tags_to_parsers[tag] = make_lazy_dictionary_parser(tag)
+
+    return tags_to_parsers, object_parser, document_parser
+
+# Skippers, like parsers, take the offset just past an object's tag, but only return the offset
+# just past the object, using the length headers so that containers are skipped in O(1).
+
+def _make_fixed_width_skipper(width):
+    def skipper(source, offset):
+        return offset + width
+
+    return skipper
+
+def _skip_string(source, offset):
+    return offset + _LENGTH.size + _LENGTH.unpack_from(source, offset)[0]
+
+def _skip_list(source, offset):
+    return offset + _LIST_HEADER.size + _LENGTH.unpack_from(source, offset + 1)[0]
+
+def _skip_dictionary(source, offset):
+    return offset + _DICTIONARY_HEADER.size + _LENGTH.unpack_from(source, offset)[0]
+
+def _skip_short_string(source, offset):
+    return offset + 1 + source[offset]
+
+def _make_compact_container_skipper(tag):
+    def skipper(source, offset):
+        _, byte_length, _, start = _unpack_container_header(source, offset, tag)
+        return start + byte_length
+
+    return skipper
+
+_FIXED_WIDTHS = {
+    tags.VOID: 0,
+    tags.TRUE: 0,
+    tags.FALSE: 0,
+    tags.INT8: 1,
+    tags.INT16: 2,
+    tags.INT32: 4,
+    tags.INT64: 8,
+}
+
+_TAGS_TO_SKIPPERS = {
+    tags.BINARY: _skip_string,
+    tags.UTF8: _skip_string,
+    tags.UTF16: _skip_string,
+    tags.UTF32: _skip_string,
+    tags.SHORT_UTF8: _skip_short_string,
+    tags.LIST: _skip_list,
+    tags.DICTIONARY: _skip_dictionary,
+    tags.COMPACT_LIST: _make_compact_container_skipper(tags.COMPACT_LIST),
+    tags.COMPACT_DICTIONARY: _make_compact_container_skipper(tags.COMPACT_DICTIONARY),
+    tags.INDEXED_DICTIONARY: _skip_dictionary,
+}
+
+_TAGS_TO_SKIPPERS.update(
+    (tag, _make_fixed_width_skipper(width)) for tag, width in _FIXED_WIDTHS.items()
+)
+
+def _skip_object(source, offset):
+    return _TAGS_TO_SKIPPERS[source[offset]](source, offset + 1)
+
+def _skip_key(source, offset):
+    tag = source[offset]
+
+    if tag in _KEY_REFERENCE_FORMATS:
+        return offset + 1 + _KEY_REFERENCE_FORMATS[tag].size
+
+    if tag == tags.SHORT_UTF8:
+        return _skip_short_string(source, offset + 1)
+
+    # Untagged keys are legacy bare UTF-8, as in _key_parser()
+    if tag in tags.STRING_TAGS:
+        offset += 1
+
+    return _skip_string(source, offset)
+
+def _skip_key_table(source, offset):
+    return offset + _KEY_TABLE_HEADER.size + _LENGTH.unpack_from(source, offset + 1)[0]
+
+def _census(source):
+    # Returns instrument.Stats for the binary form in source, walking it with skippers rather than
+    # parsing it. Runs of fixed-width list items are counted without visiting each item.
+    source = _as_byte_view(source)
+    stats = instrument.Stats()
+    # The end of each open container, with the item tag of lists and None for dictionaries
+    stack = []
+    offset = 0
+
+    if len(source) > 0 and source[0] == tags.KEY_TABLE:
+        offset = _skip_key_table(source, 1)
+        stats.add(tags.KEY_TABLE, offset)
+
+    while True:
+        start = offset
+
+        if stack and stack[-1][1] is not None:
+            tag = stack[-1][1]
+        else:
+            tag = source[offset]
+            offset += 1
+
+        if tag in _CONTAINER_TAGS:
+            item_tag, byte_length, item_length, offset = _unpack_container_header(
+                source,
+                offset,
+                tag,
+            )
+            stats.add(tag, offset - start)
+            stats.max_depth = max(stats.max_depth, len(stack) + 1)
+
+            if item_tag in _FIXED_WIDTHS:
+                stats.add(item_tag, byte_length, item_length)
+                offset += byte_length
+            else:
+                stack.append((offset + byte_length, item_tag))
+
+        else:
+            offset = _TAGS_TO_SKIPPERS[tag](source, offset)
+            stats.add(tag, offset - start)
+
+        while stack and offset >= stack[-1][0]:
+            stack.pop()
+
+        if not stack:
+            return stats
+
+        if stack[-1][1] is None:
+            start = offset
+            key_tag = source[offset]
+            offset = _skip_key(source, offset)
+
+            # Untagged keys are legacy bare UTF-8, as in _key_parser()
+            if key_tag not in _KEY_STRING_TAGS and key_tag not in _KEY_REFERENCE_FORMATS:
+                key_tag = tags.UTF8
+
+            stats.add_key(key_tag, offset - start)
+
+class ListView(collections.abc.Sequence):
+    # A read-only list backed by the serialized source. Item offsets are computed directly for
+    # fixed-width item tags, and otherwise indexed on first random access. Items are only parsed
+    # when they are accessed.
+    def __init__(self, source, offset, tags_to_parsers, tag = tags.LIST):
+        self._item_tag, byte_length, self._length, self._start = _unpack_container_header(
+            source,
+            offset,
+            tag,
+        )
+        self._source = source
+        self._end = self._start + byte_length
+        self._item_parser = tags_to_parsers[self._item_tag]
+        self._item_width = _FIXED_WIDTHS.get(self._item_tag)
+        self._offsets = None
+
+    def _build_offsets(self):
+        skipper = _TAGS_TO_SKIPPERS[self._item_tag]
+        offsets = array.array('Q')
+        offset = self._start
+
+        while offset < self._end:
+            offsets.append(offset)
+            offset = skipper(self._source, offset)
+
+        if len(offsets) != self._length or offset != self._end:
+            raise Exception('List at offset {} does not match its header'.format(self._start))
+
+        return offsets
+
+    def _offset(self, index):
+        if self._item_width is not None:
+            return self._start + index * self._item_width
+
+        if self._offsets is None:
+            self._offsets = self._build_offsets()
+
+        return self._offsets[index]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+
+        if index < 0:
+            index += self._length
+
+        if index < 0 or index >= self._length:
+            raise IndexError('list index out of range')
+
+        return self._item_parser(self._source, self._offset(index))[0]
+
+    def __iter__(self):
+        if self._item_tag in _INTEGER_FORMAT_CODES:
+            return iter(_unpack_integers(
+                self._source,
+                self._start,
+                self._item_tag,
+                self._end - self._start,
+                self._length,
+            ))
+
+        return self._iterate()
+
+    def _iterate(self):
+        offset = self._start
+
+        for _ in range(self._length):
+            value, offset = self._item_parser(self._source, offset)
+            yield value
+
+    def __repr__(self):
+        return 'ListView({!r})'.format(list(self))
+
+def _search_index(source, start, end, item_length, key, key_parser):
+    # Takes the offset of the first entry of an indexed dictionary, as returned by
+    # _unpack_container_header(), and returns the offset of the value of key, or None if there is
+    # no such key. Keys are all strings, and other keys can't be compared with them.
+    if not isinstance(key, str):
+        return None
+
+    table = start - _LENGTH.size * item_length
+    low = 0
+    high = item_length
+
+    while low < high:
+        middle = (low + high) // 2
+        offset = start + _LENGTH.unpack_from(source, table + _LENGTH.size * middle)[0]
+
+        if offset >= end:
+            raise Exception('Entry at offset {} is outside the dictionary ending at {}'.format(
+                offset,
+                end,
+            ))
+
+        found, offset = key_parser(source, offset)
+
+        if found < key:
+            low = middle + 1
+        elif key < found:
+            high = middle
+        else:
+            return offset
+
+    return None
+
+class DictionaryView(collections.abc.Mapping):
+    # A read-only mapping backed by the serialized source. The first access decodes every key and
+    # records the offset of its value, but values are only parsed when they are accessed. Keys of
+    # indexed dictionaries are looked up by binary search until something iterates over the keys.
+    def __init__(
+        self,
+        source,
+        offset,
+        object_parser,
+        key_parser = _key_parser,
+        tag = tags.DICTIONARY,
+    ):
+        _, byte_length, self._length, self._start = _unpack_container_header(source, offset, tag)
+        self._object_parser = object_parser
+        self._key_parser = key_parser
+        self._source = source
+        self._end = self._start + byte_length
+        self._indexed = tag == tags.INDEXED_DICTIONARY
+        self._value_offsets = None
+
+    def _build_value_offsets(self):
+        value_offsets = collections.OrderedDict()
+        offset = self._start
+
+        while offset < self._end:
+            key, offset = self._key_parser(self._source, offset)
+            value_offsets[key] = offset
+            offset = _skip_object(self._source, offset)
+
+        if offset != self._end:
+            raise Exception('Dictionary at offset {} does not match its header'.format(self._start))
+
+        return value_offsets
+
+    @property
+    def _index(self):
+        if self._value_offsets is None:
+            self._value_offsets = self._build_value_offsets()
+
+        return self._value_offsets
+
+    def _value_offset(self, key):
+        if self._value_offsets is None and self._indexed:
+            return _search_index(
+                self._source,
+                self._start,
+                self._end,
+                self._length,
+                key,
+                self._key_parser,
+            )
+
+        return self._index.get(key)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        value_offset = self._value_offset(key)
+
+        if value_offset is None:
+            raise KeyError(key)
+
+        return self._object_parser(self._source, value_offset)[0]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, key):
+        return self._value_offset(key) is not None
+
+    def __repr__(self):
+        return 'DictionaryView({!r})'.format(list(self.items()))
+
+_PARSERS = {
+    (lazy, arrays): _make_parsers(lazy, arrays)
+    for lazy in (False, True)
+    for arrays in (None, 'numpy')
+}
+
+_TAGS_TO_PARSERS = _PARSERS[(False, None)][0]
+
+class _ItemCount(object):
+    # The number of list items and dictionary entries parsed so far, shared by the parsers of every
+    # object in a document so that max_items limits their total
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.count = 0
+
+    def add(self, count, offset):
+        self.count += count
+
+        if self.count > self.max_items:
+            raise Exception('More than {} items at offset {}'.format(self.max_items, offset))
+
+def _pop_object_parser(kwargs, function_name):
+    # Pops the deserialize() options out of kwargs and returns the object parser they select
+    lazy = kwargs.pop('lazy', False)
+    arrays = kwargs.pop('arrays', None)
+    max_depth = kwargs.pop('max_depth', None)
+    max_items = kwargs.pop('max_items', None)
+
+    if kwargs:
+        raise TypeError("{} got an unexpected keyword argument '{}'".format(
+            function_name,
+            list(kwargs.keys())[0],
+        ))
+
+    if arrays not in (None, 'numpy'):
+        raise Exception('Unsupported arrays option {!r}'.format(arrays))
+
+    document_parser = _PARSERS[(bool(lazy), arrays)][2]
+
+    if max_depth is None and max_items is None:
+        return document_parser
+
+    # Lazy views parse one level at a time, so max_depth and max_items only limit eager parsing.
+    # Lists of null, true or false items take no bytes per item, so without max_items a ten byte
+    # list can claim 2**32 - 1 of them.
+    return lambda source, offset: document_parser(
+        source,
+        offset,
+        max_depth,
+        None if max_items is None else _ItemCount(max_items),
+    )
+
+def _pop_deserialize_options(kwargs, function_name):
+    # Pops the deserialize() options out of kwargs, and returns the object parser they select and
+    # the options themselves, for functions which parse parts of a document
+    lazy = bool(kwargs.get('lazy', False))
+    arrays = kwargs.get('arrays')
+    max_depth = kwargs.get('max_depth')
+    max_items = kwargs.get('max_items')
+    parser = _pop_object_parser(kwargs, function_name)
+    return parser, lazy, arrays, max_depth, max_items
+
+def _as_byte_view(source):
+    view = memoryview(source)
+
+    if view.ndim != 1 or view.format != 'B':
+        view = view.cast('B')
+
+    return view
+
+def _parse(parser, source):
+    source = _as_byte_view(source)
+    value, offset = parser(source, 0)
+
+    if offset == len(source):
+        return value
+
+    raise Exception('Unparsed trailing bytes: {}'.format(bytes(source[offset:])))
+
+def _parse_observed(function_name, parser, lazy, source):
+    # Parses source, reporting it to the observers as function_name if there are any. Lazy views
+    # only parse what is accessed, so there is no census of them, which would read all of source.
+    if instrument._observers:
+        census = None if lazy else _census
+        return instrument._observe(function_name, census, source, _parse, parser, source)
+
+    return _parse(parser, source)
+
+def deserialize(b, **kwargs):
+    parser, lazy, _, _, _ = _pop_deserialize_options(kwargs, 'deserialize()')
+    return _parse_observed('binary.deserialize', parser, lazy, b)
+
+# extract() and project() find the objects at their paths by skipping over everything else using
+# the length headers, so only the keys on the way and the objects at the paths are parsed. Nothing
+# else is checked either, so unlike deserialize() they don't raise on errors elsewhere.
+
+def _document_parsers(source, lazy, arrays):
+    # Returns the parser table and key parser for the document in source, with the keys from its
+    # key table if it has one, and the offset of its object
+    if len(source) == 0 or source[0] != tags.KEY_TABLE:
+        return _PARSERS[(lazy, arrays)][0], _key_parser, 0
+
+    tagged_keys, offset = _parse_key_table(source, 1)
+    keys = [key for _, key in tagged_keys]
+    return _make_parsers(lazy, arrays, keys)[0], _make_key_parser(keys), offset
+
+def _find_values(source, tag, start, end, item_length, keys, key_parser):
+    # Returns a dictionary of each of keys which is in the dictionary tagged tag, whose first entry
+    # is at start, to the offset of its value. Indexed dictionaries are binary searched for each
+    # key, and others are walked once, skipping over values, until every key has been found.
+    if tag == tags.INDEXED_DICTIONARY:
+        keys_to_offsets = {}
+
+        for key in keys:
+            value_offset = _search_index(source, start, end, item_length, key, key_parser)
+
+            if value_offset is not None:
+                keys_to_offsets[key] = value_offset
+
+        return keys_to_offsets
+
+    keys_to_offsets = {}
+    offset = start
+
+    while offset < end and len(keys_to_offsets) < len(keys):
+        key, offset = key_parser(source, offset)
+
+        if key in keys and key not in keys_to_offsets:
+            keys_to_offsets[key] = offset
+
+        offset = _skip_object(source, offset)
+
+    return keys_to_offsets
+
+def _locate_children(source, tag, offset, steps, key_parser):
+    # Takes the offset just past the tag of a container, and a set of keys or indexes into it, and
+    # returns a dictionary of each of them to the (tag, offset) of the object it selects, with the
+    # offset just past the tag as parsers take it. List items have the item tag of their list.
+    # Raises KeyError and IndexError like looking them up in the deserialized container would.
+    if tag not in _CONTAINER_TAGS:
+        raise Exception('Expected a container at offset {}, found tag 0x{:02x}'.format(
+            offset - 1,
+            tag,
+        ))
+
+    item_tag, byte_length, item_length, start = _unpack_container_header(source, offset, tag)
+    end = start + byte_length
+
+    if item_tag is None:
+        keys = set(step for step in steps if isinstance(step, str))
+        keys_to_offsets = _find_values(source, tag, start, end, item_length, keys, key_parser)
+        children = {}
+
+        for key in steps:
+            if key not in keys_to_offsets:
+                raise KeyError(key)
+
+            children[key] = (source[keys_to_offsets[key]], keys_to_offsets[key] + 1)
+
+        return children
+
+    steps_to_indexes = {}
+
+    for step in steps:
+        if not isinstance(step, int):
+            raise TypeError('list indices must be integers, not {}'.format(type(step).__name__))
+
+        index = step + item_length if step < 0 else step
+
+        if index < 0 or index >= item_length:
+            raise IndexError('list index {} out of range'.format(step))
+
+        steps_to_indexes[step] = index
+
+    width = _FIXED_WIDTHS.get(item_tag)
+
+    if width is not None:
+        return {
+            step: (item_tag, start + index * width)
+            for step, index in steps_to_indexes.items()
+        }
+
+    # Items are skipped in order up to each index in turn
+    skipper = _TAGS_TO_SKIPPERS[item_tag]
+    indexes_to_offsets = {}
+    index = 0
+    offset = start
+
+    for wanted in sorted(set(steps_to_indexes.values())):
+        while index < wanted:
+            offset = skipper(source, offset)
+            index += 1
+
+        if offset >= end:
+            raise Exception('Item {} at offset {} is outside the list ending at offset {}'.format(
+                wanted,
+                offset,
+                end,
+            ))
+
+        indexes_to_offsets[wanted] = offset
+
+    return {
+        step: (item_tag, indexes_to_offsets[index])
+        for step, index in steps_to_indexes.items()
+    }
+
+def _project(b, paths, kwargs, function_name, observed_name):
+    _, lazy, arrays, max_depth, max_items = _pop_deserialize_options(kwargs, function_name)
+    paths = [tuple(path) for path in paths]
+
+    # There is no census, since that would read the whole document
+    if instrument._observers:
+        return instrument._observe(
+            observed_name,
+            None,
+            b,
+            _project_paths,
+            b,
+            paths,
+            lazy,
+            arrays,
+            max_depth,
+            max_items,
+        )
+
+    return _project_paths(b, paths, lazy, arrays, max_depth, max_items)
+
+def _project_paths(b, paths, lazy, arrays, max_depth, max_items):
+    source = _as_byte_view(b)
+    tags_to_parsers, key_parser, offset = _document_parsers(source, lazy, arrays)
+
+    # The objects at every prefix of every path, by path, located a level at a time so that the
+    # children of each container are all found in one walk over it
+    located = { (): (source[offset], offset + 1) }
+    depth = 0
+
+    while True:
+        parents_to_steps = collections.OrderedDict()
+
+        for path in paths:
+            if len(path) > depth:
+                parents_to_steps.setdefault(path[:depth], set()).add(path[depth])
+
+        if not parents_to_steps:
+            break
+
+        for parent, steps in parents_to_steps.items():
+            tag, parent_offset = located[parent]
+            children = _locate_children(source, tag, parent_offset, steps, key_parser)
+
+            for step, child in children.items():
+                located[parent + (step,)] = child
+
+        depth += 1
+
+    # max_items limits the total over every path
+    items = None if max_items is None else _ItemCount(max_items)
+    values = []
+
+    for path in paths:
+        tag, offset = located[path]
+        parser = tags_to_parsers[tag]
+
+        if lazy or tag not in _CONTAINER_TAGS:
+            values.append(parser(source, offset)[0])
+            continue
+
+        # Each step along the path is into a container one level deeper
+        path_max_depth = None
+
+        if max_depth is not None:
+            if max_depth < len(path):
+                raise Exception('Nesting deeper than {} at offset {}'.format(max_depth, offset))
+
+            path_max_depth = max_depth - len(path)
+
+        values.append(parser(source, offset, path_max_depth, items)[0])
+
+    return values
+
+def extract(b, path, **kwargs):
+    # Returns the object at path in the document in b, where path is a sequence of dictionary keys
+    # and list indexes, so extract(b, ('users', 3, 'email')) is deserialize(b)['users'][3]['email'],
+    # but parses only the keys on the way and the email. deserialize() options apply to the object.
+    return _project(b, [path], kwargs, 'extract()', 'binary.extract')[0]
+
+def project(b, paths, **kwargs):
+    # Returns a list of the objects at each of paths, as extract() would, but walks each container
+    # only once for every path through it
+    return _project(b, paths, kwargs, 'project()', 'binary.project')
+
+def get(b, key, **kwargs):
+    # Returns deserialize(b, **kwargs)[key] for a document which is a dictionary. Keys of indexed
+    # dictionaries are found by binary search, so only about log2(len) keys are parsed.
+    return _project(b, [(key,)], kwargs, 'get()', 'binary.get')[0]
+
+# validate() walks a document like _census(), checking every header against what follows it and
+# against the container it is in, without parsing anything but strings, which are decoded to check
+# their encoding and then dropped. Runs of fixed-width list items are checked without visiting
+# each item.
+
+class ValidationError(Exception):
+    def __init__(self, message, offset):
+        super(ValidationError, self).__init__('{} at offset {}'.format(message, offset))
+        self.offset = offset
+
+_TAGS_TO_ENCODINGS = {
+    tags.UTF8: 'utf-8',
+    tags.UTF16: 'utf-16',
+    tags.UTF32: 'utf-32',
+    tags.SHORT_UTF8: 'utf-8',
+}
+
+_VALID_TAGS = frozenset(set(_TAGS_TO_LEAF_PARSERS) | _CONTAINER_TAGS)
+
+def _validate_string(source, offset, end, tag):
+    # Takes the offset just past the tag of a string which must end by end, and returns the string
+    # if it is encoded text, and the offset just past it
+    if tag == tags.SHORT_UTF8:
+        if offset >= end:
+            raise ValidationError('String length overruns its container', offset)
+
+        start = offset + 1
+        stop = start + source[offset]
+
+    else:
+        if offset + _LENGTH.size > end:
+            raise ValidationError('String length overruns its container', offset)
+
+        start = offset + _LENGTH.size
+        stop = start + _LENGTH.unpack_from(source, offset)[0]
+
+    if stop > end:
+        raise ValidationError('String of length {} overruns its container'.format(
+            stop - start,
+        ), offset)
+
+    encoding = _TAGS_TO_ENCODINGS.get(tag)
+
+    if encoding is None:
+        return None, stop
+
+    try:
+        return str(source[start:stop], encoding), stop
+    except UnicodeDecodeError as e:
+        raise ValidationError('Invalid {} string: {}'.format(encoding, e.reason), start + e.start)
+
+def _validate_key(source, offset, end, keys):
+    # Returns the key at offset, which must end by end, and the offset just past it. keys is the
+    # list of keys in the key table, or None if there isn't one.
+    if offset >= end:
+        raise ValidationError('Key overruns its container', offset)
+
+    tag = source[offset]
+
+    if tag in _KEY_REFERENCE_FORMATS:
+        reference_format = _KEY_REFERENCE_FORMATS[tag]
+        stop = offset + 1 + reference_format.size
+
+        if stop > end:
+            raise ValidationError('Key reference overruns its container', offset)
+
+        index = reference_format.unpack_from(source, offset + 1)[0]
+
+        if keys is None or index >= len(keys):
+            raise ValidationError('Key reference {} is outside the key table'.format(index), offset)
+
+        return keys[index], stop
+
+    if tag in _KEY_STRING_TAGS:
+        return _validate_string(source, offset + 1, end, tag)
+
+    # Untagged keys are legacy bare UTF-8, as in _key_parser()
+    return _validate_string(source, offset, end, tags.UTF8)
+
+def _validate_key_table(source):
+    # Takes a source starting with a key table, and returns its keys and the offset just past it
+    if len(source) < 1 + _KEY_TABLE_HEADER.size:
+        raise ValidationError('Key table header overruns source', 1)
+
+    version, byte_length, key_length = _KEY_TABLE_HEADER.unpack_from(source, 1)
+
+    if version != _KEY_TABLE_VERSION:
+        raise ValidationError('Unsupported key table version {}'.format(version), 1)
+
+    offset = 1 + _KEY_TABLE_HEADER.size
+    end = offset + byte_length
+
+    if end > len(source):
+        raise ValidationError('Key table of byte length {} overruns source'.format(byte_length), 1)
+
+    keys = []
+
+    while offset < end:
+        tag = source[offset]
+
+        if tag not in _KEY_STRING_TAGS:
+            raise ValidationError('Key table entry is not a tagged string', offset)
+
+        key, offset = _validate_string(source, offset + 1, end, tag)
+        keys.append(key)
+
+    if len(keys) != key_length:
+        raise ValidationError('Key table has {} keys but its header says {}'.format(
+            len(keys),
+            key_length,
+        ), 1)
+
+    return keys, offset
+
+def _validate_container_header(source, offset, end, tag):
+    # Like _unpack_container_header(), but checks that the header and the contents fit before end,
+    # and returns the offset of the table of an indexed dictionary, or None, after the others
+    header_end = offset + {
+        tags.LIST: _LIST_HEADER.size,
+        tags.DICTIONARY: _DICTIONARY_HEADER.size,
+        tags.INDEXED_DICTIONARY: _DICTIONARY_HEADER.size,
+    }.get(tag, 0)
+
+    if tag == tags.COMPACT_LIST or tag == tags.COMPACT_DICTIONARY:
+        fits = _compact_header_end(source, offset, end, tag) <= end
+    else:
+        fits = header_end <= end
+
+    if not fits:
+        raise ValidationError('Container header overruns its container', offset)
+
+    try:
+        item_tag, byte_length, item_length, start = _unpack_container_header(source, offset, tag)
+    except Exception:
+        raise ValidationError('Invalid container header', offset)
+
+    table = None
+
+    if tag == tags.INDEXED_DICTIONARY:
+        table = header_end
+
+        if start > end:
+            raise ValidationError('Index of {} entries overruns its container'.format(
+                item_length,
+            ), offset)
+
+    if byte_length < 0 or start + byte_length > end:
+        raise ValidationError('Container of byte length {} overruns its container'.format(
+            byte_length,
+        ), offset)
+
+    if item_tag is not None and item_tag not in _VALID_TAGS:
+        raise ValidationError('Unknown item tag 0x{:02x}'.format(item_tag), offset)
+
+    return item_tag, byte_length, item_length, start, table
+
+def _validate(source, text, max_depth, max_items):
+    # Like container_parser() in _make_parsers(), this walks the items of the innermost open
+    # container in an inner loop, with its parents on a stack. The common cases are checked inline,
+    # and anything wrong is reported by the _validate_*() function for its case. text is what
+    # source views if slicing that is faster than slicing a memoryview, and otherwise None. If it
+    # is all ASCII, so are all the strings in it, and they aren't decoded.
+    keys = None
+    offset = 0
+
+    if len(source) > 0 and source[0] == tags.KEY_TABLE:
+        keys, offset = _validate_key_table(source)
+
+    # Looked up once here rather than for every object
+    binary_tag = tags.BINARY
+    utf8_tag = tags.UTF8
+    short_utf8_tag = tags.SHORT_UTF8
+    key_reference8_tag = tags.KEY_REFERENCE8
+    list_tag = tags.LIST
+    dictionary_tag = tags.DICTIONARY
+    compact_tags = frozenset([tags.COMPACT_LIST, tags.COMPACT_DICTIONARY])
+    key_count = 0 if keys is None else len(keys)
+    unpack_length = _LENGTH.unpack_from
+    unpack_list_header = _LIST_HEADER.unpack_from
+    unpack_dictionary_header = _DICTIONARY_HEADER.unpack_from
+    valid_tags = _VALID_TAGS
+    container_tags = _CONTAINER_TAGS
+    fixed_widths = _FIXED_WIDTHS
+    # Mappings have no isascii(), and slices of memoryviews have none either, so without text
+    # strings are sliced from source and always decoded
+    ascii_text = type(text) in (bytes, bytearray) and text.isascii()
+    decode_all = text is None
+    text = source if text is None else text
+    # The total item count of the containers opened so far
+    items = 0
+
+    def leaf_end(tag, offset, end):
+        # Returns the offset just past the leaf tagged tag, which starts at offset
+        if tag in fixed_widths:
+            if offset + fixed_widths[tag] > end:
+                raise ValidationError('Object overruns its container', offset)
+
+            return offset + fixed_widths[tag]
+
+        if tag == short_utf8_tag and offset < end:
+            start = offset + 1
+            stop = start + source[offset]
+
+        elif (tag == utf8_tag or tag == binary_tag) and offset + 4 <= end:
+            start = offset + 4
+            stop = start + unpack_length(source, offset)[0]
+
+        else:
+            return _validate_string(source, offset, end, tag)[1]
+
+        if stop > end:
+            _validate_string(source, offset, end, tag)
+
+        if tag != binary_tag and not ascii_text:
+            encoded = text[start:stop]
+
+            if decode_all or not encoded.isascii():
+                try:
+                    str(encoded, 'utf-8')
+                except UnicodeDecodeError:
+                    _validate_string(source, offset, end, tag)
+
+        return stop
+
+    stack = []
+    end = len(source)
+
+    if offset >= end:
+        raise ValidationError('Object overruns its container', offset)
+
+    tag = source[offset]
+
+    if tag not in valid_tags:
+        raise ValidationError('Unknown tag 0x{:02x}'.format(tag), offset)
+
+    offset += 1
+
+    if tag not in container_tags:
+        offset = leaf_end(tag, offset, end)
+
+        if offset != end:
+            raise ValidationError('Unparsed trailing bytes', offset)
+
+        return
+
+    while True:
+        # Open the container tagged tag at offset, which must end by end
+        if max_depth is not None and len(stack) >= max_depth:
+            raise ValidationError('Nesting deeper than {}'.format(max_depth), offset)
+
+        if tag == dictionary_tag and offset + 8 <= end:
+            byte_length, item_length = unpack_dictionary_header(source, offset)
+            item_tag = table = None
+            start = offset + 8
+
+        elif tag == list_tag and offset + 9 <= end:
+            item_tag, byte_length, item_length = unpack_list_header(source, offset)
+            table = None
+            start = offset + 9
+
+        elif tag in compact_tags:
+            # A header which overruns end is caught below, as is one which overruns source here
+            try:
+                item_tag, byte_length, item_length, start = _unpack_container_header(
+                    source,
+                    offset,
+                    tag,
+                )
+                table = None
+            except Exception:
+                start = None
+
+        else:
+            start = None
+
+        if start is None or start + byte_length > end or (
+            item_tag is not None and item_tag not in valid_tags
+        ):
+            item_tag, byte_length, item_length, start, table = _validate_container_header(
+                source,
+                offset,
+                end,
+                tag,
+            )
+
+        header_offset = offset
+        offset = start
+        end = start + byte_length
+        count = 0
+        items += item_length
+
+        if max_items is not None and items > max_items:
+            raise ValidationError('More than {} items'.format(max_items), header_offset)
+        # The previous key of an indexed dictionary
+        previous_key = None
+
+        if item_tag in fixed_widths:
+            if fixed_widths[item_tag] * item_length != byte_length:
+                raise ValidationError('List of {} items has byte length {}'.format(
+                    item_length,
+                    byte_length,
+                ), header_offset)
+
+            offset = end
+            count = item_length
+
+        while True:
+            # Check items until the container ends or a nested container starts
+            tag = None
+
+            if item_tag is None:
+                while offset < end and count < item_length:
+                    if table is None:
+                        key_tag = source[offset]
+                        stop = None
+
+                        if key_tag == key_reference8_tag and offset + 2 <= end:
+                            if source[offset + 1] < key_count:
+                                stop = offset + 2
+
+                        elif key_tag == utf8_tag and offset + 5 <= end:
+                            key_start = offset + 5
+                            stop = key_start + unpack_length(source, offset + 1)[0]
+
+                        elif key_tag == short_utf8_tag and offset + 2 <= end:
+                            key_start = offset + 2
+                            stop = key_start + source[offset + 1]
+
+                        if stop is None or stop > end or (
+                            key_tag != key_reference8_tag
+                            and not ascii_text
+                            and (decode_all or not text[key_start:stop].isascii())
+                        ):
+                            _, stop = _validate_key(source, offset, end, keys)
+
+                        offset = stop
+
+                    else:
+                        # Each offset in the table must point at its entry, and keys must be in
+                        # order for binary search
+                        index_entry = table + 4 * count
+
+                        if start + unpack_length(source, index_entry)[0] != offset:
+                            raise ValidationError(
+                                'Index entry does not match its entry',
+                                index_entry,
+                            )
+
+                        key_offset = offset
+                        key, offset = _validate_key(source, offset, end, keys)
+
+                        if previous_key is not None and key < previous_key:
+                            raise ValidationError(
+                                'Indexed dictionary keys are out of order',
+                                key_offset,
+                            )
+
+                        previous_key = key
+
+                    if offset >= end:
+                        raise ValidationError('Dictionary value overruns its container', offset)
+
+                    tag = source[offset]
+
+                    if tag not in valid_tags:
+                        raise ValidationError('Unknown tag 0x{:02x}'.format(tag), offset)
+
+                    offset += 1
+                    count += 1
+
+                    if tag in container_tags:
+                        break
+
+                    if tag in fixed_widths and offset + fixed_widths[tag] <= end:
+                        offset += fixed_widths[tag]
+                    else:
+                        offset = leaf_end(tag, offset, end)
+
+                    tag = None
+
+            elif item_tag in container_tags:
+                if count < item_length:
+                    tag = item_tag
+                    count += 1
+
+            elif count < item_length:
+                for _ in range(item_length):
+                    offset = leaf_end(item_tag, offset, end)
+
+                count = item_length
+
+            if tag is not None:
+                stack.append((end, item_tag, item_length, table, start, count, previous_key))
+                break
+
+            if count != item_length:
+                raise ValidationError('Container has fewer items than its header says', offset)
+
+            if offset != end:
+                raise ValidationError('Container items end before its byte length', offset)
+
+            if not stack:
+                if offset != len(source):
+                    raise ValidationError('Unparsed trailing bytes', offset)
+
+                return
+
+            end, item_tag, item_length, table, start, count, previous_key = stack.pop()
+
+def validate(b, **kwargs):
+    # Raises a ValidationError with the offset of the first error if b is not a document which
+    # deserialize() would accept, checking every tag, header and string, and that there are no
+    # trailing bytes. The offset tables of indexed dictionaries are checked too, which deserialize()
+    # doesn't read. max_depth and max_items limit nesting and the total number of list items and
+    # dictionary entries as they do for deserialize(). A list of null, true or false items takes
+    # no bytes per item, so a ten byte document can claim 2**32 - 1 of them, and untrusted input
+    # should be checked with max_items here and deserialized with it too. b is never copied.
+    max_depth = kwargs.pop('max_depth', None)
+    max_items = kwargs.pop('max_items', None)
+
+    if kwargs:
+        raise TypeError("validate() got an unexpected keyword argument '{}'".format(
+            list(kwargs.keys())[0],
+        ))
+
+    source = _as_byte_view(b)
+    text = b if type(b) in (bytes, bytearray, mmap.mmap) else None
+    _validate(source, text, max_depth, max_items)
+
+_FRAME_HEADER_SIZES = {
+    tags.BINARY: _LENGTH.size,
+    tags.UTF8: _LENGTH.size,
+    tags.UTF16: _LENGTH.size,
+    tags.UTF32: _LENGTH.size,
+    tags.SHORT_UTF8: 1,
+    tags.LIST: _LIST_HEADER.size,
+    tags.DICTIONARY: _DICTIONARY_HEADER.size,
+    tags.INDEXED_DICTIONARY: _DICTIONARY_HEADER.size,
+}
+
+_FRAME_HEADER_SIZES.update((tag, 0) for tag in _FIXED_WIDTHS)
+
+def _compact_header_end(source, offset, end, tag):
+    # Returns the offset just past the header of the compact container tagged tag, which starts at
+    # offset, if it is all before end, and otherwise the offset it ends at at least, which is after
+    # end. Each varint ends with the first byte without its high bit set, and takes at least one.
+    if tag == tags.COMPACT_LIST:
+        offset += 1
+
+    for _ in range(2):
+        while offset < end and source[offset] >= 0x80:
+            offset += 1
+
+        offset += 1
+
+    return offset
+
+def _frame_length(source, offset, end):
+    # Returns the length, including the tag, of the object starting at offset if source[offset:end]
+    # holds all of its headers. Otherwise it returns the length the object has at least, up to the
+    # end of the next header, which is more than end - offset. Either way the whole object is there
+    # only if the result is at most end - offset. Only the tag and length headers are read.
+    if offset >= end:
+        return 1
+
+    tag = source[offset]
+
+    if tag == tags.KEY_TABLE:
+        if end - offset - 1 < _KEY_TABLE_HEADER.size:
+            return 1 + _KEY_TABLE_HEADER.size
+
+        document_offset = _skip_key_table(source, offset + 1)
+        return document_offset + _frame_length(source, document_offset, end) - offset
+
+    if tag == tags.COMPACT_LIST or tag == tags.COMPACT_DICTIONARY:
+        header_end = _compact_header_end(source, offset + 1, end, tag)
+
+        if header_end > end:
+            return header_end - offset
+
+    elif tag not in _FRAME_HEADER_SIZES:
+        raise Exception('Unknown tag 0x{:02x} at offset {}'.format(tag, offset))
+
+    elif end - offset - 1 < _FRAME_HEADER_SIZES[tag]:
+        return 1 + _FRAME_HEADER_SIZES[tag]
+
+    return _TAGS_TO_SKIPPERS[tag](source, offset + 1) - offset
+
+class Decoder(object):
+    # Decodes a stream of concatenated objects that arrives in arbitrary chunks. Partial objects
+    # are buffered until the rest of their bytes are fed.
+    def __init__(self, **kwargs):
+        self._object_parser, self._lazy, _, _, _ = _pop_deserialize_options(
+            kwargs,
+            'Decoder()',
+        )
+        self._buffer = bytearray()
+        self._start = 0
+
+    def feed(self, chunk):
+        if self._start > 0:
+            del self._buffer[:self._start]
+            self._start = 0
+
+        self._buffer += chunk
+        return self._objects()
+
+    def _objects(self):
+        while True:
+            length = _frame_length(self._buffer, self._start, len(self._buffer))
+
+            if self._start + length > len(self._buffer):
+                return
+
+            frame = bytes(self._buffer[self._start:self._start + length])
+            self._start += length
+            yield _parse_observed('binary.Decoder.feed', self._object_parser, self._lazy, frame)
+
+    def close(self):
+        if len(self._buffer) > self._start:
+            raise Exception('Incomplete object in last {} bytes'.format(
+                len(self._buffer) - self._start,
+            ))
+
+def _map_path(path):
+    # Empty files can't be mapped
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+
+        return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+def load_path(path, **kwargs):
+    # The file is mapped rather than read, so with lazy=True only the pages that are touched are
+    # read into memory. The mapping is released when nothing refers to the result any longer.
+    parser, lazy, _, _, _ = _pop_deserialize_options(kwargs, 'load_path()')
+    return _parse_observed('binary.load_path', parser, lazy, _map_path(path))
+
+# deserialize_parallel() and load_path_parallel() find runs of the items of a top-level list, or the
+# entries of a top-level dictionary, by skipping over them using their length headers, and parse
+# the runs in worker processes. Workers read the source from shared memory, or map the file
+# themselves, so only the parsed values are sent back, and the parent joins them in order.
+
+# Sources opened in this worker process, by (kind, name, length). They stay open for the life of the
+# worker, since values parsed with arrays='numpy' refer to them until they are sent back.
+_worker_sources = {}
+
+def _open_worker_source(source_spec):
+    if source_spec not in _worker_sources:
+        kind, name, length = source_spec
+
+        if kind == 'path':
+            with open(name, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            mapping = shared_memory.SharedMemory(name = name)
+
+        source = memoryview(mapping if kind == 'path' else mapping.buf)[:length]
+        keys = None
+
+        if length > 0 and source[0] == tags.KEY_TABLE:
+            tagged_keys, _ = _parse_key_table(source, 1)
+            keys = [sys.intern(key) for _, key in tagged_keys]
+
+        _worker_sources[source_spec] = (mapping, source, keys)
+
+    return _worker_sources[source_spec]
+
+def _parse_run(source_spec, arrays, max_depth, max_items, item_tag, start, end, item_length):
+    # Parses a run of item_length items of the top-level container from start to end, and returns
+    # a list of them, or of (key, value) pairs if item_tag is None, and the number of items nested
+    # in them. The run may nest no more than max_items items, if that isn't None.
+    _, source, keys = _open_worker_source(source_spec)
+    tags_to_parsers, object_parser, _ = _make_parsers(False, arrays, keys)
+    items = None if max_items is None else _ItemCount(max_items)
+    values = []
+    offset = start
+
+    if item_tag is None:
+        key_parser = _key_parser if keys is None else _make_key_parser(keys)
+
+        for _ in range(item_length):
+            key, offset = key_parser(source, offset)
+            value, offset = object_parser(source, offset, max_depth, items)
+            values.append((key, value))
+
+    elif item_tag in _CONTAINER_TAGS:
+        item_parser = tags_to_parsers[item_tag]
+
+        for _ in range(item_length):
+            value, offset = item_parser(source, offset, max_depth, items)
+            values.append(value)
+
+    else:
+        item_parser = tags_to_parsers[item_tag]
+
+        for _ in range(item_length):
+            value, offset = item_parser(source, offset)
+            values.append(value)
+
+    if offset != end:
+        raise Exception('Items ending at offset {} overrun the next item'.format(end))
+
+    return values, 0 if items is None else items.count
+
+def _plan_runs(source, workers, max_depth, max_items):
+    # Returns the item tag of the top-level container of source, None for dictionaries, and a list
+    # of (start, end, item_length) runs of its items, or None if it is better parsed in this process
+    offset = 0
+
+    if len(source) > 0 and source[0] == tags.KEY_TABLE:
+        _, offset = _parse_key_table(source, 1)
+
+    if workers < 2 or offset >= len(source) or source[offset] not in _CONTAINER_TAGS:
+        return None
+
+    tag = source[offset]
+    item_tag, byte_length, item_length, start = _unpack_container_header(source, offset + 1, tag)
+    end = start + byte_length
+
+    # Errors in the header, trailing bytes, nesting beyond max_depth and more than max_items items
+    # are left to the serial parser to report
+    if item_tag in _FIXED_WIDTHS or item_length < 2 or end != len(source):
+        return None
+
+    if max_depth is not None and max_depth < 1:
+        return None
+
+    if max_items is not None and item_length > max_items:
+        return None
+
+    run_length = -(-item_length // (workers * _PARALLEL_CHUNKS_PER_WORKER))
+    skipper = None if item_tag is None else _TAGS_TO_SKIPPERS[item_tag]
+    runs = []
+    offset = start
+
+    for first in range(0, item_length, run_length):
+        run_start = offset
+        count = min(run_length, item_length - first)
+
+        for _ in range(count):
+            if skipper is None:
+                offset = _skip_object(source, _skip_key(source, offset))
+            else:
+                offset = skipper(source, offset)
+
+        runs.append((run_start, offset, count))
+
+    if offset != end:
+        raise Exception('Container ending at offset {} does not match its header'.format(end))
+
+    return item_tag, item_length, runs
+
+def _parse_runs(plan, source_spec, workers, arrays, max_depth, max_items):
+    item_tag, item_length, runs = plan
+
+    # The top-level container is one level deep
+    if max_depth is not None:
+        max_depth -= 1
+
+    # Each run may nest whatever the top-level items leave of max_items, and the parent checks
+    # their total
+    run_max_items = None if max_items is None else max_items - item_length
+    parse_run = functools.partial(
+        _parse_run,
+        source_spec,
+        arrays,
+        max_depth,
+        run_max_items,
+        item_tag,
+    )
+    result = collections.OrderedDict() if item_tag is None else []
+    add = result.update if item_tag is None else result.extend
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        parts = executor.map(parse_run, *zip(*runs))
+
+        for (start, _, _), (values, count) in zip(runs, parts):
+            item_length += count
+
+            if max_items is not None and item_length > max_items:
+                raise Exception('More than {} items at offset {}'.format(max_items, start))
+
+            add(values)
+
+    return result
+
+def deserialize_parallel(b, workers = None, **kwargs):
+    # Returns the same as deserialize(b, **kwargs). The source is copied into shared memory once
+    # for the workers, which default to one per CPU. Anything but a top-level list or dictionary
+    # of at least two items, or a list of fixed-width items, which are unpacked in bulk anyway, is
+    # parsed in this process. Lazy views only parse what is accessed, so with lazy=True there is
+    # nothing to share out.
+    parser, lazy, arrays, max_depth, max_items = _pop_deserialize_options(
+        kwargs,
+        'deserialize_parallel()',
+    )
+    workers = 1 if lazy else workers or os.cpu_count() or 1
+
+    if instrument._observers:
+        return instrument._observe(
+            'binary.deserialize_parallel',
+            None if lazy else _census,
+            b,
+            _deserialize_parallel,
+            b,
+            workers,
+            parser,
+            arrays,
+            max_depth,
+            max_items,
+        )
+
+    return _deserialize_parallel(b, workers, parser, arrays, max_depth, max_items)
+
+def _deserialize_parallel(b, workers, parser, arrays, max_depth, max_items):
+    source = _as_byte_view(b)
+    plan = _plan_runs(source, workers, max_depth, max_items)
+
+    if plan is None:
+        return _parse(parser, source)
+
+    memory = shared_memory.SharedMemory(create = True, size = len(source))
+
+    try:
+        memory.buf[:len(source)] = source
+        source_spec = ('shared_memory', memory.name, len(source))
+        return _parse_runs(plan, source_spec, workers, arrays, max_depth, max_items)
+
+    finally:
+        memory.close()
+        memory.unlink()
+
+def load_path_parallel(path, workers = None, **kwargs):
+    # Like deserialize_parallel(), but workers map the file themselves, so it is never copied
+    parser, lazy, arrays, max_depth, max_items = _pop_deserialize_options(
+        kwargs,
+        'load_path_parallel()',
+    )
+    workers = 1 if lazy else workers or os.cpu_count() or 1
+    mapping = _map_path(path)
+
+    if instrument._observers:
+        return instrument._observe(
+            'binary.load_path_parallel',
+            None if lazy else _census,
+            mapping,
+            _load_path_parallel,
+            path,
+            mapping,
+            workers,
+            parser,
+            arrays,
+            max_depth,
+            max_items,
+        )
+
+    return _load_path_parallel(path, mapping, workers, parser, arrays, max_depth, max_items)
 
-    if result.success and result.remaining == b'':
-        return result.value
+def _load_path_parallel(path, mapping, workers, parser, arrays, max_depth, max_items):
+    source = _as_byte_view(mapping)
+    plan = _plan_runs(source, workers, max_depth, max_items)
 
-    raise Exception('Unparsed trailing bytes: {}'.format(result.remaining))
+    if plan is None:
+        return _parse(parser, source)
 
-def deserialize(b):
-    return _parse(_object_parser, b)
+    source_spec = ('path', os.path.abspath(path), len(source))
+    return _parse_runs(plan, source_spec, workers, arrays, max_depth, max_items)
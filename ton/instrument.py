@@ -0,0 +1,121 @@
+import collections
+import time
+
+# Observers are called as observer(function_name, stats) after each call to an entry point of the
+# binary and string modules, such as 'binary.deserialize' or 'string.dump', including the calls the
+# aio functions make to binary.serialize() and binary.deserialize(). Decoder.feed() reports each
+# object it decodes, and string.iterserialize() reports once it is exhausted, with the time spent
+# producing its output. Instrumented functions only check whether there are observers, so nothing
+# is timed or counted while there are none.
+#
+# When there are, the encoded form is walked once more after the call to take a census of it,
+# outside the timing, if the call held all of it and parsed or wrote all of it. Dumps, lazy
+# decodes and path queries such as binary.extract() report Stats with only calls and seconds, since
+# a census would hold their whole output, or read all of their input.
+
+_observers = []
+
+def add_observer(observer):
+    _observers.append(observer)
+
+def remove_observer(observer):
+    _observers.remove(observer)
+
+class Stats(object):
+    # Counts of objects and their total size per tag, in bytes for the binary form and in
+    # characters for the string form. Dictionary keys are counted separately from values. Sizes
+    # include tags and container headers, but not the contents of containers.
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_depth = 0
+        self.tags_to_counts = collections.Counter()
+        self.tags_to_sizes = collections.Counter()
+        self.key_tags_to_counts = collections.Counter()
+        self.key_tags_to_sizes = collections.Counter()
+
+    def add(self, tag, size, count = 1):
+        self.tags_to_counts[tag] += count
+        self.tags_to_sizes[tag] += size
+
+    def add_key(self, tag, size):
+        self.key_tags_to_counts[tag] += 1
+        self.key_tags_to_sizes[tag] += size
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.tags_to_counts.update(other.tags_to_counts)
+        self.tags_to_sizes.update(other.tags_to_sizes)
+        self.key_tags_to_counts.update(other.key_tags_to_counts)
+        self.key_tags_to_sizes.update(other.key_tags_to_sizes)
+
+    def __repr__(self):
+        return 'Stats(calls = {}, seconds = {}, max_depth = {}, tags_to_counts = {})'.format(
+            self.calls,
+            self.seconds,
+            self.max_depth,
+            dict(self.tags_to_counts),
+        )
+
+class Recorder(object):
+    # An observer which totals Stats per function while it is active:
+    #
+    #     with instrument.Recorder() as recorder:
+    #         ...
+    #
+    #     recorder.functions_to_stats['binary.deserialize'].tags_to_sizes
+    def __init__(self):
+        self.functions_to_stats = collections.OrderedDict()
+
+    def __call__(self, function_name, stats):
+        if function_name not in self.functions_to_stats:
+            self.functions_to_stats[function_name] = Stats()
+
+        self.functions_to_stats[function_name].merge(stats)
+
+    def __enter__(self):
+        add_observer(self)
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        remove_observer(self)
+
+def _report(function_name, stats):
+    for observer in list(_observers):
+        observer(function_name, stats)
+
+def _observe(function_name, census, encoded, function, *args, **kwargs):
+    # Calls function and reports it to the observers, with a census of the encoded form unless
+    # census is None. That is encoded when decoding, and the result when encoding, where encoded
+    # is None.
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+
+    stats = Stats() if census is None else census(result if encoded is None else encoded)
+    stats.calls = 1
+    stats.seconds = seconds
+    _report(function_name, stats)
+    return result
+
+def _observe_iterator(function_name, iterator):
+    # Yields the items of iterator, and reports it to the observers once it is exhausted, timing
+    # only the calls into it
+    stats = Stats()
+    stats.calls = 1
+
+    while True:
+        start = time.perf_counter()
+
+        try:
+            item = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            stats.seconds += time.perf_counter() - start
+
+        yield item
+
+    _report(function_name, stats)
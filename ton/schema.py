@@ -0,0 +1,253 @@
+import collections
+import struct
+
+from ton import binary, tags
+
+Codec = collections.namedtuple('Codec', ['serialize', 'deserialize'])
+
+_FIXED_WIDTH_FORMATS = {
+    tags.INT8: 'b',
+    tags.INT16: 'h',
+    tags.INT32: 'i',
+    tags.INT64: 'q',
+    tags.BOOL: 'B',
+}
+
+_BOOLEANS_TO_TAGS = { True: tags.TRUE, False: tags.FALSE }
+_TAGS_TO_BOOLEANS = { tags.TRUE: True, tags.FALSE: False }
+
+# The types of the values which fit each tag. Values of other types, such as bool for an integer or
+# subclasses, fall back to the generic codec, which tags them as it always would.
+_TAGS_TO_TYPES = {
+    tags.VOID: (type(None),),
+    tags.BOOL: (bool,),
+    tags.INT8: (int,),
+    tags.INT16: (int,),
+    tags.INT32: (int,),
+    tags.INT64: (int,),
+    tags.BINARY: (bytes,),
+    tags.UTF8: (str,),
+    tags.UTF16: (str,),
+    tags.UTF32: (str,),
+    tags.LIST: (list,),
+    tags.DICTIONARY: (dict, collections.OrderedDict),
+}
+
+_RECORD_TYPES = (dict, collections.OrderedDict)
+
+def _is_fixed_width(tag):
+    return tag in _FIXED_WIDTH_FORMATS or tag == tags.VOID
+
+class _FixedRun(object):
+    # A run of adjacent fixed-width fields, packed with one struct.Struct. Constant bytes (keys,
+    # tags and headers) are passed as 's' fields alternating with the values, so the packed
+    # arguments are [constant, value, constant, value, ..., trailing constant].
+    def __init__(self, prefix):
+        self.keys = []
+        self.kinds = []
+        self.constants = []
+        self._pending = prefix
+
+    def add(self, key, tag):
+        key_bytes = binary._serialize_key(key, tags._default_tagger)
+
+        if tag == tags.VOID:
+            self._pending += key_bytes + struct.pack('!B', tag)
+        elif tag == tags.BOOL:
+            self.constants.append(self._pending + key_bytes)
+            self._pending = b''
+        else:
+            self.constants.append(self._pending + key_bytes + struct.pack('!B', tag))
+            self._pending = b''
+
+        self.keys.append(key)
+        self.kinds.append(tag)
+
+    def compile(self):
+        self.trailing = self._pending
+        value_kinds = [kind for kind in self.kinds if kind != tags.VOID]
+
+        self.struct = struct.Struct('!' + ''.join(
+            '{}s{}'.format(len(constant), _FIXED_WIDTH_FORMATS[kind])
+            for constant, kind in zip(self.constants, value_kinds)
+        ) + ('{}s'.format(len(self.trailing)) if self.trailing else ''))
+
+        self.template = []
+        for constant in self.constants:
+            self.template.extend([constant, None])
+        if self.trailing:
+            self.template.append(self.trailing)
+
+        self.value_count = len(value_kinds)
+        self.value_keys = [key for key, kind in zip(self.keys, self.kinds) if kind != tags.VOID]
+        self.boolean_slots = [
+            2 * i + 1 for i, kind in enumerate(value_kinds) if kind == tags.BOOL
+        ]
+        self.expected_constants = tuple(self.template[0::2])
+
+    def pack(self, record):
+        arguments = list(self.template)
+        arguments[1:2 * self.value_count:2] = [record[key] for key in self.value_keys]
+
+        for slot in self.boolean_slots:
+            arguments[slot] = _BOOLEANS_TO_TAGS[arguments[slot]]
+
+        return self.struct.pack(*arguments)
+
+    def unpack_into(self, result, source, offset):
+        # Returns the offset past the run, or None if the source does not have this layout
+        if offset + self.struct.size > len(source):
+            return None
+
+        unpacked = self.struct.unpack_from(source, offset)
+
+        if unpacked[0::2] != self.expected_constants:
+            return None
+
+        values = iter(unpacked[1::2])
+
+        for key, kind in zip(self.keys, self.kinds):
+            if kind == tags.VOID:
+                result[key] = None
+            elif kind == tags.BOOL:
+                tag = next(values)
+
+                if tag not in _TAGS_TO_BOOLEANS:
+                    return None
+
+                result[key] = _TAGS_TO_BOOLEANS[tag]
+            else:
+                result[key] = next(values)
+
+        return offset + self.struct.size
+
+class _VariableField(object):
+    def __init__(self, key, tag):
+        self.key = key
+        self.tag = tag
+        self.constant = binary._serialize_key(key, tags._default_tagger) + struct.pack('!B', tag)
+        self.parser = binary._TAGS_TO_PARSERS[tag]
+
+    def pack(self, record):
+        return self.constant + binary.serialize(tags.TaggedObject(self.tag, record[self.key]))[1:]
+
+    def unpack_into(self, result, source, offset):
+        end = offset + len(self.constant)
+
+        if source[offset:end] != self.constant:
+            return None
+
+        result[self.key], offset = self.parser(source, end)
+        return offset
+
+def compile_schema(schema):
+    # schema maps each key to the tag of its value, with tags.BOOL for booleans. Records are
+    # written in schema order. The output is an ordinary dictionary, readable by
+    # binary.deserialize(), and records which do not match the schema fall back to the generic
+    # codec in both directions. A record matches if it has the schema's keys, and each value has
+    # a type which fits its tag, in range for integers.
+    schema = collections.OrderedDict(schema)
+
+    for key, tag in schema.items():
+        if tag not in _TAGS_TO_TYPES:
+            raise Exception('Unsupported tag {} for key {!r}'.format(tag, key))
+
+    types = [_TAGS_TO_TYPES[tag] for tag in schema.values()]
+    # The types of a record which fits, with the first type of each tag
+    first_types = [field_types[0] for field_types in types]
+
+    fixed = all(_is_fixed_width(tag) for tag in schema.values())
+
+    if fixed:
+        # The whole record, including its dictionary header, is a single run
+        byte_length = sum(
+            len(binary._serialize_key(key, tags._default_tagger)) + 1
+            + binary._FIXED_WIDTHS.get(tag, 0)
+            for key, tag in schema.items()
+        )
+        run = _FixedRun(struct.pack('!B', tags.DICTIONARY) + binary._DICTIONARY_HEADER.pack(
+            byte_length,
+            len(schema),
+        ))
+        segments = [run]
+        header_size = 0
+
+    else:
+        run = None
+        segments = []
+        header_size = 1 + binary._DICTIONARY_HEADER.size
+
+    for key, tag in schema.items():
+        if _is_fixed_width(tag):
+            if run is None:
+                run = _FixedRun(b'')
+                segments.append(run)
+
+            run.add(key, tag)
+
+        else:
+            run = None
+            segments.append(_VariableField(key, tag))
+
+    for segment in segments:
+        if isinstance(segment, _FixedRun):
+            segment.compile()
+
+    item_length = len(schema)
+
+    def serialize(record):
+        # A record of the same length which has every key of the schema has no other keys
+        if type(record) not in _RECORD_TYPES or len(record) != item_length:
+            return binary.serialize(record)
+
+        try:
+            record_types = [type(record[key]) for key in schema]
+        except KeyError:
+            return binary.serialize(record)
+
+        if record_types != first_types and not all(
+            record_type in field_types for record_type, field_types in zip(record_types, types)
+        ):
+            return binary.serialize(record)
+
+        # Integers which are out of range for their tag don't pack
+        try:
+            if fixed:
+                return segments[0].pack(record)
+
+            body = b''.join([segment.pack(record) for segment in segments])
+
+        except struct.error:
+            return binary.serialize(record)
+
+        return struct.pack('!B', tags.DICTIONARY) + binary._DICTIONARY_HEADER.pack(
+            len(body),
+            item_length,
+        ) + body
+
+    def deserialize(b):
+        source = binary._as_byte_view(b)
+        result = collections.OrderedDict()
+        offset = header_size
+
+        if not fixed:
+            if len(source) < header_size or source[0] != tags.DICTIONARY:
+                return binary.deserialize(source)
+
+            byte_length, count = binary._DICTIONARY_HEADER.unpack_from(source, 1)
+
+            if count != item_length or header_size + byte_length != len(source):
+                return binary.deserialize(source)
+
+        for segment in segments:
+            offset = segment.unpack_into(result, source, offset)
+
+            if offset is None:
+                return binary.deserialize(source)
+
+        if offset != len(source):
+            return binary.deserialize(source)
+
+        return result
+
+    return Codec(serialize = serialize, deserialize = deserialize)
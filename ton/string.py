@@ -1,9 +1,8 @@
 import binascii
 import collections
-import functools
 import re
 
-from ton import tags, _shared
+from ton import instrument, tags
 
 def _integer_size_to_string_serializer(integer_size):
     minimum = -(2 ** (integer_size - 1))
@@ -24,14 +23,6 @@ def _utf_encoding_to_serializer(utf_encoding):
 
     return serializer
 
-def _string_serialize_list(l):
-    return '[{}]'.format(', '.join(map(serialize, l)))
-
-def _string_serialize_dictionary(d):
-    def serialize_kvp(kvp):
-        return serialize(kvp[0]) + ': ' + serialize(kvp[1])
-    return '{ ' + ', '.join(map(serialize_kvp, d.items())) + ' }'
-
 _STRING_SERIALIZERS = {
     tags.VOID: lambda o: 'null',
     tags.TRUE: lambda o: 'true',
@@ -44,226 +35,485 @@ _STRING_SERIALIZERS = {
     tags.UTF8: _utf_encoding_to_serializer('utf8'),
     tags.UTF16: _utf_encoding_to_serializer('utf16'),
     tags.UTF32: _utf_encoding_to_serializer('utf32'),
-    tags.LIST: _string_serialize_list,
-    tags.DICTIONARY: _string_serialize_dictionary,
 }
 
-def serialize(o):
-    o = tags.autotag(o)
-    
-    return _STRING_SERIALIZERS[o.tag](o.value)
+# Serialization tags each object as it is written, using a tagger from tags._pop_tagger(), rather
+# than building a tagged copy of the whole document first. Containers are walked with an explicit
+# stack of item iterators, yielding the output a token at a time.
+
+def _list_items(l, tagger):
+    # Returns the items of l, tagged with the width of the list if they are integers, as the
+    # binary form writes them
+    numpy_item_tag = tags._numpy_array_item_tag(l)
+
+    if numpy_item_tag is not None:
+        return [tags.TaggedObject(tag = numpy_item_tag, value = i) for i in l.tolist()]
+
+    if len(l) == 0 or tagger(l[0]).tag not in tags._TAGS_TO_INTEGER_RANGES:
+        return l
+
+    item_tag = tags._integer_list_item_tag(l, tagger)
+
+    return (tags.TaggedObject(tag = item_tag, value = tagger(i).value) for i in l)
+
+_END = object()
+
+def _iterate_compact_tokens(o, tagger):
+    stack = []
+    o = tagger(o)
+
+    while True:
+        first = False
+
+        if o.tag == tags.LIST:
+            yield '['
+            stack.append((iter(_list_items(o.value, tagger)), ']', False))
+            first = True
+
+        elif o.tag == tags.DICTIONARY:
+            yield '{ '
+            stack.append((iter(o.value.items()), ' }', True))
+            first = True
+
+        elif o.tag == tags.INDEXED_DICTIONARY:
+            yield '{ '
+            stack.append((iter(tags._indexed_items(o.value, tagger)), ' }', True))
+            first = True
+
+        else:
+            yield _STRING_SERIALIZERS[o.tag](o.value)
+
+        while stack:
+            items, end_wrap, is_dictionary = stack[-1]
+            item = next(items, _END)
+
+            if item is _END:
+                yield end_wrap
+                stack.pop()
+                first = False
+                continue
+
+            if not first:
+                yield ', '
+
+            if is_dictionary:
+                key = tagger(item[0])
+                yield _STRING_SERIALIZERS[key.tag](key.value)
+                yield ': '
+                o = tagger(item[1])
+            else:
+                o = tagger(item)
+
+            break
+
+        else:
+            return
+
+def _compact_within(o, tagger, width):
+    # Returns the compact string form of o if it is no longer than width, reading no more of o than
+    # it takes to find out
+    tokens = []
+    length = 0
+
+    for token in _iterate_compact_tokens(o, tagger):
+        length += len(token)
+
+        if length > width:
+            return None
+
+        tokens.append(token)
+
+    return ''.join(tokens)
+
+def _iterate_pretty_tokens(o, tagger, width, indent):
+    # Containers which fit in the rest of the line are written compactly, and others with one item
+    # per line. Each frame on the stack is (items, end wrap, is dictionary, indentation of items).
+    stack = []
+    column = 0
+    o = tagger(o)
+
+    while True:
+        first = False
+
+        if o.tag in (tags.LIST, tags.DICTIONARY, tags.INDEXED_DICTIONARY):
+            # Leave room for the comma which may follow
+            compact = _compact_within(o, tagger, width - column - (1 if stack else 0))
+
+            if compact is not None:
+                yield compact
+
+            else:
+                item_indentation = (stack[-1][3] if stack else '') + ' ' * indent
+
+                if o.tag == tags.LIST:
+                    yield '['
+                    stack.append((iter(_list_items(o.value, tagger)), ']', False, item_indentation))
+                else:
+                    items = o.value.items()
+
+                    if o.tag == tags.INDEXED_DICTIONARY:
+                        items = tags._indexed_items(o.value, tagger)
+
+                    yield '{'
+                    stack.append((iter(items), '}', True, item_indentation))
+
+                first = True
+
+        else:
+            yield _STRING_SERIALIZERS[o.tag](o.value)
+
+        while stack:
+            items, end_wrap, is_dictionary, item_indentation = stack[-1]
+            item = next(items, _END)
+
+            if item is _END:
+                stack.pop()
+                yield '\n' + (stack[-1][3] if stack else '') + end_wrap
+                first = False
+                continue
+
+            yield ('\n' if first else ',\n') + item_indentation
+            column = len(item_indentation)
+
+            if is_dictionary:
+                key = tagger(item[0])
+                key_prefix = _STRING_SERIALIZERS[key.tag](key.value) + ': '
+                yield key_prefix
+                column += len(key_prefix)
+                o = tagger(item[1])
+            else:
+                o = tagger(item)
+
+            break
+
+        else:
+            return
+
+def _pop_tokens(o, kwargs, function_name, default_width):
+    # Pops the serialize() options out of kwargs and returns an iterator over the tokens they
+    # select. A width of None writes everything on one line.
+    width = kwargs.pop('width', default_width)
+    indent = kwargs.pop('indent', 2)
+    tagger = tags._pop_tagger(kwargs, function_name)
+
+    if width is None:
+        return _iterate_compact_tokens(o, tagger)
+
+    return _iterate_pretty_tokens(o, tagger, width, indent)
+
+def serialize(o, **kwargs):
+    tokens = _pop_tokens(o, kwargs, 'serialize()', None)
+
+    if instrument._observers:
+        return instrument._observe('string.serialize', _census, None, ''.join, tokens)
+
+    return ''.join(tokens)
+
+def iterserialize(o, **kwargs):
+    # Like serialize(), but yields the output in small pieces as it is produced
+    tokens = _pop_tokens(o, kwargs, 'iterserialize()', None)
+
+    if instrument._observers:
+        return instrument._observe_iterator('string.iterserialize', tokens)
+
+    return tokens
+
+_DUMP_TOKEN_COUNT = 4096
+
+def dump(o, fp, **kwargs):
+    # Writes o to the text stream fp, pretty printed to a width of 80 by default. Output is joined
+    # and written every _DUMP_TOKEN_COUNT tokens, so only that much of it is held in memory.
+    tokens = _pop_tokens(o, kwargs, 'dump()', 80)
+
+    if instrument._observers:
+        instrument._observe('string.dump', None, None, _dump, tokens, fp)
+        return
 
-def _consume_leading_whitespace(wrapped_parser):
-    @functools.wraps(wrapped_parser)
-    def parser(s):
-        s = s.lstrip()
-        return wrapped_parser(s)
+    _dump(tokens, fp)
 
-    return parser
+def _dump(tokens, fp):
+    chunk = []
+
+    for token in tokens:
+        chunk.append(token)
+
+        if len(chunk) >= _DUMP_TOKEN_COUNT:
+            fp.write(''.join(chunk))
+            chunk = []
+
+    fp.write(''.join(chunk))
+
+# Parsers take the whole source string and the index at which to start, and return a
+# (value, index) tuple where index points just past the parsed value. Objects are dispatched on
+# their first character and the source is never sliced, so parsing is linear in its length.
+
+_WHITESPACE_MATCHER = re.compile(r'\s*')
+_INTEGER_MATCHER = re.compile(r'(-?\d+)i(8|16|32|64)')
+_QUOTED_MATCHER = re.compile(r'"([\da-f]*)"b|"(.*?)"(utf8|utf16|utf32)')
+
+def _skip_whitespace(s, index):
+    return _WHITESPACE_MATCHER.match(s, index).end()
+
+def _unable_to_parse(s, index):
+    return Exception('Unable to parse "{}" at index {}'.format(s[index:index + 32], index))
+
+def _integer_parser(s, index):
+    match = _INTEGER_MATCHER.match(s, index)
+
+    if match is None:
+        raise _unable_to_parse(s, index)
+
+    # TODO Validate that the integer is in range
+    return int(match.group(1)), match.end()
+
+def _quoted_parser(s, index):
+    match = _QUOTED_MATCHER.match(s, index)
+
+    if match is None:
+        raise _unable_to_parse(s, index)
+
+    if match.group(1) is not None:
+        return binascii.unhexlify(match.group(1)), match.end()
+
+    return match.group(2), match.end()
 
 def _make_constant_parser(constant, value):
-    @_consume_leading_whitespace
-    def constant_parser(s):
-        if s.startswith(constant):
-            result = _shared.ParseResult(
-                success = True,
-                value = value,
-                remaining = s[len(constant):],
-            )
-            return result
-
-        return _shared._FAILED_PARSE_RESULT
+    def constant_parser(s, index):
+        if s.startswith(constant, index):
+            return value, index + len(constant)
+
+        raise _unable_to_parse(s, index)
 
     return constant_parser
 
-def _make_integer_parser(width):
-    matcher = re.compile(r'(-?\d+)i' + str(width))
+def _leaf_parser(s, index):
+    index = _skip_whitespace(s, index)
 
-    @_consume_leading_whitespace
-    def integer_parser(s):
-        match = matcher.match(s)
+    if index == len(s):
+        raise Exception('Unexpected end of input')
 
-        if match:
-            # TODO Validate that the integer is in range
-            return _shared.ParseResult(
-                success = True,
-                value = int(match.group(1)),
-                remaining = s[match.end():],
-            )
+    parser = _FIRST_CHARACTERS_TO_LEAF_PARSERS.get(s[index])
 
-        return _shared._FAILED_PARSE_RESULT
+    if parser is None:
+        raise _unable_to_parse(s, index)
 
-    return integer_parser
+    return parser(s, index)
 
-_BINARY_MATCHER = re.compile(r'"([\da-f]*)"b')
+def _key_parser(s, index):
+    key, index = _leaf_parser(s, index)
+    index = _skip_whitespace(s, index)
 
-@_consume_leading_whitespace
-def _binary_parser(s):
-    match = _BINARY_MATCHER.match(s)
+    if not s.startswith(':', index):
+        raise _unable_to_parse(s, index)
 
-    if match:
-        return _shared.ParseResult(
-            success = True,
-            value = binascii.unhexlify(match.group(1)),
-            remaining = s[match.end():],
-        )
+    return key, index + 1
 
-    return _shared._FAILED_PARSE_RESULT
+def _object_parser(s, index, max_depth = None):
+    # Parses containers using an explicit stack rather than recursion, so nesting is limited only
+    # by max_depth. The innermost open container, its end wrap and its pending dictionary key are
+    # held in local variables, and those of its parents on the stack.
+    length = len(s)
+    stack = []
+    items = None
+    end_wrap = None
+    key = None
 
-def _make_utf_parser(encoding):
-    matcher = re.compile(r'"(.*?)"' + encoding)
+    while True:
+        index = _skip_whitespace(s, index)
+        character = s[index] if index < length else ''
+        parser = _FIRST_CHARACTERS_TO_LEAF_PARSERS.get(character)
 
-    @_consume_leading_whitespace
-    def utf_parser(s):
-        match = matcher.match(s)
+        if parser is not None:
+            value, index = parser(s, index)
 
-        if match:
-            return _shared.ParseResult(
-                success = True,
-                value = match.group(1),
-                remaining = s[match.end():],
-            )
+        elif character == '[' or character == '{':
+            if max_depth is not None and len(stack) >= max_depth:
+                raise Exception('Nesting deeper than {} at index {}'.format(max_depth, index))
 
-        return _shared._FAILED_PARSE_RESULT
+            stack.append((items, end_wrap, key))
 
-    return utf_parser
+            if character == '[':
+                items = []
+                end_wrap = ']'
+            else:
+                items = collections.OrderedDict()
+                end_wrap = '}'
 
-def _make_consume_constant_parser(constant):
-    @_consume_leading_whitespace
-    def consume_character_parser(s):
-        if s.startswith(constant):
-            return _shared.ParseResult(
-                success = True,
-                value = None,
-                remaining = s[len(constant):],
-            )
-        return _shared._FAILED_PARSE_RESULT
+            index = _skip_whitespace(s, index + 1)
 
-    return consume_character_parser
+            if not s.startswith(end_wrap, index):
+                if end_wrap == '}':
+                    key, index = _key_parser(s, index)
 
-_consume_comma_parser = _make_consume_constant_parser(',')
+                continue
+
+            value = items
+            index += 1
+            items, end_wrap, key = stack.pop()
+
+        elif index == length:
+            raise Exception('Unexpected end of input')
 
-def _prefix_with_comma(parser):
-    def wrapped(s):
-        result = _consume_comma_parser(s)
-        if result.success:
-            s = result.remaining
         else:
-            return _shared._FAILED_PARSE_RESULT
+            raise _unable_to_parse(s, index)
 
-        result = parser(s)
-        if not result.success:
-            raise Exception('Trailing comma before "{}"'.format(s))
+        # Add the value to its container, closing every container which ends after it
+        while True:
+            if end_wrap is None:
+                return value, index
 
-        return result
+            if end_wrap == ']':
+                items.append(value)
+            else:
+                items[key] = value
 
-    return wrapped
+            index = _skip_whitespace(s, index)
 
-def _comma_separate_and_wrap(wrapped_parser, start_wrap, end_wrap, typecaster):
-    parser_prefixed_with_comma = _prefix_with_comma(wrapped_parser)
-    start_wrap_parser = _make_consume_constant_parser(start_wrap)
-    end_wrap_parser = _make_consume_constant_parser(end_wrap)
+            if s.startswith(end_wrap, index):
+                value = items
+                index += 1
+                items, end_wrap, key = stack.pop()
+                continue
 
-    def parser(s):
-        result = start_wrap_parser(s)
-        if result.success:
-            s = result.remaining
-        else:
-            return _shared._FAILED_PARSE_RESULT
+            if not s.startswith(',', index):
+                raise _unable_to_parse(s, index)
+
+            index = _skip_whitespace(s, index + 1)
+
+            if s.startswith(end_wrap, index):
+                raise Exception('Trailing comma before "{}"'.format(s[index:index + 32]))
+
+            if end_wrap == '}':
+                key, index = _key_parser(s, index)
+
+            break
+
+_FIRST_CHARACTERS_TO_LEAF_PARSERS = {
+    'n': _make_constant_parser('null', None),
+    't': _make_constant_parser('true', True),
+    'f': _make_constant_parser('false', False),
+    '"': _quoted_parser,
+}
+
+_FIRST_CHARACTERS_TO_LEAF_PARSERS.update((c, _integer_parser) for c in '-0123456789')
+
+def _parse(s, max_depth):
+    value, index = _object_parser(s, 0, max_depth)
+
+    if _skip_whitespace(s, index) != len(s):
+        raise Exception('Unparsed trailing characters: "{}"'.format(s[index:]))
+
+    return value
+
+def deserialize(s, **kwargs):
+    max_depth = kwargs.pop('max_depth', None)
 
-        value = []
-        first = True
+    if kwargs:
+        raise TypeError("deserialize() got an unexpected keyword argument '{}'".format(
+            list(kwargs.keys())[0],
+        ))
 
-        parse_result = wrapped_parser(s)
+    if instrument._observers:
+        return instrument._observe('string.deserialize', _census, s, _parse, s, max_depth)
 
-        while parse_result.success:
-            value.append(parse_result.value)
-            s = parse_result.remaining
-            parse_result = parser_prefixed_with_comma(s)
+    return _parse(s, max_depth)
+
+# The leaf parsers above drop tags, so for transcoding and instrumentation these keep them,
+# returning (tag, value, index)
+
+_INTEGER_WIDTHS_TO_TAGS = {
+    '8': tags.INT8,
+    '16': tags.INT16,
+    '32': tags.INT32,
+    '64': tags.INT64,
+}
+
+_ENCODINGS_TO_TAGS = {
+    'utf8': tags.UTF8,
+    'utf16': tags.UTF16,
+    'utf32': tags.UTF32,
+}
+
+def _tagged_integer_parser(s, index):
+    match = _INTEGER_MATCHER.match(s, index)
+
+    if match is None:
+        raise _unable_to_parse(s, index)
+
+    return _INTEGER_WIDTHS_TO_TAGS[match.group(2)], int(match.group(1)), match.end()
+
+def _tagged_quoted_parser(s, index):
+    match = _QUOTED_MATCHER.match(s, index)
+
+    if match is None:
+        raise _unable_to_parse(s, index)
+
+    if match.group(1) is not None:
+        return tags.BINARY, binascii.unhexlify(match.group(1)), match.end()
+
+    return _ENCODINGS_TO_TAGS[match.group(3)], match.group(2), match.end()
+
+def _make_tagged_constant_parser(constant, tag):
+    def constant_parser(s, index):
+        if s.startswith(constant, index):
+            return tag, None, index + len(constant)
+
+        raise _unable_to_parse(s, index)
+
+    return constant_parser
+
+_FIRST_CHARACTERS_TO_TAGGED_LEAF_PARSERS = {
+    'n': _make_tagged_constant_parser('null', tags.VOID),
+    't': _make_tagged_constant_parser('true', tags.TRUE),
+    'f': _make_tagged_constant_parser('false', tags.FALSE),
+    '"': _tagged_quoted_parser,
+}
+
+_FIRST_CHARACTERS_TO_TAGGED_LEAF_PARSERS.update((c, _tagged_integer_parser) for c in '-0123456789')
+
+def _census(s):
+    # Returns instrument.Stats for the string form s, which has already been parsed or written.
+    # Containers are counted with the size of their wraps, and separators are not counted.
+    stats = instrument.Stats()
+    length = len(s)
+    # Whether each open container is a dictionary
+    stack = []
+    key_next = False
+    index = _skip_whitespace(s, 0)
+
+    while index < length:
+        character = s[index]
+
+        if character == '[' or character == '{':
+            stack.append(character == '{')
+            stats.add(tags.LIST if character == '[' else tags.DICTIONARY, 2)
+            stats.max_depth = max(stats.max_depth, len(stack))
+            key_next = character == '{'
+            index += 1
+
+        elif character == ']' or character == '}':
+            stack.pop()
+            key_next = False
+            index += 1
+
+        elif character == ',':
+            key_next = stack[-1]
+            index += 1
+
+        elif character == ':':
+            index += 1
 
-        result = end_wrap_parser(s)
-        if result.success:
-            s = result.remaining
         else:
-            return _shared._FAILED_PARSE_RESULT
-
-        return _shared.ParseResult(
-            success = True,
-            value = typecaster(value),
-            remaining = s,
-        )
-
-    return parser
-
-# This uses _PARSERS which has not been defined yet, but is defined here so it can be used in
-# the definition of _list_parser
-def _object_parser(source):
-    for parser in _PARSERS:
-        result = parser(source)
-
-        if result.success:
-            return result
-
-    return _shared._FAILED_PARSE_RESULT
-
-_list_parser = _comma_separate_and_wrap(_object_parser, '[', ']', list)
-
-_consume_colon_parser = _make_consume_constant_parser(':')
-
-def _kvp_parser(s):
-    key_parse_result = _object_parser(s)
-    if key_parse_result.success:
-        s = key_parse_result.remaining
-    else:
-        return _shared._FAILED_PARSE_RESULT
-
-    result = _consume_colon_parser(s)
-    if result.success:
-        s = result.remaining
-    else:
-        return _shared._FAILED_PARSE_RESULT
-
-    value_parse_result = _object_parser(s)
-    if value_parse_result.success:
-        s = value_parse_result.remaining
-    else:
-        return _shared._FAILED_PARSE_RESULT
-
-    return _shared.ParseResult(
-        success = True,
-        value = (key_parse_result.value, value_parse_result.value),
-        remaining = s,
-    )
-
-_dictionary_parser = _comma_separate_and_wrap(_kvp_parser, '{', '}', collections.OrderedDict)
-
-
-_PARSERS = [
-    _make_constant_parser('null', None),
-    _make_constant_parser('true', True),
-    _make_constant_parser('false', False),
-    _make_integer_parser(8),
-    _make_integer_parser(16),
-    _make_integer_parser(32),
-    _make_integer_parser(64),
-    _binary_parser,
-    _make_utf_parser('utf8'),
-    _make_utf_parser('utf16'),
-    _make_utf_parser('utf32'),
-    _list_parser,
-    _dictionary_parser,
-]
-
-def _parse(parser, source):
-    result = parser(source)
-
-    if result.success:
-        if result.remaining.strip() == '':
-            return result.value
-
-        raise Exception('Unparsed trailing characters: "{}"'.format(result.remaining))
-
-    raise Exception('Unable to parse: "{}"'.format(source))
-
-def deserialize(s):
-    return _parse(_object_parser, s)
+            tag, _, end = _FIRST_CHARACTERS_TO_TAGGED_LEAF_PARSERS[character](s, index)
+
+            if key_next:
+                stats.add_key(tag, end - index)
+                key_next = False
+            else:
+                stats.add(tag, end - index)
+
+            index = end
+
+        index = _skip_whitespace(s, index)
+
+    return stats
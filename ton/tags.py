@@ -1,4 +1,5 @@
 import collections
+import sys
 
 VOID = 0x00
 TRUE = 0x01
@@ -15,8 +16,25 @@ BINARY = 0x30
 UTF8 = 0x31
 UTF16 = 0x32
 UTF32 = 0x33
+# Dictionary keys in documents with a key table may be references to an index in the table
+KEY_REFERENCE8 = 0x34
+KEY_REFERENCE16 = 0x35
+KEY_REFERENCE32 = 0x36
+# The compact binary format writes UTF-8 strings shorter than 256 bytes with a one byte length, and
+# container headers with varint lengths
+SHORT_UTF8 = 0x37
 LIST = 0x40
 DICTIONARY = 0x41
+COMPACT_LIST = 0x42
+COMPACT_DICTIONARY = 0x43
+# A dictionary written with its entries in order of their keys, after a table of their offsets, so
+# that a key can be found by binary search. Tag a dictionary with it to write it this way. Only the
+# binary form has it. The string form writes it as a plain dictionary, in key order, and
+# transcode.binary_to_string() raises on it rather than drop the tag.
+INDEXED_DICTIONARY = 0x44
+# Only valid at the start of a binary document, where it is followed by a version byte and the
+# table of the document's dictionary keys
+KEY_TABLE = 0x50
 
 STRING_TAGS = set([UTF8, UTF16, UTF32])
 
@@ -25,114 +43,216 @@ DEFAULT_STRING_ENCODING = UTF8
 
 TaggedObject = collections.namedtuple('TaggedObject', ['tag', 'value'])
 
-_TYPES_TO_TAGS = {
-    int: DEFAULT_INTEGER_ENCODING,
-    bytes: BINARY,
-    str: DEFAULT_STRING_ENCODING,
-    list: LIST,
-    dict: DICTIONARY,
-    collections.OrderedDict: DICTIONARY,
+_NONE = TaggedObject(tag = VOID, value = None)
+_TRUE = TaggedObject(tag = TRUE, value = True)
+_FALSE = TaggedObject(tag = FALSE, value = False)
+
+_TAGS_TO_INTEGER_RANGES = collections.OrderedDict([
+    (INT8,  (-128, 127)),
+    (INT16, (-32768, 32767)),
+    (INT32, (-2147483648, 2147483647)),
+    (INT64, (-9223372036854775808, 9223372036854775807)),
+])
+
+_NUMPY_DTYPE_NAMES_TO_TAGS = {
+    'int8': INT8,
+    'int16': INT16,
+    'int32': INT32,
+    'int64': INT64,
 }
 
-def _tag(o):
-    if isinstance(o, TaggedObject):
-        return o
+def _numpy_array_item_tag(o):
+    # NumPy is an optional dependency, and if it hasn't been imported o can't be an ndarray
+    numpy = sys.modules.get('numpy')
 
-    if o is None:
-        return TaggedObject(tag = VOID, value = o)
+    if numpy is None or not isinstance(o, numpy.ndarray) or o.ndim != 1:
+        return None
 
-    if o is True:
-        return TaggedObject(tag = TRUE, value = o)
+    return _NUMPY_DTYPE_NAMES_TO_TAGS.get(o.dtype.name)
 
-    if o is False:
-        return TaggedObject(tag = FALSE, value = o)
+class TooWideError(Exception):
+    pass
 
-    return TaggedObject(tag = _TYPES_TO_TAGS[type(o)], value = o)
+class _Smallest(object):
+    # SMALLEST is compared by identity, so it pickles as a reference to itself for the worker
+    # processes of binary.serialize_parallel()
+    def __reduce__(self):
+        return 'SMALLEST'
 
-_NONE = TaggedObject(tag = VOID, value = None)
-_TRUE = TaggedObject(tag = TRUE, value = True)
-_FALSE = TaggedObject(tag = FALSE, value = False)
+    def __repr__(self):
+        return 'SMALLEST'
 
-_TAGS_TO_IN_RANGE_PREDICATES = collections.OrderedDict([
-    (INT8,  lambda i: -128 <= i and i <= 127),
-    (INT16, lambda i: -32768 <= i and i <= 32767),
-    (INT32, lambda i: -2147483648 <= i and i <= 2147483647),
-    (INT64, lambda i: -9223372036854775808 <= i and i <= 9223372036854775807),
-])
+SMALLEST = _Smallest()
 
-class TooWideError(Exception):
-    pass
+# Type taggers take an object and the preferred tags, and return a TaggedObject. They are
+# dispatched on type(o), so only one dictionary lookup is needed for the built in types.
 
-SMALLEST = object()
+def _tag_tagged_object(o, preferred_integer_tag, preferred_string_tag):
+    return o
 
-def autotag(o, **kwargs):
+def _tag_none(o, preferred_integer_tag, preferred_string_tag):
+    return _NONE
+
+def _tag_bool(o, preferred_integer_tag, preferred_string_tag):
+    return _TRUE if o else _FALSE
+
+def _tag_integer(o, preferred_integer_tag, preferred_string_tag):
+    if preferred_integer_tag is not SMALLEST:
+        minimum, maximum = _TAGS_TO_INTEGER_RANGES[preferred_integer_tag]
+
+        if minimum <= o <= maximum:
+            return TaggedObject(preferred_integer_tag, o)
+
+    for tag, (minimum, maximum) in _TAGS_TO_INTEGER_RANGES.items():
+        if minimum <= o <= maximum:
+            return TaggedObject(tag, o)
+
+    raise TooWideError('Integer {} is too wide to be serialized'.format(o))
+
+def _tag_string(o, preferred_integer_tag, preferred_string_tag):
+    # TODO Support SMALLEST for preferred string tag
+    return TaggedObject(preferred_string_tag, o)
+
+def _tag_bytes(o, preferred_integer_tag, preferred_string_tag):
+    return TaggedObject(BINARY, o)
+
+def _tag_list(o, preferred_integer_tag, preferred_string_tag):
+    return TaggedObject(LIST, o)
+
+def _tag_dictionary(o, preferred_integer_tag, preferred_string_tag):
+    return TaggedObject(DICTIONARY, o)
+
+def _tag_numpy_array(o, preferred_integer_tag, preferred_string_tag):
+    if _numpy_array_item_tag(o) is None:
+        raise Exception('Unsupported array {!r} of {}'.format(o.shape, o.dtype))
+
+    # Arrays are serialized straight from their buffer, so their items are not tagged
+    return TaggedObject(LIST, o)
+
+def _make_encoder_tagger(encoder):
+    def tagger(o, preferred_integer_tag, preferred_string_tag):
+        return _autotag_shallow(encoder(o), preferred_integer_tag, preferred_string_tag)
+
+    return tagger
+
+_TYPES_TO_TAGGERS = {
+    TaggedObject: _tag_tagged_object,
+    type(None): _tag_none,
+    bool: _tag_bool,
+    int: _tag_integer,
+    str: _tag_string,
+    bytes: _tag_bytes,
+    list: _tag_list,
+    dict: _tag_dictionary,
+}
+
+# _TYPES_TO_TAGGERS plus the taggers resolved for subclasses, which are cleared on registration
+_TYPE_TAGGER_CACHE = dict(_TYPES_TO_TAGGERS)
+
+def _resolve_type_tagger(t):
+    for base in t.__mro__:
+        if base is not object and base in _TYPES_TO_TAGGERS:
+            tagger = _TYPES_TO_TAGGERS[base]
+            break
+
+    else:
+        numpy = sys.modules.get('numpy')
+
+        if numpy is not None and issubclass(t, numpy.ndarray):
+            tagger = _tag_numpy_array
+
+        elif object in _TYPES_TO_TAGGERS:
+            tagger = _TYPES_TO_TAGGERS[object]
+
+        else:
+            raise Exception('Unsupported type {}'.format(t))
+
+    _TYPE_TAGGER_CACHE[t] = tagger
+    return tagger
+
+def register_encoder(t, encoder):
+    # Objects of type t, or of its subclasses, are tagged as encoder(o) instead, which may return
+    # any object that can be tagged, including a TaggedObject. Registering object sets a fallback
+    # for every otherwise unsupported type.
+    _TYPES_TO_TAGGERS[t] = _make_encoder_tagger(encoder)
+    _TYPE_TAGGER_CACHE.clear()
+    _TYPE_TAGGER_CACHE.update(_TYPES_TO_TAGGERS)
+
+def _indexed_items(d, tagger):
+    # The entries of an indexed dictionary are written in order of their keys in both forms
+    return sorted(d.items(), key = lambda item: tagger(item[0]).value)
+
+def _integer_list_item_tag(items, tagger):
+    # Returns the narrowest integer tag the tagger allows for every item, which both forms write
+    # every item of a list of integers with. Every integer between the smallest and largest items
+    # fits in the wider of their tags, so only those two are tagged, after min() and max() find
+    # them without a Python loop. Items of other types, such as those tagged by encoders, which
+    # needn't preserve order, and items which are already tagged and keep their tags, are all
+    # tagged, so a list with any takes the widest of its items' tags. Integer tags are numbered in
+    # order of width.
+    if type(items[0]) is int:
+        try:
+            return max(tagger(min(items)).tag, tagger(max(items)).tag)
+        except TypeError:
+            pass
+
+    return max(tagger(i).tag for i in items)
+
+def _autotag_shallow(o, preferred_integer_tag, preferred_string_tag):
+    # Tags o like autotag(), but leaves the contents of lists and dictionaries untagged, so that
+    # serializers can tag each item as they write it instead of copying the whole tree first.
+    tagger = _TYPE_TAGGER_CACHE.get(type(o))
+
+    if tagger is None:
+        tagger = _resolve_type_tagger(type(o))
+
+    return tagger(o, preferred_integer_tag, preferred_string_tag)
+
+def _default_tagger(o):
+    return _autotag_shallow(o, DEFAULT_INTEGER_ENCODING, DEFAULT_STRING_ENCODING)
+
+def _pop_tagger(kwargs, function_name):
+    # Pops the autotag() options out of kwargs and returns a function which shallowly tags objects
+    # with them
     preferred_integer_tag = kwargs.pop('preferred_integer_tag', DEFAULT_INTEGER_ENCODING)
     preferred_string_tag = kwargs.pop('preferred_string_tag', DEFAULT_STRING_ENCODING)
 
     if kwargs:
-        raise TypeError("autotag() got an unexpected keyword argument '{}'".format(
+        raise TypeError("{} got an unexpected keyword argument '{}'".format(
+            function_name,
             list(kwargs.keys())[0],
         ))
 
-    if isinstance(o, TaggedObject):
-        return o
+    def tagger(o):
+        type_tagger = _TYPE_TAGGER_CACHE.get(type(o))
 
-    if o is None:
-        return _NONE
+        if type_tagger is None:
+            type_tagger = _resolve_type_tagger(type(o))
 
-    if o is True:
-        return _TRUE
+        return type_tagger(o, preferred_integer_tag, preferred_string_tag)
 
-    if o is False:
-        return _FALSE
+    return tagger
 
-    if isinstance(o, int):
-        if preferred_integer_tag is not SMALLEST and _TAGS_TO_IN_RANGE_PREDICATES[preferred_integer_tag](o):
-            return TaggedObject(tag = preferred_integer_tag, value = o)
-
-        else:
-            for tag, in_range_predicate in _TAGS_TO_IN_RANGE_PREDICATES.items():
-                if in_range_predicate(o):
-                    return TaggedObject(tag = tag, value = o)
-
-            raise TooWideError("Integer {} is too wide to be serialized")
+def autotag(o, **kwargs):
+    tagger = _pop_tagger(kwargs, 'autotag()')
+    return _autotag_deep(tagger, o)
 
-    if isinstance(o, str):
-        # TODO Support SMALLEST for preferred string tag
-        return TaggedObject(tag = preferred_string_tag, value = o)
+def _autotag_deep(tagger, o):
+    tagged = tagger(o)
 
-    if isinstance(o, bytes):
-        return TaggedObject(tag = BINARY, value = o)
+    if tagged is o:
+        return tagged
 
-    if isinstance(o, list):
-        return TaggedObject(
-            tag = LIST,
-            value = [
-                autotag(
-                    i,
-                    preferred_integer_tag = preferred_integer_tag,
-                    preferred_string_tag = preferred_string_tag,
-                ) for i in o
-            ],
-        )
+    if tagged.tag == LIST and isinstance(tagged.value, list):
+        return TaggedObject(tag = LIST, value = [_autotag_deep(tagger, i) for i in tagged.value])
 
-    if isinstance(o, dict):
+    if tagged.tag == DICTIONARY and isinstance(tagged.value, dict):
         return TaggedObject(
             tag = DICTIONARY,
             value = collections.OrderedDict([
-                (
-                    autotag(
-                        key,
-                        preferred_integer_tag = preferred_integer_tag,
-                        preferred_string_tag = preferred_string_tag,
-                    ),
-                    autotag(
-                        value,
-                        preferred_integer_tag = preferred_integer_tag,
-                        preferred_string_tag = preferred_string_tag,
-                    ),
-                ) for key, value in o.items()
+                (_autotag_deep(tagger, key), _autotag_deep(tagger, value))
+                for key, value in tagged.value.items()
             ]),
         )
 
-    raise Exception('Unsupported type {}'.format(type(o)))
+    return tagged
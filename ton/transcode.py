@@ -0,0 +1,360 @@
+import io
+
+from ton import binary, string, tags
+
+# Transcoders walk one form and write the other as they go, with an explicit stack like the
+# decoders, so no Python objects are built for containers and every tag is kept exactly. The string
+# form has no spelling for indexed dictionaries, so rather than turn them into plain dictionaries,
+# transcoding binary to string raises on them. string.serialize(binary.deserialize(b)) writes them
+# as plain dictionaries, in key order.
+#
+# Dumps write to their stream in chunks of about binary._DUMP_BUFFER_SIZE, so besides the source
+# they hold one frame per open container. Dumping binary to a stream which can't be backpatched
+# also holds a header per container from its sizing pass.
+
+class _TextWriter(object):
+    def __init__(self, fp):
+        self._fp = fp
+        self._chunks = []
+        self._size = 0
+
+    def write(self, chunk):
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+
+    def flush_if_full(self):
+        if self._size >= binary._DUMP_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        self._fp.write(''.join(self._chunks))
+        self._chunks = []
+        self._size = 0
+
+def _write_integers(source, offset, item_tag, byte_length, item_length, writer):
+    binary._check_integer_list_length(offset, item_tag, byte_length, item_length)
+    width = binary._FIXED_WIDTHS[item_tag]
+    item_format = '{}i' + str(8 * width)
+    writer.write('[')
+
+    for start in range(0, item_length, binary._INTEGER_CHUNK_LENGTH):
+        count = min(binary._INTEGER_CHUNK_LENGTH, item_length - start)
+        values = binary._unpack_integers(
+            source,
+            offset + start * width,
+            item_tag,
+            count * width,
+            count,
+        )
+
+        if start > 0:
+            writer.write(', ')
+
+        writer.write(', '.join(map(item_format.format, values)))
+        writer.flush_if_full()
+
+    writer.write(']')
+
+# Tags of the compact binary format which are written as other tags in the string form
+_STRING_FORM_TAGS = {
+    tags.SHORT_UTF8: tags.UTF8,
+}
+
+def _write_binary_as_string(source, writer):
+    # Returns the offset just past the document at the start of source. Each frame on the stack is
+    # [end, item tag, item length, items written, end wrap], with an item tag of None for
+    # dictionaries. Keys from a key table are written out in full, and compact containers and
+    # strings like their standard counterparts, so the string form is the same for every binary
+    # form of a document.
+    stack = []
+    offset = 0
+    keys = []
+
+    if source[0] == tags.KEY_TABLE:
+        tagged_keys, offset = binary._parse_key_table(source, 1)
+        keys = [
+            string._STRING_SERIALIZERS[_STRING_FORM_TAGS.get(key_tag, key_tag)](key)
+            for key_tag, key in tagged_keys
+        ]
+
+    tag = source[offset]
+    offset += 1
+
+    while True:
+        writer.flush_if_full()
+
+        if tag == tags.INDEXED_DICTIONARY:
+            raise Exception('Indexed dictionary at offset {} has no string form'.format(offset))
+
+        if tag in binary._CONTAINER_TAGS:
+            item_tag, byte_length, item_length, offset = binary._unpack_container_header(
+                source,
+                offset,
+                tag,
+            )
+
+            if item_tag is None:
+                writer.write('{ ')
+                stack.append([offset + byte_length, None, item_length, 0, ' }'])
+
+            elif item_tag in binary._INTEGER_FORMAT_CODES:
+                _write_integers(source, offset, item_tag, byte_length, item_length, writer)
+                offset += byte_length
+
+            else:
+                writer.write('[')
+                stack.append([offset + byte_length, item_tag, item_length, 0, ']'])
+
+        else:
+            value, offset = binary._TAGS_TO_LEAF_PARSERS[tag](source, offset)
+            writer.write(string._STRING_SERIALIZERS[_STRING_FORM_TAGS.get(tag, tag)](value))
+
+        # Move on to the next item, closing every container which has ended
+        while stack:
+            frame = stack[-1]
+            end, item_tag, item_length, count, end_wrap = frame
+
+            if count == item_length:
+                if offset != end:
+                    raise Exception('Container ending at offset {} does not match its header'.format(
+                        end,
+                    ))
+
+                writer.write(end_wrap)
+                stack.pop()
+                continue
+
+            if count > 0:
+                writer.write(', ')
+
+            frame[3] += 1
+
+            if item_tag is None:
+                key_tag = source[offset]
+
+                if key_tag in binary._KEY_REFERENCE_FORMATS:
+                    reference_format = binary._KEY_REFERENCE_FORMATS[key_tag]
+                    index = reference_format.unpack_from(source, offset + 1)[0]
+
+                    if index >= len(keys):
+                        raise Exception(
+                            'Key reference at offset {} is outside the key table'.format(offset),
+                        )
+
+                    offset += 1 + reference_format.size
+                    writer.write(keys[index])
+
+                else:
+                    # Untagged keys are legacy bare UTF-8, as in binary._key_parser()
+                    if key_tag in binary._KEY_STRING_TAGS:
+                        offset += 1
+                    else:
+                        key_tag = tags.UTF8
+
+                    key, offset = binary._TAGS_TO_LEAF_PARSERS[key_tag](source, offset)
+                    writer.write(
+                        string._STRING_SERIALIZERS[_STRING_FORM_TAGS.get(key_tag, key_tag)](key),
+                    )
+
+                writer.write(': ')
+                tag = source[offset]
+                offset += 1
+
+            else:
+                tag = item_tag
+
+            break
+
+        else:
+            return offset
+
+def dump_binary_as_string(b, fp):
+    # Writes the string form of the binary form b to the text stream fp. b may be any buffer,
+    # including an mmap of a file, in which case only the pages being transcoded are in memory.
+    source = binary._as_byte_view(b)
+    writer = _TextWriter(fp)
+    offset = _write_binary_as_string(source, writer)
+
+    if offset != len(source):
+        raise Exception('Unparsed trailing bytes: {}'.format(bytes(source[offset:offset + 32])))
+
+    writer.flush()
+
+def binary_to_string(b):
+    fp = io.StringIO()
+    dump_binary_as_string(b, fp)
+    return fp.getvalue()
+
+class _SizingWriter(object):
+    # Stands in for a binary._Writer on a first pass which only records the headers patched in
+    def __init__(self):
+        self.position = 0
+        self.headers = {}
+
+    def write(self, b):
+        self.position += len(b)
+
+    def flush_if_full(self):
+        pass
+
+    def patch(self, position, b):
+        self.headers[position] = b
+
+def _write_key(s, index, writer):
+    index = string._skip_whitespace(s, index)
+    parser = string._FIRST_CHARACTERS_TO_TAGGED_LEAF_PARSERS.get(s[index:index + 1])
+
+    if parser is None:
+        raise string._unable_to_parse(s, index)
+
+    tag, key, index = parser(s, index)
+
+    if tag not in tags.STRING_TAGS:
+        raise Exception('Dictionary key at index {} is not a string'.format(index))
+
+    writer.write(binary._TAG_BYTES[tag] + binary._BINARY_SERIALIZERS[tag](key))
+    index = string._skip_whitespace(s, index)
+
+    if not s.startswith(':', index):
+        raise string._unable_to_parse(s, index)
+
+    return index + 1
+
+def _start_item(frame, tag, writer, index):
+    # List items are untagged, and must all have the tag of the first
+    if frame is None:
+        writer.write(binary._TAG_BYTES[tag])
+        return
+
+    frame[3] += 1
+
+    if frame[0] == '}':
+        writer.write(binary._TAG_BYTES[tag])
+    elif frame[2] is None:
+        frame[2] = tag
+    elif frame[2] != tag:
+        raise Exception('List item at index {} is tagged {}, but earlier items are tagged {}'.format(
+            index,
+            tag,
+            frame[2],
+        ))
+
+def _end_container(frame, writer, headers):
+    end_wrap, position, item_tag, item_length = frame
+
+    if end_wrap == ']':
+        header_size = binary._LIST_HEADER.size
+        header = binary._LIST_HEADER.pack(
+            tags.VOID if item_tag is None else item_tag,
+            writer.position - position - header_size,
+            item_length,
+        )
+    else:
+        header_size = binary._DICTIONARY_HEADER.size
+        header = binary._DICTIONARY_HEADER.pack(
+            writer.position - position - header_size,
+            item_length,
+        )
+
+    if headers is None:
+        writer.patch(position, header)
+
+def _write_string_as_binary(s, writer, headers):
+    # Returns the index just past the object at the start of s. headers maps the position of each
+    # container header to its bytes, as recorded by a _SizingWriter. Without it, headers are
+    # written as placeholders and patched when their container ends. Each frame on the stack is
+    # [end wrap, header position, item tag, item length].
+    length = len(s)
+    stack = []
+    frame = None
+    index = 0
+
+    while True:
+        writer.flush_if_full()
+        index = string._skip_whitespace(s, index)
+        character = s[index] if index < length else ''
+        parser = string._FIRST_CHARACTERS_TO_TAGGED_LEAF_PARSERS.get(character)
+
+        if parser is not None:
+            tag, value, index = parser(s, index)
+            _start_item(frame, tag, writer, index)
+            writer.write(binary._BINARY_SERIALIZERS[tag](value))
+
+        elif character == '[' or character == '{':
+            if character == '[':
+                tag, end_wrap, header_size = tags.LIST, ']', binary._LIST_HEADER.size
+            else:
+                tag, end_wrap, header_size = tags.DICTIONARY, '}', binary._DICTIONARY_HEADER.size
+
+            _start_item(frame, tag, writer, index)
+            stack.append(frame)
+            frame = [end_wrap, writer.position, None, 0]
+            writer.write(bytes(header_size) if headers is None else headers[frame[1]])
+            index = string._skip_whitespace(s, index + 1)
+
+            if not s.startswith(end_wrap, index):
+                if end_wrap == '}':
+                    index = _write_key(s, index, writer)
+
+                continue
+
+            index += 1
+            _end_container(frame, writer, headers)
+            frame = stack.pop()
+
+        elif index == length:
+            raise Exception('Unexpected end of input')
+
+        else:
+            raise string._unable_to_parse(s, index)
+
+        # Close every container which ends after this item
+        while True:
+            if frame is None:
+                return index
+
+            index = string._skip_whitespace(s, index)
+
+            if s.startswith(frame[0], index):
+                index += 1
+                _end_container(frame, writer, headers)
+                frame = stack.pop()
+                continue
+
+            if not s.startswith(',', index):
+                raise string._unable_to_parse(s, index)
+
+            index = string._skip_whitespace(s, index + 1)
+
+            if s.startswith(frame[0], index):
+                raise Exception('Trailing comma before "{}"'.format(s[index:index + 32]))
+
+            if frame[0] == '}':
+                index = _write_key(s, index, writer)
+
+            break
+
+def _check_string_fully_written(s, index):
+    if string._skip_whitespace(s, index) != len(s):
+        raise Exception('Unparsed trailing characters: "{}"'.format(s[index:index + 32]))
+
+def dump_string_as_binary(s, fp):
+    # Writes the binary form of the string form s to the binary stream fp. As with binary.dump(),
+    # headers are backpatched on the streams binary._can_backpatch() allows, and otherwise a sizing
+    # pass computes them first.
+    if binary._can_backpatch(fp):
+        writer = binary._Writer(fp, fp.tell())
+        headers = None
+    else:
+        sizing_writer = _SizingWriter()
+        _check_string_fully_written(s, _write_string_as_binary(s, sizing_writer, None))
+        writer = binary._Writer(fp)
+        headers = sizing_writer.headers
+
+    _check_string_fully_written(s, _write_string_as_binary(s, writer, headers))
+    writer.flush()
+
+def string_to_binary(s):
+    writer = binary._Writer()
+    _check_string_fully_written(s, _write_string_as_binary(s, writer, None))
+    return bytes(writer.buffer)